@@ -104,7 +104,8 @@ function App() {
 
     useEffect(() => {
         if (authToken === null) {
-            self.location.href = '/virtual-turntable/auth/login';
+            // (forwarding any ?room=<turntable ID>)
+            self.location.href = `/virtual-turntable/auth/login${self.location.search}`;
         }
         else if (authToken !== undefined) {
             // get current user data
@@ -179,80 +180,99 @@ function App() {
             const message = JSON.parse(e.data);
             console.log('SERVER:', message);
 
-            if (message.command === 'TOKEN') {
-                fetchAuthToken();
+            if (message.command === 'snapshot') {
+                // initial state batch; unpack into individual state messages
+                for (const [command, value] of Object.entries(message.value ?? {})) {
+                    handleServerMessage({ command, value });
+                }
                 return;
             }
-            else if (message.command === 'REFRESH_HOST') {
-                refreshCurrentHostID();
-            }
-            else if (message.command === 'settings') {
-                isSettingsUpdateLocal.current = false; // origin from server; prevent re-broadcasts
-                setSettings(message.value);
-            }
-            else if (message.command === 'refreshPlaylist') {
-                setNeedToRefreshPlaylist(true);
-            }
+            handleServerMessage(message);
+        }
+        catch (err) {
+            console.error('Invalid message:', e.data);
+        }
+    }
 
-            if (isHostDeviceRef.current) {
-                // MAIN
-                const player = SpotifyPlayer.getExistingInstance();
+    function handleServerMessage(message: any) {
+        if (message.command === 'ping') {
+            // heartbeat; echo back to the server, to keep the connection alive
+            WebSocketManagerInstance.send(JSON.stringify({ command: 'pong', value: message.value }));
+            return;
+        }
+        else if (message.command === 'TOKEN') {
+            fetchAuthToken();
+            return;
+        }
+        else if (message.command === 'REFRESH_HOST') {
+            refreshCurrentHostID();
+        }
+        else if (message.command === 'settings') {
+            isSettingsUpdateLocal.current = false; // origin from server; prevent re-broadcasts
+            setSettings(message.value);
+        }
+        else if (message.command === 'refreshPlaylist') {
+            setNeedToRefreshPlaylist(true);
+        }
+        else if (message.command === 'throttled') {
+            console.warn(`Server throttled '${message.value?.command}'; retry in ${message.value?.retryAfter}s`);
+            return;
+        }
 
-                // server commands
-                if (message.command === 'playAlbum') {
-                    if (authToken !== undefined && authToken !== null) {
-                        SpotifyAPI.playAlbum(authToken, message.value);
-                        SpotifyAPI.setShuffle(authToken, false);
-                    }
-                }
-                else if (message.command === 'playTrack') {
-                    if (authToken !== undefined && authToken !== null) {
-                        SpotifyAPI.playTrack(authToken, message.value);
-                        SpotifyAPI.setShuffle(authToken, false);
-                    }
+        if (isHostDeviceRef.current) {
+            // MAIN
+            const player = SpotifyPlayer.getExistingInstance();
+
+            // server commands
+            if (message.command === 'playAlbum') {
+                if (authToken !== undefined && authToken !== null) {
+                    SpotifyAPI.playAlbum(authToken, message.value);
+                    SpotifyAPI.setShuffle(authToken, false);
                 }
-                else if (message.command === 'playPlaylist') {
-                    if (authToken !== undefined && authToken !== null) {
-                        SpotifyAPI.playPlaylist(authToken, message.value);
-                        SpotifyAPI.setShuffle(authToken, true);
-                    }
+            }
+            else if (message.command === 'playTrack') {
+                if (authToken !== undefined && authToken !== null) {
+                    SpotifyAPI.playTrack(authToken, message.value);
+                    SpotifyAPI.setShuffle(authToken, false);
                 }
-                else if (message.command === 'capture' || message.command === 'upload') {
-                    setNeedToFetchCapture(message.command);
+            }
+            else if (message.command === 'playPlaylist') {
+                if (authToken !== undefined && authToken !== null) {
+                    SpotifyAPI.playPlaylist(authToken, message.value);
+                    SpotifyAPI.setShuffle(authToken, true);
                 }
+            }
+            else if (message.command === 'capture' || message.command === 'upload') {
+                setNeedToFetchCapture(message.command);
+            }
 
-                // side controller commands
-                else if (player) {
-                    if (message.command === 'playState') {
-                        if (message.value === true) {
-                            player.play();
-                        }
-                        else {
-                            player.pause();
-                        }
-                    }
-                    else if (message.command === 'playPrevious') {
-                        player.previousTrack();
+            // side controller commands
+            else if (player) {
+                if (message.command === 'playState') {
+                    if (message.value === true) {
+                        player.play();
                     }
-                    else if (message.command === 'playNext') {
-                        player.nextTrack();
+                    else {
+                        player.pause();
                     }
                 }
-            }
-            else {
-                // SIDE
-                if (message.command === 'playState') {
-                    setIsPlaying(message.value);
+                else if (message.command === 'playPrevious') {
+                    player.previousTrack();
                 }
-                else if (message.command === 'currentTrack') {
-                    setCurrentTrack(message.value);
+                else if (message.command === 'playNext') {
+                    player.nextTrack();
                 }
             }
         }
-        catch (err) {
-            console.error('Invalid message:', e.data);
+        else {
+            // SIDE
+            if (message.command === 'playState') {
+                setIsPlaying(message.value);
+            }
+            else if (message.command === 'currentTrack') {
+                setCurrentTrack(message.value);
+            }
         }
-
     }
 
     async function handleUpload(input: File | string) {
@@ -320,7 +340,7 @@ function App() {
         return (
             <div>
                 <h1>
-                    <a href='/virtual-turntable/auth/login'>Login with Spotify</a>
+                    <a href={`/virtual-turntable/auth/login${window.location.search}`}>Login with Spotify</a>
                 </h1>
             </div>
         );
@@ -315,7 +315,7 @@ function RemoteController({
         return (
             <div>
                 <h1>
-                    <a href='/virtual-turntable/auth/login'>Login with Spotify</a>
+                    <a href={`/virtual-turntable/auth/login${window.location.search}`}>Login with Spotify</a>
                 </h1>
             </div>
         );
@@ -250,7 +250,7 @@ function VirtualTurntable({
                     array[i] = binary.charCodeAt(i);
                 }
 
-                const blob = new Blob([array], { type: 'image/png' });
+                const blob = new Blob([array], { type: result.imageType ?? 'image/png' });
                 const url = URL.createObjectURL(blob);
                 setCentreLabelSource(url);
 
@@ -690,7 +690,7 @@ function VirtualTurntable({
         return (
             <div>
                 <h1>
-                    <a href='/virtual-turntable/auth/login'>Login with Spotify</a>
+                    <a href={`/virtual-turntable/auth/login${window.location.search}`}>Login with Spotify</a>
                 </h1>
             </div>
         );
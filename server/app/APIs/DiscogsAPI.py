@@ -1,15 +1,17 @@
 """Discogs API handler."""
+from typing import Any
 from urllib.parse import urlencode
 
-import requests
+from app.APIs.httpClient import HTTPClient
 
 
 class DiscogsAPI:
     """Discogs API handler."""
 
-    def __init__(self, apiKey: str, apiSecret: str, version: str, contact: str) -> None:
+    def __init__(self, apiKey: str, apiSecret: str, version: str, contact: str, httpClient: HTTPClient) -> None:
         """Initialise the Discogs API handler."""
 
+        self.httpClient = httpClient
         self.API_KEY = apiKey
         self.API_SECRET = apiSecret
 
@@ -18,7 +20,7 @@ class DiscogsAPI:
             'User-Agent': f"Virtual Turntable/{version} ({contact})"
         }
 
-    def searchRelease(self, albumName: str, artistName: str | None, year: str | None, medium: str | None) -> dict[str, str] | None:
+    async def searchRelease(self, albumName: str, artistName: str | None, year: str | None, medium: str | None) -> dict[str, str] | None:
         """Get the top result for a given album."""
 
         params = {
@@ -35,27 +37,27 @@ class DiscogsAPI:
 
         url = f'https://api.discogs.com/database/search?{urlencode(params)}'
 
-        response = requests.get(url, headers=self.HEADERS, timeout=10)
+        response = await self.httpClient.get(url, headers=self.HEADERS)
 
         response.raise_for_status()
         data = response.json()
         if (not data['results']):
             if (artistName is not None or year is not None):
                 # re-search without artist or year
-                return self.searchRelease(albumName, None, None, None)
+                return await self.searchRelease(albumName, None, None, None)
             return None  # no results found
         return data['results'][0]  # Return the top result
 
-    def getDataForRelease(self, releaseID: str) -> list[dict[str, str | int]] | None:
-        """Get the images for a given release."""
+    async def getDataForRelease(self, releaseID: str) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+        """Get the images, and (vinyl) metadata, for a given release."""
 
         url = f'https://api.discogs.com/releases/{releaseID}'
 
-        response = requests.get(url, headers=self.HEADERS, timeout=10)
+        response = await self.httpClient.get(url, headers=self.HEADERS)
         response.raise_for_status()
         data = response.json()
 
-        metadata = {}
+        metadata: dict[str, Any] = {}
 
         formats = data['formats']
         for medium in formats:
@@ -72,13 +74,11 @@ class DiscogsAPI:
                     if ('rpm' in description.lower()):
                         metadata['rpm'] = int(description.split(' ')[0])
 
-        return data['images'], metadata
+        return data.get('images', []), metadata
 
-    def downloadImage(self, url: str, path: str) -> None:
-        """Download an image from the given URL to the given path."""
+    async def fetchImage(self, url: str) -> bytes:
+        """Fetch an image from the given URL (into memory)."""
 
-        response = requests.get(url, headers=self.HEADERS, timeout=10)
+        response = await self.httpClient.get(url, headers=self.HEADERS)
         response.raise_for_status()
-        if (response):
-            with open(path, 'wb') as file:
-                file.write(response.content)
+        return response.content
@@ -6,14 +6,18 @@ from typing import Any, Final
 from fastapi import Request
 from fastapi.responses import RedirectResponse
 
+from app.APIs.httpClient import HTTPClient
 from app.modules.sessionManager import SessionManager
 
 class IMusicAPI(ABC):
     """Interface for music authentication and playback APIs."""
 
-    def __init__(self, sessionManager: SessionManager, hostName: str, sendToClient: Any, clearCache: Any) -> None:
+    def __init__(
+        self, sessionManager: SessionManager, hostName: str, sendToClient: Any, clearCache: Any, httpClient: HTTPClient
+    ) -> None:
         """Initialise the Spotify authentication handler."""
         self.provider = None
+        self.httpClient = httpClient
         self.sendToClient = sendToClient
         self.clearCache = clearCache
 
@@ -39,41 +43,61 @@ class IMusicAPI(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    async def refreshToken(self, sessionID: str, expiration: int) -> None:
-        """Refresh the access token before it expires."""
+    async def refreshToken(self, sessionID: str) -> float | None:
+        """Refresh the access token of a session. Returns when it is next due (None, if the session has ended)."""
         raise NotImplementedError
 
     @abstractmethod
-    def setupPlaylist(self, sessionID: str, playlistName: str) -> None:
+    async def getClientToken(self) -> str:
+        """Get an access token for the application itself (not a user)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def summary(self) -> dict[str, Any]:
+        """Return the API statistics."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def resumeSessions(self) -> None:
+        """Resume refreshing the access tokens of sessions restored after a restart."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def setupPlaylist(self, sessionID: str, playlistName: str) -> None:
         """Fetch or create a playlist on the API and cache its ID."""
         raise NotImplementedError
 
     @abstractmethod
-    def getPlaylistByName(self, sessionID: str, playlistName: str) -> str | None:
+    async def getPlaylistByName(self, sessionID: str, playlistName: str) -> str | None:
         """Retrieve the playlist ID by its name."""
         raise NotImplementedError
 
     @abstractmethod
-    def createPlaylist(self, sessionID: str, playlistName: str) -> str:
+    async def createPlaylist(self, sessionID: str, playlistName: str) -> str:
         """Create a new playlist."""
         raise NotImplementedError
 
     @abstractmethod
-    def getUserID(self, sessionID: str) -> str:
+    async def getUserID(self, sessionID: str) -> str:
         """Retrieve the user ID."""
         raise NotImplementedError
 
     @abstractmethod
-    def addToPlaylist(self, albumID: str, playlistID: str, isAlbum: bool) -> None:
+    async def addToPlaylist(self, albumID: str, playlistID: str, isAlbum: bool) -> None:
         """Add an album to a playlist."""
         raise NotImplementedError
 
     @abstractmethod
-    def playPlaylist(self, playlistID: str) -> None:
+    async def playPlaylist(self, playlistID: str) -> None:
         """Start playback of the specified playlist."""
         raise NotImplementedError
 
     @abstractmethod
-    def searchForAlbum(self, query: str) -> dict[str, str] | None:
-        """Search for an album and return its ID."""
+    async def searchForAlbum(
+        self, album: dict[str, str], token: str | None = None, strict: bool = False
+    ) -> dict[str, str] | None:
+        """
+        Search for an album and return its ID (None, only if every search completed without a match).
+        If strict, any failed search is raised, rather than returning a (best effort) lower-priority match.
+        """
         raise NotImplementedError
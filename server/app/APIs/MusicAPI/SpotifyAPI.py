@@ -2,27 +2,50 @@
 
 import asyncio
 import os
+import time
 from typing import Any, Final
 from urllib.parse import urlencode
 
-import requests
+import httpx
 from fastapi import HTTPException, Request
 from fastapi.responses import RedirectResponse
 
+from app.APIs.httpClient import HTTPClient
 from app.APIs.MusicAPI.IMusicAPI import IMusicAPI
+from app.APIs.MusicAPI.playlistWriter import PlaylistWriter
+from app.enums.StateKeys import Commands
+from app.modules.refreshScheduler import RefreshScheduler
 from app.modules.sessionManager import SessionManager
+from app.modules.ttlCache import TTLCache, cacheKey
 from app.utils import generateRandomString
 
+REFRESH_MARGIN: Final = 60  # seconds before expiry, at which access tokens are refreshed
+
 
 class SpotifyAPI(IMusicAPI):
     """Handler class for Spotify authentication flow."""
 
-    def __init__(self, sessionManager: SessionManager, hostName: str, sendToClient: Any, clearCache: Any) -> None:
+    def __init__(
+        self,
+        sessionManager: SessionManager,
+        hostName: str,
+        sendToClient: Any,
+        clearCache: Any,
+        httpClient: HTTPClient,
+        albumCache: TTLCache | None = None,
+        tokenScheduler: RefreshScheduler | None = None,
+    ) -> None:
         """Initialise the Spotify authentication handler."""
-        super().__init__(sessionManager, hostName, sendToClient, clearCache)
+        super().__init__(sessionManager, hostName, sendToClient, clearCache, httpClient)
         self.provider = 'Spotify'
+        self.albumCache = albumCache  # manifest entry -> Spotify ID
+        self.albumTracks: dict[str, list[str]] = {}  # album ID -> track URIs
+        self.playlistWriter = PlaylistWriter(self.getPlaylistVersion, self.getPlaylistTracks, self.postPlaylistTracks)
         self.CLIENT_ID: Final = os.getenv('SPOTIFY_CLIENT_ID')
         self.CLIENT_SECRET: Final = os.getenv('SPOTIFY_CLIENT_SECRET')
+        # (shared by all rooms, when provided)
+        self.tokenScheduler = tokenScheduler if tokenScheduler is not None else RefreshScheduler()
+        self.sessionManager.addDeleteListener(self.cancelRefresh)
 
     async def login(self, isHost: bool) -> RedirectResponse:
         """Redirect the user to the Spotify login page."""
@@ -65,7 +88,7 @@ class SpotifyAPI(IMusicAPI):
         if (not AUTH_CODE):
             raise HTTPException(status_code=400, detail='Missing authorisation code.')
 
-        RESPONSE: Final = requests.post(
+        RESPONSE: Final = await self.httpClient.post(
             'https://accounts.spotify.com/api/token',
             data = {
                 'grant_type': 'authorization_code',
@@ -73,40 +96,39 @@ class SpotifyAPI(IMusicAPI):
                 'redirect_uri': self.REDIRECT_URI,
             },
             auth=(self.CLIENT_ID, self.CLIENT_SECRET),
-            timeout=10,
         )
 
         RESPONSE.raise_for_status()
         BODY: Final = RESPONSE.json()
 
         accessToken = BODY.get('access_token')
+        expiration = BODY.get('expires_in', 3600)
 
         # store tokens
         self.sessionManager.updateSession(sessionID, {
             'accessToken': accessToken,
             'refresh_token': BODY.get('refresh_token'),
+            'expiresAt': time.time() + expiration,
         })
         self.sessionManager.updateSession(sessionID, {
-            'userID': self.getUserID(sessionID),
+            'userID': await self.getUserID(sessionID),
         })
 
-        # start token refresh thread
-        expiration = BODY.get('expires_in', 3600)
-        asyncio.create_task(self.refreshToken(sessionID, expiration))
+        # schedule token refresh
+        self.scheduleRefresh(sessionID, time.time() + expiration - REFRESH_MARGIN)
 
         # handle setup, for host only
         if (self.sessionManager.getSession(sessionID)['isHost']):
             print('New host connected')
             # terminate existing host sessions
-            await self.sendToClient({ 'command': 'REFRESH_HOST' })
-            for (existingSessionID, session) in self.sessionManager.sessions.items():
-                if (session is not None):
-                    if (session.get('isHost') and sessionID != existingSessionID):
-                        self.sessionManager.deleteSession(existingSessionID)
+            await self.sendToClient({ 'command': Commands.REFRESH_HOST.value })
+            for existingSessionID in self.sessionManager.getHostSessionIDs():
+                if (sessionID != existingSessionID):
+                    self.sessionManager.deleteSession(existingSessionID)
             self.sessionManager.setHostPlaylistID(None)
             self.clearCache()
             # setup new host
-            self.setupPlaylist(sessionID, 'Virtual Turntable')
+            await self.setupPlaylist(sessionID, 'Virtual Turntable')
 
 
         # return to the main page
@@ -120,53 +142,109 @@ class SpotifyAPI(IMusicAPI):
         )
         return response
 
-    async def refreshToken(self, sessionID: str, expiration: int) -> None:
-        """Refresh the access token before it expires."""
-        while True:
-            # wait until ~1 minute before expiration
-            await asyncio.sleep(expiration - 60)
-
-            try:
-                RESPONSE = requests.post(
-                    'https://accounts.spotify.com/api/token',
-                    data={
-                        'grant_type': 'refresh_token',
-                        'refresh_token': self.sessionManager.getSession(sessionID)['refresh_token'],
-                    },
-                    headers={'Content-Type': 'application/x-www-form-urlencoded'},
-                    auth=(self.CLIENT_ID, self.CLIENT_SECRET),
-                    timeout=10,
-                )
-                RESPONSE.raise_for_status()
-                BODY = RESPONSE.json()
-
-                # update tokens
-                self.sessionManager.updateSession(sessionID, { 'accessToken': BODY.get('access_token') })
-                expiration = BODY.get('expires_in', 3600)
-                print('Spotify access token refreshed.')
-
-                # inform clients to retrieve the new token
-                await self.sendToClient({'command': 'TOKEN'})
-
-            except Exception as e:
-                print(f"Error refreshing Spotify token: {e}")
+    async def refreshToken(self, sessionID: str) -> float | None:
+        """Refresh the access token of a session. Returns when it is next due (None, if the session has ended)."""
+        SESSION: Final = self.sessionManager.getSession(sessionID)
+        if (not SESSION or not SESSION.get('refresh_token')):
+            return None
+
+        RESPONSE: Final = await self.httpClient.post(
+            'https://accounts.spotify.com/api/token',
+            data={
+                'grant_type': 'refresh_token',
+                'refresh_token': SESSION['refresh_token'],
+            },
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+            auth=(self.CLIENT_ID, self.CLIENT_SECRET),
+        )
+        if (RESPONSE.status_code == 400):
+            # refresh token revoked (invalid_grant); the user must log in again
+            print(f"Spotify refresh token rejected for session '{sessionID}'.")
+            return None
+        RESPONSE.raise_for_status()
+        BODY: Final = RESPONSE.json()
+
+        # update tokens (Spotify may also issue a new refresh token)
+        expiresAt = time.time() + float(BODY.get('expires_in', 3600))
+        self.sessionManager.updateSession(sessionID, {
+            'accessToken': BODY.get('access_token'),
+            'refresh_token': BODY.get('refresh_token', SESSION['refresh_token']),
+            'expiresAt': expiresAt,
+        })
+        print('Spotify access token refreshed.')
+
+        # inform clients to retrieve the new token
+        await self.sendToClient({'command': Commands.TOKEN.value})
+        return expiresAt - REFRESH_MARGIN
+
+    def scheduleRefresh(self, sessionID: str, dueAt: float) -> None:
+        """Schedule the refresh of a session's access token."""
+        self.tokenScheduler.schedule(
+            (self.sessionManager.roomID, sessionID), dueAt, lambda: self.refreshToken(sessionID)
+        )
+
+    def cancelRefresh(self, sessionID: str) -> None:
+        """Stop refreshing a session's access token."""
+        self.tokenScheduler.cancel((self.sessionManager.roomID, sessionID))
+
+    async def authorisedRequest(
+        self, method: str, url: str, sessionID: str | None = None, **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Make a request on behalf of a session (the host's, by default).
+        Should the access token be rejected (e.g. revoked, or expired early), it is refreshed and the request retried.
+        """
+        HEADERS: Final = kwargs.pop('headers', {})
+        for attempt in range(2):
+            token = (
+                self.sessionManager.getToken(sessionID) if sessionID is not None
+                else self.sessionManager.getHostToken()
+            )
+            response = await self.httpClient.request(
+                method, url, headers={**HEADERS, 'Authorization': f'Bearer {token}'}, **kwargs
+            )
+            if (response.status_code != 401 or attempt == 1):
+                break
+            refreshID = sessionID if sessionID is not None else self.sessionManager.getHostSessionID()
+            if (refreshID is None or not await self.tokenScheduler.refreshNow((self.sessionManager.roomID, refreshID))):
                 break
+        return response
 
-    def setupPlaylist(self, sessionID: str, playlistName: str) -> None:
+    async def getClientToken(self) -> str:
+        """Get an access token for the application itself (client credentials flow; no user data)."""
+        RESPONSE: Final = await self.httpClient.post(
+            'https://accounts.spotify.com/api/token',
+            data={'grant_type': 'client_credentials'},
+            auth=(self.CLIENT_ID, self.CLIENT_SECRET),
+        )
+        RESPONSE.raise_for_status()
+        return str(RESPONSE.json()['access_token'])
+
+    def summary(self) -> dict[str, Any]:
+        """Return the API statistics."""
+        return {
+            'playlistWriter': self.playlistWriter.summary(),
+        }
+
+    def resumeSessions(self) -> None:
+        """Resume refreshing the access tokens of sessions restored after a restart."""
+        for (sessionID, session) in self.sessionManager.sessions.items():
+            if (session.get('refresh_token') and self.sessionManager.getSession(sessionID)):
+                # (overdue tokens are refreshed immediately)
+                self.scheduleRefresh(sessionID, float(session.get('expiresAt', 0)) - REFRESH_MARGIN)
+
+    async def setupPlaylist(self, sessionID: str, playlistName: str) -> None:
         """Fetch/create playlist on Spotify, and cache ID."""
-        playlistID = self.getPlaylistByName(sessionID, playlistName)
+        playlistID = await self.getPlaylistByName(sessionID, playlistName)
         if (not playlistID):
-            playlistID = self.createPlaylist(sessionID, playlistName)
+            playlistID = await self.createPlaylist(sessionID, playlistName)
         self.sessionManager.setHostPlaylistID(playlistID)
 
-    def getPlaylistByName(self, sessionID: str, playlistName: str) -> str | None:
+    async def getPlaylistByName(self, sessionID: str, playlistName: str) -> str | None:
         """Get the Spotify playlist ID by name."""
-        HEADERS: Final = {
-            'Authorization': f'Bearer {self.sessionManager.getToken(sessionID)}',
-        }
         url = 'https://api.spotify.com/v1/me/playlists'
         while (url):
-            response = requests.get(url, headers=HEADERS, timeout=10)
+            response = await self.authorisedRequest('GET', url, sessionID)
             response.raise_for_status()
             body = response.json()
 
@@ -179,13 +257,8 @@ class SpotifyAPI(IMusicAPI):
 
         return None
 
-    def createPlaylist(self, sessionID: str, playlistName: str) -> str:
+    async def createPlaylist(self, sessionID: str, playlistName: str) -> str:
         """Create a new Spotify playlist."""
-        HEADERS: Final = {
-            'Authorization': f'Bearer {self.sessionManager.getToken(sessionID)}',
-            'Content-Type': 'application/json',
-        }
-
         # define
         url = 'https://api.spotify.com/v1/me/playlists'
         payload = {
@@ -195,75 +268,82 @@ class SpotifyAPI(IMusicAPI):
         }
 
         # create
-        response = requests.post(url, headers=HEADERS, json=payload, timeout=10)
+        response = await self.authorisedRequest('POST', url, sessionID, json=payload)
         response.raise_for_status()
         playlistData = response.json()
 
         # return ID
         return str(playlistData['id'])
 
-    def getUserID(self, sessionID: str) -> str:
+    async def getUserID(self, sessionID: str) -> str:
         """Get user."""
-        HEADERS: Final = {
-            'Authorization': f'Bearer {self.sessionManager.getToken(sessionID)}',
-            'Content-Type': 'application/json'
-        }
-
         # define
         url = 'https://api.spotify.com/v1/me'
 
         # create
-        response = requests.get(url, headers=HEADERS, timeout=10)
+        response = await self.authorisedRequest('GET', url, sessionID)
         response.raise_for_status()
         userData = response.json()
 
         # return ID
         return str(userData['id'])
 
-    def addToPlaylist(self, albumID: str, playlistID: str, isAlbum: bool = True) -> None:
-        """Add an album to a Spotify playlist."""
-        HEADERS: Final = {
-            'Authorization': f'Bearer {self.sessionManager.getHostToken()}',
-            'Content-Type': 'application/json',
-        }
-
+    async def addToPlaylist(self, albumID: str, playlistID: str, isAlbum: bool = True) -> None:
+        """Add an album (or track) to a Spotify playlist, skipping tracks already in it."""
         if (isAlbum):
-            # get tracks
-            albumUrl = f'https://api.spotify.com/v1/albums/{albumID}/tracks'
-            response = requests.get(albumUrl, headers=HEADERS, timeout=10)
-            response.raise_for_status()
-            tracks = response.json().get('items', [])
-
-            if (not tracks):
+            trackURIs = await self.getAlbumTrackURIs(albumID)
+            if (not trackURIs):
                 raise ValueError(f"No tracks found for album ID '{albumID}'")
-
-            # extract URIs
-            trackUris = [track['uri'] for track in tracks]
-
-            # add tracks in batches of 100 (Spotify API limitation)
-            addTracksUrl = f'https://api.spotify.com/v1/playlists/{playlistID}/tracks'
-            for i in range(0, len(trackUris), 100):
-                payload = {'uris': trackUris[i : i + 100]}
-                response = requests.post(
-                    addTracksUrl, headers=HEADERS, json=payload, timeout=10
-                )
-                response.raise_for_status()
         else:
-            # add single track
-            payload = {'uris': [f'spotify:track:{albumID}']}
-            response = requests.post(
-                f'https://api.spotify.com/v1/playlists/{playlistID}/tracks',
-                headers=HEADERS, json=payload, timeout=10
-            )
+            trackURIs = [f'spotify:track:{albumID}']
+
+        # (merged with any other scans awaiting the playlist)
+        await self.playlistWriter.add(playlistID, trackURIs)
+
+    async def getAlbumTrackURIs(self, albumID: str) -> list[str]:
+        """Get the URIs of all tracks on an album (following pagination)."""
+        if (albumID not in self.albumTracks):
+            trackURIs: list[str] = []
+            url = f'https://api.spotify.com/v1/albums/{albumID}/tracks?limit=50'
+            while (url):
+                response = await self.authorisedRequest('GET', url)
+                response.raise_for_status()
+                body = response.json()
+                trackURIs.extend(track['uri'] for track in body.get('items', []))
+                url = body.get('next')
+            self.albumTracks[albumID] = trackURIs
+        return self.albumTracks[albumID]
+
+    async def getPlaylistVersion(self, playlistID: str) -> str:
+        """Get the snapshot ID of a playlist (which changes whenever it is modified)."""
+        response = await self.authorisedRequest(
+            'GET', f'https://api.spotify.com/v1/playlists/{playlistID}?fields=snapshot_id'
+        )
+        response.raise_for_status()
+        return str(response.json()['snapshot_id'])
+
+    async def getPlaylistTracks(self, playlistID: str) -> list[str]:
+        """Get the URIs of all tracks in a playlist (following pagination)."""
+        trackURIs: list[str] = []
+        url = f'https://api.spotify.com/v1/playlists/{playlistID}/tracks?fields=items(track(uri)),next&limit=100'
+        while (url):
+            response = await self.authorisedRequest('GET', url)
             response.raise_for_status()
+            body = response.json()
+            trackURIs.extend(item['track']['uri'] for item in body.get('items', []) if item.get('track'))
+            url = body.get('next')
+        return trackURIs
 
-    def playPlaylist(self, playlistID: str) -> None:
-        """Start playback of the specified Spotify playlist."""
-        HEADERS: Final = {
-            'Authorization': f'Bearer {self.sessionManager.getHostToken()}',
-            'Content-Type': 'application/json',
-        }
+    async def postPlaylistTracks(self, playlistID: str, trackURIs: list[str]) -> str:
+        """Append tracks to a playlist. Returns its new snapshot ID."""
+        response = await self.authorisedRequest(
+            'POST', f'https://api.spotify.com/v1/playlists/{playlistID}/tracks', json={'uris': trackURIs}
+        )
+        response.raise_for_status()
+        return str(response.json()['snapshot_id'])
 
+    async def playPlaylist(self, playlistID: str) -> None:
+        """Start playback of the specified Spotify playlist."""
         # define
         url = 'https://api.spotify.com/v1/me/player/play'
         payload = {
@@ -271,41 +351,71 @@ class SpotifyAPI(IMusicAPI):
         }
 
         # request
-        response = requests.put(url, headers=HEADERS, json=payload, timeout=10)
+        response = await self.authorisedRequest('PUT', url, json=payload)
         if (response.status_code != 204):
             raise HTTPException(
                 status_code=response.status_code, detail=response.json()
             )
 
-    def searchForAlbum(self, album: dict[str, str]) -> dict[str, str] | None:
-        """TODO"""
-        AUTH_TOKEN: Final = self.sessionManager.getHostToken()
+    async def searchForAlbum(
+        self, album: dict[str, str], token: str | None = None, strict: bool = False
+    ) -> dict[str, str] | None:
+        """
+        Find the Spotify ID of an album (or track), from its manifest entry (searching as the host, by default).
+        If strict, any failed search is raised (e.g. so that a rate limit can be waited out), rather than returning
+        a best effort match.
+        """
+        KEY: Final = cacheKey(album)
+        if (self.albumCache is not None):
+            cached = self.albumCache.get(KEY)
+            if (isinstance(cached, dict)):
+                return cached
+
+        async def search(query: str, medium: str) -> dict[str, str] | None:
+            params = {
+                'q': query,
+                'type': medium,
+                'limit': 1,
+            }
+            url = f'https://api.spotify.com/v1/search/?{urlencode(params)}'
+            request = (
+                await self.httpClient.get(url, headers={'Authorization': f'Bearer {token}'}) if token
+                else await self.authorisedRequest('GET', url)
+            )
+
+            request.raise_for_status()
+            response = request.json()
+
+            if (len(response[f'{medium}s']['items']) > 0):
+                return {
+                    'medium': medium,
+                    'id': str(response[f'{medium}s']['items'][0]['id'])
+                }
+            return None
 
+        # search each query (as an album, and as a track) in order of priority, only broadening it after a miss
         for query in [
             f'{album["name"]} artist:{album["artist"]} year:{album["year"]}',
             f'{album["name"]} artist:{album["artist"]}',
             album["name"],
         ]:
-            for medium in ['album', 'track']:
-                params = {
-                    'q': query,
-                    'type': medium,
-                    'limit': 1,
-                }
-                request = requests.get(
-                    f'https://api.spotify.com/v1/search/?{urlencode(params)}',
-                    headers={
-                        'Authorization': f'Bearer {AUTH_TOKEN}',
-                    },
-                    timeout=10,
-                )
-
-                request.raise_for_status()
-                response = request.json()
-
-                if (len(response[f'{medium}s']['items']) > 0):
-                    return {
-                        'medium': medium,
-                        'id': str(response[f'{medium}s']['items'][0]['id'])
-                    }
-        return None
+            results = await asyncio.gather(
+                *(search(query, medium) for medium in ['album', 'track']), return_exceptions=True
+            )
+            errors = [result for result in results if isinstance(result, Exception)]
+            for error in errors:
+                print(f"Spotify search failed for '{query}': {error}")
+            for result in results:
+                if (isinstance(result, Exception)):
+                    break  # (a higher-priority search failed, so any later match may not be the best)
+                if (isinstance(result, dict)):
+                    if (self.albumCache is not None):
+                        self.albumCache.set(KEY, result)
+                    return result
+            # (after a failed search, the query is not broadened: its result may not be the best match)
+            if (errors):
+                fallback = next((result for result in results if isinstance(result, dict)), None)
+                if (fallback is not None and not strict):
+                    return fallback  # (best effort, so not cached)
+                raise errors[0]
+        return None  # (every search completed, without a match)
@@ -0,0 +1,103 @@
+"""Coalescing, deduplicating writer of tracks to playlists."""
+import asyncio
+from typing import Any, Awaitable, Callable, Final
+
+BATCH_SIZE: Final = 100  # tracks per request (Spotify API limitation)
+
+
+class PlaylistWriter:
+    """
+    Coalescing, deduplicating writer of tracks to playlists.
+    Tracks already in the playlist are skipped, using a cached snapshot of its contents (refetched only when the
+    playlist's version changes). Adds made whilst a write is in flight are merged into the next write.
+    """
+
+    def __init__(
+        self,
+        getVersion: Callable[[str], Awaitable[str]],
+        getTracks: Callable[[str], Awaitable[list[str]]],
+        addTracks: Callable[[str, list[str]], Awaitable[str]],
+    ) -> None:
+        """Initialise the writer, with the provider's playlist operations (each returning the playlist version)."""
+        self.getVersion = getVersion
+        self.getTracks = getTracks
+        self.addTracks = addTracks
+
+        self.snapshots: dict[str, tuple[str, set[str]]] = {}  # playlist ID -> (version, track URIs)
+        self.pending: dict[str, list[tuple[list[str], asyncio.Future[int]]]] = {}
+        self.writers: dict[str, asyncio.Task[None]] = {}
+
+        # statistics
+        self.requested = 0
+        self.duplicates = 0
+        self.added = 0
+        self.writes = 0
+
+    async def add(self, playlistID: str, trackURIs: list[str]) -> int:
+        """Add tracks to the playlist (skipping those already present). Returns the number added."""
+        future: asyncio.Future[int] = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(playlistID, []).append((trackURIs, future))
+        if (playlistID not in self.writers):
+            self.writers[playlistID] = asyncio.create_task(self.write(playlistID))
+        return await future
+
+    async def write(self, playlistID: str) -> None:
+        """Write the pending tracks of a playlist, until none remain."""
+        try:
+            while (self.pending.get(playlistID)):
+                batch = self.pending.pop(playlistID)
+                try:
+                    added = await self.writeBatch(playlistID, batch)
+                except Exception as e:
+                    self.snapshots.pop(playlistID, None)
+                    for (_, future) in batch:
+                        if (not future.done()):
+                            future.set_exception(e)
+                    continue
+                for (trackURIs, future) in batch:
+                    if (not future.done()):
+                        future.set_result(len(added.intersection(trackURIs)))
+        finally:
+            del self.writers[playlistID]
+
+    async def writeBatch(self, playlistID: str, batch: list[tuple[list[str], Any]]) -> set[str]:
+        """Add the new tracks of the merged batch, in as few requests as possible. Returns the tracks added."""
+        (version, existing) = await self.getSnapshot(playlistID)
+
+        newURIs: list[str] = []  # (in order)
+        merged: set[str] = set()
+        for (trackURIs, _) in batch:
+            for uri in trackURIs:
+                self.requested += 1
+                if (uri in existing or uri in merged):
+                    self.duplicates += 1
+                else:
+                    newURIs.append(uri)
+                    merged.add(uri)
+
+        for i in range(0, len(newURIs), BATCH_SIZE):
+            version = await self.addTracks(playlistID, newURIs[i : i + BATCH_SIZE])
+            existing.update(newURIs[i : i + BATCH_SIZE])
+            self.snapshots[playlistID] = (version, existing)
+            self.writes += 1
+        self.added += len(newURIs)
+        return merged
+
+    async def getSnapshot(self, playlistID: str) -> tuple[str, set[str]]:
+        """Return the cached contents of the playlist, refetching them if it has been modified elsewhere."""
+        version = await self.getVersion(playlistID)
+        snapshot = self.snapshots.get(playlistID)
+        if (snapshot is None or snapshot[0] != version):
+            snapshot = (version, set(await self.getTracks(playlistID)))
+            self.snapshots[playlistID] = snapshot
+        return snapshot
+
+    def summary(self) -> dict[str, Any]:
+        """Return the writer statistics."""
+        return {
+            'requested': self.requested,
+            'duplicates': self.duplicates,
+            'added': self.added,
+            'writes': self.writes,
+            'cachedPlaylists': len(self.snapshots),
+        }
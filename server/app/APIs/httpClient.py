@@ -0,0 +1,194 @@
+"""Shared asynchronous HTTP client, for the external APIs."""
+import asyncio
+import importlib.util
+import random
+import time
+from typing import Any, Final
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.modules.rateLimiter import TokenBucket
+
+HTTP2: Final = importlib.util.find_spec('h2') is not None  # (HTTP/2 requires the optional h2 package)
+
+# host -> (burst, requests per second); Discogs allows 60 authenticated requests per (moving) minute
+RATE_LIMITS: Final[dict[str, tuple[float, float]]] = {
+    'api.discogs.com': (5, 55 / 60),
+}
+RETRIES: Final = 3  # for rate-limited (429), and failed idempotent, requests
+BACKOFF: Final = 0.5  # seconds; the upper bound of the (jittered) first retry delay, doubled on each retry
+MAX_RETRY_AFTER: Final = 30  # seconds; longer waits demanded by a host are not retried, but returned to the caller
+RETRY_STATUSES: Final = {502, 503, 504}
+
+
+class HTTPClient:
+    """
+    Shared asynchronous HTTP client, for the external APIs.
+    Connections are pooled (and kept alive) across requests, and requests to each host are limited in concurrency,
+    so a slow API cannot exhaust the pool.
+    Requests to each host are also limited in rate (token bucket), paused whilst the host demands (Retry-After),
+    and retried with jittered backoff. Identical concurrent GETs share a single upstream request.
+    """
+
+    def __init__(
+        self,
+        maxConnections: int = 32,
+        maxKeepAlive: int = 16,
+        hostLimit: int = 8,
+        hostLimits: dict[str, int] | None = None,
+        timeout: float = 10,
+        connectTimeout: float = 5,
+        transport: httpx.AsyncBaseTransport | None = None,
+        rateLimits: dict[str, tuple[float, float]] | None = None,
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+    ) -> None:
+        """Initialise the client (connections are opened on demand)."""
+        self.HOST_LIMIT: Final = hostLimit
+        self.HOST_LIMITS: Final = hostLimits or {}
+        self.RETRIES: Final = retries
+        self.BACKOFF: Final = backoff
+
+        self.client = httpx.AsyncClient(
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=maxConnections, max_keepalive_connections=maxKeepAlive, keepalive_expiry=60
+            ),
+            timeout=httpx.Timeout(timeout, connect=connectTimeout),
+            transport=transport,
+        )
+        self.semaphores: dict[str, asyncio.Semaphore] = {}
+        self.buckets: dict[str, TokenBucket] = {
+            host: TokenBucket(capacity, rate) for (host, (capacity, rate)) in (rateLimits or RATE_LIMITS).items()
+        }
+        self.blockedUntil: dict[str, float] = {}  # host -> monotonic time, demanded by Retry-After
+        self.inFlight: dict[tuple[str, str], asyncio.Task[httpx.Response]] = {}  # (coalesced GETs)
+
+        # statistics, per host
+        self.stats: dict[str, dict[str, float]] = {}
+
+    def getSemaphore(self, host: str) -> asyncio.Semaphore:
+        """Return the semaphore limiting concurrent requests to the host."""
+        if (host not in self.semaphores):
+            self.semaphores[host] = asyncio.Semaphore(self.HOST_LIMITS.get(host, self.HOST_LIMIT))
+        return self.semaphores[host]
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request (waiting, if the host's concurrency or rate limit has been reached)."""
+        host = urlsplit(url).hostname or ''
+        stats = self.stats.setdefault(host, {
+            'requests': 0, 'errors': 0, 'inFlight': 0, 'totalTime': 0.0,
+            'throttled': 0, 'rateLimited': 0, 'retries': 0, 'coalesced': 0,
+        })
+        if (method != 'GET'):
+            return await self.send(host, method, url, **kwargs)
+
+        # (identical GETs share the response of the one in flight)
+        key = (url, repr(sorted(kwargs.items())))
+        task = self.inFlight.get(key)
+        if (task is None):
+            task = asyncio.create_task(self.send(host, method, url, **kwargs))
+            self.inFlight[key] = task
+            task.add_done_callback(lambda _: self.inFlight.pop(key, None))
+        else:
+            stats['coalesced'] += 1
+        # (shielded, so one caller's cancellation does not fail the others)
+        return await asyncio.shield(task)
+
+    async def send(self, host: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a request upstream, retrying rate-limited (and failed idempotent) requests."""
+        stats = self.stats[host]
+        for attempt in range(self.RETRIES + 1):
+            isLast = (attempt == self.RETRIES)
+            await self.throttle(host)
+            async with self.getSemaphore(host):
+                stats['inFlight'] += 1
+                startTime = time.perf_counter()
+                try:
+                    response: httpx.Response | None = await self.client.request(method, url, **kwargs)
+                except httpx.HTTPError as e:
+                    stats['errors'] += 1
+                    if (not isinstance(e, httpx.TransportError) or method != 'GET' or isLast):
+                        raise
+                    response = None
+                finally:
+                    stats['inFlight'] -= 1
+                    stats['requests'] += 1
+                    stats['totalTime'] += time.perf_counter() - startTime
+
+            if (response is not None and response.status_code == 429):
+                # rate limited (so not processed; safe to retry, whatever the method)
+                stats['rateLimited'] += 1
+                retryAfter = parseRetryAfter(response.headers.get('Retry-After'))
+                if (isLast or (retryAfter is not None and retryAfter > MAX_RETRY_AFTER)):
+                    return response
+                # (all requests to the host wait, not only this one)
+                delay = (retryAfter if retryAfter is not None else self.BACKOFF * 2 ** attempt)
+                delay += random.uniform(0, self.BACKOFF)
+                self.blockedUntil[host] = max(self.blockedUntil.get(host, 0), time.monotonic() + delay)
+            elif (response is not None and (method != 'GET' or response.status_code not in RETRY_STATUSES or isLast)):
+                return response
+            else:
+                # transient failure of an idempotent request
+                await asyncio.sleep(random.uniform(0, self.BACKOFF * 2 ** attempt))
+            stats['retries'] += 1
+        raise AssertionError('Unreachable: the last attempt always returns or raises.')
+
+    async def throttle(self, host: str) -> None:
+        """Wait until the host may be sent another request."""
+        throttled = False
+        while True:
+            delay = self.blockedUntil.get(host, 0) - time.monotonic()
+            bucket = self.buckets.get(host)
+            if (delay <= 0 and (bucket is None or bucket.tryConsume())):
+                break
+            if (delay <= 0 and bucket is not None):
+                delay = bucket.retryAfter()
+            throttled = True
+            await asyncio.sleep(delay)
+        if (throttled):
+            self.stats[host]['throttled'] += 1
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a GET request."""
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a POST request."""
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a PUT request."""
+        return await self.request('PUT', url, **kwargs)
+
+    async def close(self) -> None:
+        """Close all pooled connections."""
+        await self.client.aclose()
+
+    def summary(self) -> dict[str, Any]:
+        """Return the client statistics."""
+        return {
+            'http2': HTTP2,
+            'hosts': {
+                host: {
+                    'requests': int(stats['requests']),
+                    'errors': int(stats['errors']),
+                    'inFlight': int(stats['inFlight']),
+                    'meanMs': round(stats['totalTime'] / stats['requests'] * 1000, 2) if stats['requests'] else 0,
+                    'throttled': int(stats['throttled']),
+                    'rateLimited': int(stats['rateLimited']),
+                    'retries': int(stats['retries']),
+                    'coalesced': int(stats['coalesced']),
+                }
+                for (host, stats) in self.stats.items()
+            },
+        }
+
+
+def parseRetryAfter(value: str | None) -> float | None:
+    """Parse a Retry-After header, in seconds (None, if absent or an HTTP date, which the APIs do not send)."""
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
@@ -3,13 +3,19 @@ from enum import Enum
 
 
 class StateKeys(Enum):
-    """Keys for the state object in the state system."""
+    """
+    Keys for the state object in the state system.
+    NOTE: binary websocket opcodes are derived from member order; only ever append new members.
+    """
     PLAY_STATE = 'playState'
     CURRENT_TRACK = 'currentTrack'
     SETTINGS = 'settings'
 
 class Commands(Enum):
-    """Commands that can be sent to and from the server."""
+    """
+    Commands that can be sent to and from the server.
+    NOTE: binary websocket opcodes are derived from member order; only ever append new members.
+    """
     PLAY_NEXT = 'playNext'
     PLAY_PREVIOUS = 'playPrevious'
     PLAY_ALBUM = 'playAlbum'
@@ -20,3 +26,10 @@ class Commands(Enum):
     SEEK = 'seek'
     REFRESH_PLAYLIST = 'refreshPlaylist'
     GET_UPLOAD = 'upload'
+    SNAPSHOT = 'snapshot'
+    REFRESH_HOST = 'REFRESH_HOST'
+    TOKEN = 'TOKEN'
+    CAPTURE = 'capture'
+    THROTTLED = 'throttled'
+    PING = 'ping'
+    PONG = 'pong'
@@ -2,7 +2,8 @@
 
 import asyncio
 import os
-from typing import Any, Final
+import time
+from typing import Any, Awaitable, Callable, Final
 
 import cv2
 from dotenv import load_dotenv
@@ -11,18 +12,28 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.enums.StateKeys import Commands, StateKeys
+from app.modules.backgroundTasks import BackgroundTasks
 from app.modules.centreLabelHandler import CentreLabelHandler
+from app.modules.labelCache import LabelCache
 from app.modules.modelHandler import ModelHandler
+from app.modules.refreshScheduler import RefreshScheduler
 from app.APIs.MusicAPI.IMusicAPI import IMusicAPI
 from app.APIs.MusicAPI.SpotifyAPI import SpotifyAPI
 from app.modules.Hardware.piController import PiController
-from app.modules.sessionManager import SessionManager
-from app.utils import isHostIP
-from app.modules.websocketHandler import WebsocketHandler
+from app.modules.room import DEFAULT_ROOM, Room
+from app.modules.sessionManager import SessionContext, SessionManager
+from app.modules.ttlCache import TTLCache
+from app.modules.StateBus.IStateBus import IStateBus
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.StateBus.persistentStateBus import PersistentStateBus
+from app.modules.StateBus.sqliteStateBus import SQLiteStateBus
+from app.utils import isHostIP, localIPCache
+from app.modules.messageSchema import ClientMessage
+from app.modules.metrics import TimingStats
 from app.routes import setupRoutes
 from app.APIs.DiscogsAPI import DiscogsAPI
+from app.APIs.httpClient import HTTPClient
 from modelling.models.utils.ModelType import ModelType
-from app.modules.stateManager import StateManager
 
 
 class Server:
@@ -46,6 +57,17 @@ class Server:
         GPIO_ACCESS: Final = os.getenv('GPIO_ACCESS')
 
         HOSTNAME: Final = os.getenv('HOSTNAME', 'localhost')
+
+        # websocket liveness (seconds)
+        HEARTBEAT_INTERVAL: Final = float(os.getenv('HEARTBEAT_INTERVAL', '15'))
+        HEARTBEAT_TIMEOUT: Final = float(os.getenv('HEARTBEAT_TIMEOUT', '45'))
+        # state shared between server workers ('persistent' or 'local' (in-memory) for a single worker, or 'sqlite')
+        STATE_BUS: Final = os.getenv('STATE_BUS', 'persistent')
+        # turntables hosted by this server (the hardware belongs to the default room)
+        ROOMS: Final = [DEFAULT_ROOM, *(
+            roomID.strip() for roomID in os.getenv('ROOMS', '').split(',')
+            if roomID.strip() and roomID.strip() != DEFAULT_ROOM
+        )]
         MUSIC_PROVIDER = 'Spotify'
 
         origins = ['*']
@@ -57,14 +79,57 @@ class Server:
             allow_headers=['*'],
         )
 
+        # setup filestructure
+        if (not os.path.exists(os.path.join(self.ROOT_DIR, 'data'))):
+            os.makedirs(os.path.join(self.ROOT_DIR, 'data'))
+
         # setup modules
-        self.sessionManager = SessionManager()
-        self.websocketHandler = WebsocketHandler(self.getState, self.handleCommand)
+        if (STATE_BUS == 'sqlite'):
+            self.stateBus: IStateBus = SQLiteStateBus(
+                os.getenv('STATE_BUS_PATH', os.path.join(self.ROOT_DIR, 'data', 'stateBus.sqlite3'))
+            )
+        elif (STATE_BUS == 'persistent'):
+            self.stateBus = PersistentStateBus(
+                os.getenv('STATE_BUS_PATH', os.path.join(self.ROOT_DIR, 'data', 'state.sqlite3'))
+            )
+        elif (STATE_BUS == 'local'):
+            self.stateBus = LocalStateBus()
+        else:
+            raise NotImplementedError('Specified state bus not supported.')
+        self.localIPTask: asyncio.Task[None] | None = None
+
+        self.commandHandlers: dict[str, Callable[[Room, SessionContext, ClientMessage], Awaitable[None]]] = {
+            # state modifications
+            StateKeys.PLAY_STATE.value: self.handleStateCommand,
+            StateKeys.CURRENT_TRACK.value: self.handleStateCommand,
+            StateKeys.SETTINGS.value: self.handleSettingsCommand,
+            # remote-to-host commands
+            Commands.PLAY_NEXT.value: self.relayCommand,
+            Commands.PLAY_PREVIOUS.value: self.relayCommand,
+            Commands.GET_UPLOAD.value: self.relayCommand,
+            Commands.PLAY_ALBUM.value: self.relayValueCommand,
+            Commands.PLAY_TRACK.value: self.relayValueCommand,
+            Commands.PLAY_PLAYLIST.value: self.relayValueCommand,
+        }
+        self.commandTimings = TimingStats()
+        # (per stage of a scan, from image to play command)
+        self.scanTimings = TimingStats()
+        # (work deferred until after the response, e.g. playlist insertion)
+        self.backgroundTasks = BackgroundTasks()
+
+        # (pooled connections, shared by all rooms and APIs)
+        self.httpClient = HTTPClient()
+        # (resolved music provider IDs, shared by all rooms)
+        self.albumCache = TTLCache(self.stateBus, f'albumIDs/{MUSIC_PROVIDER}', ttl=30 * 24 * 3600)
+        # (a single task refreshes the access tokens of every session, in all rooms)
+        self.tokenScheduler = RefreshScheduler()
 
         if (MUSIC_PROVIDER == 'Spotify'):
-            self.musicAPI: IMusicAPI = SpotifyAPI(
-                self.sessionManager, HOSTNAME, self.websocketHandler.broadcast, self.resetState
-            )
+            def createMusicAPI(sessionManager: SessionManager, sendToClient: Any, clearCache: Any) -> IMusicAPI:
+                return SpotifyAPI(
+                    sessionManager, HOSTNAME, sendToClient, clearCache,
+                    self.httpClient, self.albumCache, self.tokenScheduler,
+                )
         else:
             raise NotImplementedError('Specified music provider not supported.')
 
@@ -73,29 +138,46 @@ class Server:
             os.path.join(self.ROOT_DIR, '..', 'modelling', 'models', 'models'),
         )
         self.discogsAPI = DiscogsAPI(
-            DISCOGS_API_KEY, DISCOGS_API_SECRET, APP_VERSION, APP_CONTACT
+            DISCOGS_API_KEY, DISCOGS_API_SECRET, APP_VERSION, APP_CONTACT, self.httpClient
+        )
+        # (Discogs release data, so that requests for cached labels need no network calls)
+        self.releaseCache = TTLCache(self.stateBus, 'discogsReleases', ttl=7 * 24 * 3600)
+        # (centre label images, evicted least recently used once over budget)
+        self.labelCache = LabelCache(
+            os.path.join(self.ROOT_DIR, 'data', 'centreLabels'),
+            int(float(os.getenv('LABEL_CACHE_MB', '64')) * 2**20),
         )
         self.centreLabelhandler = CentreLabelHandler(
-            os.path.join(self.ROOT_DIR, 'data'), self.discogsAPI
+            os.path.join(self.ROOT_DIR, 'data'), self.discogsAPI, self.releaseCache, self.labelCache
         )
-        if (GPIO_ACCESS is None or GPIO_ACCESS != 'off'):
+        # (only one server worker may own the hardware)
+        if ((GPIO_ACCESS is None or GPIO_ACCESS != 'off') and self.stateBus.claim('hardware')):
             self.hardwareController = PiController(self.handleMotorStall)
             print('Hardware controller configured.')
         else:
             self.hardwareController = None
 
-        self.stateManager = StateManager(
-            self.websocketHandler,
-            self.hardwareController,
-            self.musicAPI.getProviderName(),
-        )
+        # (each room is lightweight; the model, caches and clients above are shared)
+        self.rooms: dict[str, Room] = {
+            roomID: Room(
+                roomID,
+                self.stateBus,
+                self.handleCommand,
+                createMusicAPI,
+                self.hardwareController if roomID == DEFAULT_ROOM else None,
+                heartbeatInterval=HEARTBEAT_INTERVAL,
+                heartbeatTimeout=HEARTBEAT_TIMEOUT,
+            )
+            for roomID in ROOMS
+        }
+        self.hardwareRoom = self.rooms[DEFAULT_ROOM]
 
         # setup hardware listeners
         if (self.hardwareController is not None):
             asyncio.create_task(
                 self.hardwareController.reactToHinge(
-                    onClosed=lambda: self.stateManager.updateState(StateKeys.PLAY_STATE, False),
-                    onOpen=lambda: self.stateManager.updateState(StateKeys.PLAY_STATE, True),
+                    onClosed=lambda: self.hardwareRoom.stateManager.updateState(StateKeys.PLAY_STATE, False),
+                    onOpen=lambda: self.hardwareRoom.stateManager.updateState(StateKeys.PLAY_STATE, True),
                 )
             )
 
@@ -113,46 +195,42 @@ class Server:
                 )
             )
 
-        # setup filestructure
-        if (not os.path.exists(os.path.join(self.ROOT_DIR, 'data'))):
-            os.makedirs(os.path.join(self.ROOT_DIR, 'data'))
-
         # load model
         self.modelHandler.loadModel(ModelType.OUROBOROS, 'Ouroboros-large.pth')
 
         # configure endpoints
         self.setupRoutes()
+        self.app.add_event_handler('startup', self.startup)
         self.app.add_event_handler('shutdown', self.shutdown)
 
     def get(self) -> FastAPI:
         """Return the FastAPI application singleton."""
         return self.app
 
+    def getRoom(self, roomID: str | None) -> Room:
+        """Return the room (the default room, if unspecified)."""
+        room = self.rooms.get(roomID or DEFAULT_ROOM)
+        if (room is None):
+            raise HTTPException(status_code=404, detail='Room not found.')
+        return room
+
     def getState(self) -> dict[str, bool | dict[str, bool | int]]:
-        """Return the current state of the application."""
-        state = self.stateManager.getState()
+        """Return the current state of the hardware's room."""
+        state = self.hardwareRoom.stateManager.getState()
         if (isinstance(state, dict)):
             return state
         else:
             raise TypeError('State is not of expected type')
 
-    def resetState(self) -> None:
-        """Reset the state of the application."""
-        self.stateManager.resetState()
+    async def handleCommand(self, session: SessionContext, message: ClientMessage) -> None:
+        """Authorise a client's command, and dispatch it to its handler."""
+        handler = self.commandHandlers.get(message.command)
+        if (handler is None):
+            return
+        room = self.getRoom(session.roomID)
 
-    async def handleCommand(
-        self, sessionID: str, command: str, value: Any = None
-    ) -> None:
-        """TODO"""
-        currentUserID = self.sessionManager.getSession(sessionID).get('userID')
-        requestIsFromHost = self.sessionManager.getSession(sessionID).get('isHost', False)
-        requestIsFromHostUser = (
-            # ensure this user is the host (either from host or remote device)
-            # hence, check userID, not sessionID
-            currentUserID == self.sessionManager.getHostUserID()
-        )
-        settings = self.stateManager.getState().get('settings')
-        if (settings and not requestIsFromHost):
+        settings = room.stateManager.getState().get('settings')
+        if (settings and not session.isHost):
             if (not isinstance(settings, dict)):
                 print('Settings are not a dictionary.')
                 # since settings cannot be fetched, assume strictest settings
@@ -163,66 +241,79 @@ class Server:
             if (not settings.get('enableRemote', False)):
                 print('Remote calls disabled. Call ignored.')
                 return
-            if (settings.get('enforceSignature', True) and not requestIsFromHostUser):
-                print(sessionID, 'is not host. Call ignored.')
+            if (
+                settings.get('enforceSignature', True)
+                # ensure this user is the host (either from host or remote device)
+                # hence, check userID, not sessionID
+                and session.userID != room.sessionManager.getHostUserID()
+            ):
+                print(session.sessionID, 'is not host. Call ignored.')
                 return
 
-        # state modifications
-        for key in [StateKeys.PLAY_STATE, StateKeys.CURRENT_TRACK]:
-            if (command == key.value):
-                await self.stateManager.updateState(key, value)
-                return
+        startTime = time.perf_counter()
+        try:
+            await handler(room, session, message)
+        finally:
+            self.commandTimings.record(message.command, time.perf_counter() - startTime)
 
-        if (command == StateKeys.SETTINGS.value):
-            if (not requestIsFromHost):
+    async def handleStateCommand(self, room: Room, _session: SessionContext, message: ClientMessage) -> None:
+        """Apply a state modification."""
+        async with room.lock:
+            await room.stateManager.updateState(StateKeys(message.command), message.value)
+
+    async def handleSettingsCommand(self, room: Room, session: SessionContext, message: ClientMessage) -> None:
+        """Apply a settings modification."""
+        if (not isinstance(message.value, dict)):
+            return
+        async with room.lock:
+            if (not session.isHost):
                 # only allow host to control sensitive settings
+                settings = room.stateManager.getState().get('settings')
                 for setting in ['enableMotor', 'enableRemote', 'enforceSignature']:
                     if (not isinstance(settings, dict)):
                         # since settings cannot be fetched, protect sensitive settings
                         return
-                    if (settings.get(setting) != value.get(setting)):
-                        print(sessionID, 'is not host')
+                    if (settings.get(setting) != message.value.get(setting)):
+                        print(session.sessionID, 'is not host')
                         return
                 # settings such as volume, are allowed
-            await self.stateManager.updateState(StateKeys.SETTINGS, value)
-            return
+            await room.stateManager.updateState(StateKeys.SETTINGS, message.value)
 
-        # remote-to-host commands
-        for key in [Commands.PLAY_NEXT, Commands.PLAY_PREVIOUS, Commands.GET_UPLOAD]:
-            if (command == key.value):
-                await self.websocketHandler.sendToHost({'command': command})
-                return
+    async def relayCommand(self, room: Room, _session: SessionContext, message: ClientMessage) -> None:
+        """Relay a remote-to-host command."""
+        await room.websocketHandler.sendToHost({'command': message.command})
 
-        for key in [Commands.PLAY_ALBUM, Commands.PLAY_TRACK, Commands.PLAY_PLAYLIST]:
-            if (command == key.value):
-                await self.websocketHandler.sendToHost({'command': command, 'value': value})
-                return
+    async def relayValueCommand(self, room: Room, _session: SessionContext, message: ClientMessage) -> None:
+        """Relay a remote-to-host command, along with its value."""
+        await room.websocketHandler.sendToHost({'command': message.command, 'value': message.value})
 
     async def togglePlayState(self) -> None:
         """TODO"""
-        currentPlayState = self.getState().get(StateKeys.PLAY_STATE.value)
-        await self.stateManager.updateState(StateKeys.PLAY_STATE, not currentPlayState)
+        async with self.hardwareRoom.lock:
+            currentPlayState = self.getState().get(StateKeys.PLAY_STATE.value)
+            await self.hardwareRoom.stateManager.updateState(StateKeys.PLAY_STATE, not currentPlayState)
 
     async def updateVolume(self, delta: float) -> None:
         """TODO"""
-        currentSettings = self.getState().get('settings')
-        if (isinstance(currentSettings, dict) and currentSettings):
-            currentVolume = currentSettings.get('volume', 50)
-            if (not isinstance(currentVolume, int)):
-                currentVolume = 50
-            newVolume = min(100, max(0, currentVolume + (delta * 5)))
-            newSettings = currentSettings.copy()
-            newSettings['volume'] = int(newVolume)
-            await self.stateManager.updateState(StateKeys.SETTINGS, newSettings)
+        async with self.hardwareRoom.lock:
+            currentSettings = self.getState().get('settings')
+            if (isinstance(currentSettings, dict) and currentSettings):
+                currentVolume = currentSettings.get('volume', 50)
+                if (not isinstance(currentVolume, int)):
+                    currentVolume = 50
+                newVolume = min(100, max(0, currentVolume + (delta * 5)))
+                newSettings = currentSettings.copy()
+                newSettings['volume'] = int(newVolume)
+                await self.hardwareRoom.stateManager.updateState(StateKeys.SETTINGS, newSettings)
 
     async def changeTrack(self, direction: float) -> None:
         """TODO"""
         if (direction > 0):
-            await self.websocketHandler.sendToHost(
+            await self.hardwareRoom.websocketHandler.sendToHost(
                 {'command': Commands.PLAY_NEXT.value}
             )
         elif (direction < 0):
-            await self.websocketHandler.sendToHost(
+            await self.hardwareRoom.websocketHandler.sendToHost(
                 {'command': Commands.PLAY_PREVIOUS.value}
             )
 
@@ -267,11 +358,11 @@ class Server:
 
             if (not sent):
                 # start rendering process in client, whilst model runs prediction
-                await self.websocketHandler.sendToHost({
-                    'command': 'capture'
+                await self.hardwareRoom.websocketHandler.sendToHost({
+                    'command': Commands.CAPTURE.value
                 })  # serve image to host client
 
-        await self.predictAndPlayAlbum('captures')  # run album prediction, and serve to host
+        await self.predictAndPlayAlbum(self.hardwareRoom, 'captures')  # run album prediction, and serve to host
 
     async def handleMotorStall(self) -> None:
         """TODO"""
@@ -283,8 +374,17 @@ class Server:
         ):
             await self.togglePlayState()
 
-    async def predictAndPlayAlbum(self, fileName: str) -> JSONResponse:
-        """TODO"""
+    async def predictAndPlayAlbum(self, room: Room, fileName: str) -> JSONResponse:
+        """Detect the album, and play it on the host (adding it to the playlist in the background)."""
+        startTime = time.perf_counter()
+        stageTime = startTime
+
+        def recordStage(stage: str) -> None:
+            nonlocal stageTime
+            now = time.perf_counter()
+            self.scanTimings.record(stage, now - stageTime)
+            stageTime = now
+
         # DETECT ALBUM
         SCAN_RESULT: Final = self.modelHandler.scan(
             os.path.join(self.ROOT_DIR, 'data', fileName)
@@ -311,30 +411,44 @@ class Server:
         # if (result['predictedProb'] < 0.5):
         #     raise HTTPException(status_code=400, detail='No album (sufficiently) detected.')
         ALBUM: Final = self.modelHandler.classes[result['predictedClass']]
+        recordStage('inference')
 
-        # FIND VENDOR'S ID
-        RESULT_DATA: Final = self.musicAPI.searchForAlbum(ALBUM)
+        # FIND VENDOR'S ID (precomputed, else search)
+        RESULT_DATA: Final = (
+            self.modelHandler.getProviderID(room.musicAPI.getProviderName(), result['predictedClass'])
+            or await room.musicAPI.searchForAlbum(ALBUM)
+        )
         if (RESULT_DATA is None):
             raise HTTPException(
-                status_code=404, detail=f'Album not found on {self.musicAPI.getProviderName()}.'
+                status_code=404, detail=f'Album not found on {room.musicAPI.getProviderName()}.'
             )
         print(RESULT_DATA)
+        recordStage('resolve')
 
         isAlbum = (RESULT_DATA['medium'] == 'album')
         COMMAND: Final = Commands.PLAY_ALBUM if isAlbum else Commands.PLAY_TRACK
 
-        # ADD TO PLAYLIST
-        self.musicAPI.addToPlaylist(RESULT_DATA['id'], self.sessionManager.getHostPlaylistID(), isAlbum=isAlbum)
-        await self.websocketHandler.broadcast({
-            'command': Commands.REFRESH_PLAYLIST.value,
-            'value': self.sessionManager.getHostPlaylistID(),
-        })
-
-        # SEND TO CLIENT
-        await self.websocketHandler.sendToHost({
+        # SEND TO CLIENT (as soon as the ID is known)
+        await room.websocketHandler.sendToHost({
             'command': COMMAND.value,
             'value': RESULT_DATA['id'],
         })
+        recordStage('play')
+        self.scanTimings.record('scanToPlay', time.perf_counter() - startTime)
+
+        # ADD TO PLAYLIST (in the background, whilst the album starts playing)
+        PLAYLIST_ID: Final = room.sessionManager.getHostPlaylistID()
+
+        async def syncPlaylist() -> None:
+            syncStart = time.perf_counter()
+            await room.musicAPI.addToPlaylist(RESULT_DATA['id'], PLAYLIST_ID, isAlbum=isAlbum)
+            await room.websocketHandler.broadcast({
+                'command': Commands.REFRESH_PLAYLIST.value,
+                'value': PLAYLIST_ID,
+            })
+            self.scanTimings.record('playlist', time.perf_counter() - syncStart)
+
+        self.backgroundTasks.run('playlistSync', syncPlaylist)
 
         return JSONResponse(content={'album': RESULT_DATA})
 
@@ -343,9 +457,26 @@ class Server:
         """Setup the FastAPI routes."""
         setupRoutes(self)
 
+    async def startup(self) -> None:
+        """Start background tasks, and resume any sessions restored from the state bus."""
+        await self.stateBus.start()
+        self.localIPTask = asyncio.create_task(localIPCache.refreshPeriodically())
+        self.tokenScheduler.start()
+        # (a single worker refreshes the restored tokens)
+        if (self.stateBus.claim('tokenRefresh')):
+            for room in self.rooms.values():
+                room.musicAPI.resumeSessions()
+
     async def shutdown(self) -> None:
         """Ensure all background tasks are cancelled when stopping."""
-        await asyncio.gather()
+        if (self.localIPTask is not None):
+            self.localIPTask.cancel()
+            await asyncio.gather(self.localIPTask, return_exceptions=True)
+        await self.backgroundTasks.close()
+        self.centreLabelhandler.close()
+        await self.tokenScheduler.stop()
+        await self.stateBus.stop()
+        await self.httpClient.close()
 
 
 serverInstance = Server()
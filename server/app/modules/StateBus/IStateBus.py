@@ -0,0 +1,62 @@
+"""Interface for state shared between server workers."""
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable
+
+Subscriber = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class IStateBus(ABC):
+    """
+    Interface for state shared between server workers.
+    Provides a namespaced key-value store (JSON-serialisable values), and pub/sub messaging between workers.
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Any:
+        """Return the stored value (None if not set)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        """Store a value."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove a stored value."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def items(self, namespace: str) -> dict[str, Any]:
+        """Return a copy of all values stored in the namespace."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, name: str) -> bool:
+        """Claim exclusive ownership of a named resource (e.g. the hardware), for the lifetime of this worker."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def publish(self, channel: str, message: dict[str, Any]) -> None:
+        """Publish a message to the subscribers of all other workers."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def subscribe(self, channel: str, callback: Subscriber) -> None:
+        """Register a callback for messages published to the channel by other workers."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def start(self) -> None:
+        """Start receiving messages."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def stop(self) -> None:
+        """Stop receiving messages, and release any resources."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def summary(self) -> dict[str, Any]:
+        """Return the bus statistics."""
+        raise NotImplementedError
@@ -0,0 +1,60 @@
+"""In-process state bus, for a single server worker."""
+from typing import Any
+
+from app.modules.StateBus.IStateBus import IStateBus, Subscriber
+
+
+class LocalStateBus(IStateBus):
+    """
+    In-process state bus, for a single server worker (the default).
+    As there are no other workers, published messages have no recipients.
+    """
+
+    def __init__(self) -> None:
+        """Initialise the state bus."""
+        self.store: dict[str, dict[str, Any]] = {}
+        self.subscribers: dict[str, list[Subscriber]] = {}
+        self.published = 0
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Return the stored value (None if not set)."""
+        return self.store.get(namespace, {}).get(key)
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        """Store a value."""
+        self.store.setdefault(namespace, {})[key] = value
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove a stored value."""
+        self.store.get(namespace, {}).pop(key, None)
+
+    def items(self, namespace: str) -> dict[str, Any]:
+        """Return a copy of all values stored in the namespace."""
+        return dict(self.store.get(namespace, {}))
+
+    def claim(self, name: str) -> bool:
+        """Claim exclusive ownership of a named resource (always granted, to the only worker)."""
+        return True
+
+    def publish(self, channel: str, message: dict[str, Any]) -> None:
+        """Publish a message to the subscribers of all other workers (of which there are none)."""
+        self.published += 1
+
+    def subscribe(self, channel: str, callback: Subscriber) -> None:
+        """Register a callback for messages published to the channel by other workers."""
+        self.subscribers.setdefault(channel, []).append(callback)
+
+    async def start(self) -> None:
+        """Start receiving messages."""
+        return
+
+    async def stop(self) -> None:
+        """Stop receiving messages."""
+        return
+
+    def summary(self) -> dict[str, Any]:
+        """Return the bus statistics."""
+        return {
+            'backend': 'local',
+            'published': self.published,
+        }
@@ -0,0 +1,143 @@
+"""In-process state bus, persisted to disk, for a single server worker."""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Final
+
+from app.modules.StateBus.localStateBus import LocalStateBus
+
+DELETED: Final = object()  # marks a pending deletion
+
+
+class PersistentStateBus(LocalStateBus):
+    """
+    In-process state bus, persisted to a SQLite database, for a single server worker.
+    Reads and writes are served from memory; changed values are written behind, in a single batched transaction
+    every flush interval, so requests never wait on the disk. The store is reloaded when the server restarts.
+    A crash loses (at most) the changes of the last flush interval.
+    """
+
+    def __init__(self, path: str, flushInterval: float = 0.5) -> None:
+        """Open (or create) the database, and load the stored values."""
+        super().__init__()
+        self.FLUSH_INTERVAL: Final = flushInterval
+
+        startTime = time.perf_counter()
+        self.connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS store (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        for (namespace, key, value) in self.connection.execute('SELECT namespace, key, value FROM store'):
+            self.store.setdefault(namespace, {})[key] = json.loads(value)
+        self.loadTime = time.perf_counter() - startTime
+
+        self.pending: dict[tuple[str, str], Any] = {}  # changes not yet written (the latest value of each key)
+        self.flushTask: asyncio.Task[None] | None = None
+        self.writeLock = threading.Lock()  # (a cancelled flush may still be writing)
+
+        # statistics
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self.lastFlushTime = 0.0
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        """Store a value."""
+        super().set(namespace, key, value)
+        self.pending[(namespace, key)] = value
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove a stored value."""
+        super().delete(namespace, key)
+        self.pending[(namespace, key)] = DELETED
+
+    def write(self, changes: dict[tuple[str, str], Any]) -> list[tuple[str, str]]:
+        """
+        Write a batch of changes to the database, in a single transaction.
+        Returns the keys of any values that cannot be encoded, which are skipped.
+        """
+        startTime = time.perf_counter()
+        rows: list[tuple[str, str, str]] = []
+        unencodable: list[tuple[str, str]] = []
+        for ((namespace, key), value) in changes.items():
+            if (value is DELETED):
+                continue
+            try:
+                rows.append((namespace, key, json.dumps(value, separators=(',', ':'))))
+            except (TypeError, ValueError):
+                unencodable.append((namespace, key))
+
+        with self.writeLock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO store (namespace, key, value) VALUES (?, ?, ?)', rows)
+            self.connection.executemany(
+                'DELETE FROM store WHERE namespace = ? AND key = ?',
+                [(namespace, key) for ((namespace, key), value) in changes.items() if value is DELETED],
+            )
+        self.flushes += 1
+        self.written += len(changes) - len(unencodable)
+        self.lastFlushTime = time.perf_counter() - startTime
+        return unencodable
+
+    async def flush(self) -> None:
+        """Write any pending changes (off the event loop). If the write fails, they are kept pending, to be retried."""
+        if (not self.pending):
+            return
+        (changes, self.pending) = (self.pending, {})
+        try:
+            unencodable = await asyncio.to_thread(self.write, changes)
+        except sqlite3.Error as e:
+            self.failures += 1
+            # (re-queued, unless changed again since)
+            for (change, value) in changes.items():
+                self.pending.setdefault(change, value)
+            print(f'Error persisting state (will retry): {e}')
+            return
+        for (namespace, key) in unencodable:
+            self.failures += 1
+            print(f'Error persisting state: {namespace}/{key} is not JSON-serialisable')
+
+    async def flushPeriodically(self) -> None:
+        """Write pending changes every flush interval, until cancelled."""
+        while (True):
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            await self.flush()
+
+    async def start(self) -> None:
+        """Start writing changes to the database."""
+        if (self.flushTask is None):
+            self.flushTask = asyncio.create_task(self.flushPeriodically())
+
+    async def stop(self) -> None:
+        """Stop the background writer, write any remaining changes, and close the database."""
+        if (self.flushTask is not None):
+            self.flushTask.cancel()
+            try:
+                await self.flushTask
+            except asyncio.CancelledError:
+                pass
+            self.flushTask = None
+        await self.flush()
+        with self.writeLock:
+            self.connection.close()
+
+    def summary(self) -> dict[str, Any]:
+        """Return the bus statistics."""
+        return {
+            **super().summary(),
+            'backend': 'persistent',
+            'loadMs': round(self.loadTime * 1000, 2),
+            'pending': len(self.pending),
+            'flushes': self.flushes,
+            'written': self.written,
+            'failures': self.failures,
+            'lastFlushMs': round(self.lastFlushTime * 1000, 2),
+        }
@@ -0,0 +1,64 @@
+"""View of a state bus, restricted to a single scope."""
+from typing import Any
+
+from app.modules.StateBus.IStateBus import IStateBus, Subscriber
+
+
+class ScopedStateBus(IStateBus):
+    """
+    View of a state bus, restricted to a single scope (e.g. a room).
+    Namespaces, channels and resource names are prefixed, so scopes cannot see each other's values or messages.
+    The underlying bus is started and stopped by its owner.
+    """
+
+    def __init__(self, stateBus: IStateBus, scope: str) -> None:
+        """Initialise the scoped view."""
+        self.stateBus = stateBus
+        self.scope = scope
+
+    def scoped(self, name: str) -> str:
+        """Return the name, prefixed by the scope."""
+        return f'{self.scope}/{name}'
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Return the stored value (None if not set)."""
+        return self.stateBus.get(self.scoped(namespace), key)
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        """Store a value."""
+        self.stateBus.set(self.scoped(namespace), key, value)
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove a stored value."""
+        self.stateBus.delete(self.scoped(namespace), key)
+
+    def items(self, namespace: str) -> dict[str, Any]:
+        """Return a copy of all values stored in the namespace."""
+        return self.stateBus.items(self.scoped(namespace))
+
+    def claim(self, name: str) -> bool:
+        """Claim exclusive ownership of a named resource."""
+        return self.stateBus.claim(self.scoped(name))
+
+    def publish(self, channel: str, message: dict[str, Any]) -> None:
+        """Publish a message to the subscribers of all other workers."""
+        self.stateBus.publish(self.scoped(channel), message)
+
+    def subscribe(self, channel: str, callback: Subscriber) -> None:
+        """Register a callback for messages published to the channel by other workers."""
+        self.stateBus.subscribe(self.scoped(channel), callback)
+
+    async def start(self) -> None:
+        """Start receiving messages (handled by the underlying bus)."""
+        return
+
+    async def stop(self) -> None:
+        """Stop receiving messages (handled by the underlying bus)."""
+        return
+
+    def summary(self) -> dict[str, Any]:
+        """Return the bus statistics."""
+        return {
+            'scope': self.scope,
+            **self.stateBus.summary(),
+        }
@@ -0,0 +1,273 @@
+"""SQLite-backed state bus, shared by server workers on the same machine."""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Final, NamedTuple
+
+from app.modules.StateBus.IStateBus import IStateBus, Subscriber
+
+
+class SQLiteStateBus(IStateBus):
+    """
+    SQLite-backed state bus, shared by server workers on the same machine.
+    Values are stored as JSON; published messages are appended to a log table, which each worker polls.
+    Polling is cheap whilst idle, as the log is only queried once another worker has committed a change.
+
+    Writes (and publishes) are queued, and committed in batches by a thread, so that waiting for another worker's
+    lock never blocks the event loop; until committed, they are read back from the queue. (Reads do not wait, with
+    write-ahead logging.) Other workers see a change once it is committed, typically within a millisecond.
+    """
+
+    def __init__(self, path: str, pollInterval: float = 0.01, retention: float = 60) -> None:
+        """Open (or create) the shared database."""
+        self.POLL_INTERVAL: Final = pollInterval
+        self.RETENTION: Final = retention  # seconds that published messages are kept
+        self.origin: Final = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'  # this worker
+
+        self.connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS store (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                origin TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS owners (
+                name TEXT PRIMARY KEY,
+                origin TEXT NOT NULL,
+                pid INTEGER NOT NULL
+            );
+        ''')
+
+        # only messages published from now on are delivered
+        self.lastID: int = self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0]
+        self.dataVersion: int = self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+        # (a separate connection, used only by the writing thread)
+        self.writer = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.writer.execute('PRAGMA synchronous=NORMAL')
+        self.writes: list[Write] = []  # queued, in order
+        self.pending: dict[tuple[str, str], str | None] = {}  # (namespace, key) -> queued JSON (None, if deleted)
+        self.writeLock = asyncio.Lock()
+        self.writeTask: asyncio.Task[None] | None = None
+
+        self.subscribers: dict[str, list[Subscriber]] = {}
+        self.pollTask: asyncio.Task[None] | None = None
+
+        # statistics
+        self.published = 0
+        self.received = 0
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Return the stored value (None if not set)."""
+        if ((namespace, key) in self.pending):
+            value = self.pending[(namespace, key)]
+            return json.loads(value) if value is not None else None
+        row = self.connection.execute(
+            'SELECT value FROM store WHERE namespace = ? AND key = ?', (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        """Store a value."""
+        encoded = json.dumps(value, separators=(',', ':'))
+        self.pending[(namespace, key)] = encoded
+        self.queue(Write(
+            'INSERT OR REPLACE INTO store (namespace, key, value) VALUES (?, ?, ?)',
+            (namespace, key, encoded), (namespace, key), encoded,
+        ))
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove a stored value."""
+        self.pending[(namespace, key)] = None
+        self.queue(Write(
+            'DELETE FROM store WHERE namespace = ? AND key = ?', (namespace, key), (namespace, key), None
+        ))
+
+    def items(self, namespace: str) -> dict[str, Any]:
+        """Return a copy of all values stored in the namespace."""
+        rows = self.connection.execute('SELECT key, value FROM store WHERE namespace = ?', (namespace,))
+        values = {key: json.loads(value) for (key, value) in rows}
+        for ((pendingNamespace, key), value) in list(self.pending.items()):
+            if (pendingNamespace != namespace):
+                continue
+            if (value is None):
+                values.pop(key, None)
+            else:
+                values[key] = json.loads(value)
+        return values
+
+    def claim(self, name: str) -> bool:
+        """Claim exclusive ownership of a named resource, unless it is held by another live worker."""
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute('SELECT origin, pid FROM owners WHERE name = ?', (name,)).fetchone()
+            if (row is not None and row[0] != self.origin and isAlive(row[1])):
+                return False
+            self.connection.execute(
+                'INSERT OR REPLACE INTO owners (name, origin, pid) VALUES (?, ?, ?)', (name, self.origin, os.getpid())
+            )
+            return True
+        finally:
+            self.connection.execute('COMMIT')
+
+    def publish(self, channel: str, message: dict[str, Any]) -> None:
+        """Publish a message to the subscribers of all other workers."""
+        self.queue(Write(
+            'INSERT INTO messages (channel, origin, payload, created) VALUES (?, ?, ?, ?)',
+            (channel, self.origin, json.dumps(message, separators=(',', ':')), time.time()),
+        ))
+        self.published += 1
+        if (self.published % 256 == 0):
+            self.prune()
+
+    def prune(self) -> None:
+        """Delete published messages older than the retention period."""
+        self.queue(Write('DELETE FROM messages WHERE created < ?', (time.time() - self.RETENTION,)))
+
+    def queue(self, write: 'Write') -> None:
+        """Queue a write, to be committed (off the event loop) as soon as possible."""
+        self.writes.append(write)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # (no event loop to block, e.g. whilst the server is being constructed)
+            (batch, self.writes) = (self.writes, [])
+            self.commit(batch)
+            self.settle(batch)
+            return
+        if (self.writeTask is None or self.writeTask.done()):
+            self.writeTask = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Commit the queued writes (in a thread). Failed writes are kept queued, to be retried."""
+        async with self.writeLock:
+            while (self.writes):
+                batch = self.writes
+                self.writes = []
+                try:
+                    await asyncio.to_thread(self.commit, batch)
+                except sqlite3.Error as e:
+                    print(f'State bus write error (will retry): {e}')
+                    self.writes = batch + self.writes
+                    return
+                self.settle(batch)
+
+    def commit(self, batch: list['Write']) -> None:
+        """Write a batch of changes, in a single transaction."""
+        self.writer.execute('BEGIN IMMEDIATE')
+        try:
+            for write in batch:
+                self.writer.execute(write.statement, write.parameters)
+            self.writer.execute('COMMIT')
+        except BaseException:
+            self.writer.execute('ROLLBACK')
+            raise
+
+    def settle(self, batch: list['Write']) -> None:
+        """Read committed values from the database, unless changed again since."""
+        for write in batch:
+            if (write.key is not None and write.key in self.pending and self.pending[write.key] is write.value):
+                del self.pending[write.key]
+
+    def subscribe(self, channel: str, callback: Subscriber) -> None:
+        """Register a callback for messages published to the channel by other workers."""
+        self.subscribers.setdefault(channel, []).append(callback)
+
+    async def receive(self) -> int:
+        """Deliver any messages published by other workers since the last call. Returns the number delivered."""
+        version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+        if (version == self.dataVersion):
+            return 0  # no other worker has written since
+        self.dataVersion = version
+
+        rows = self.connection.execute(
+            'SELECT id, channel, origin, payload FROM messages WHERE id > ? ORDER BY id', (self.lastID,)
+        ).fetchall()
+        delivered = 0
+        for (messageID, channel, origin, payload) in rows:
+            self.lastID = messageID
+            if (origin == self.origin):
+                continue  # published by this worker, which handles its own
+            message = json.loads(payload)
+            for callback in self.subscribers.get(channel, []):
+                try:
+                    await callback(message)
+                except Exception as e:
+                    print(f'State bus subscriber error ({channel}): {e}')
+            delivered += 1
+
+        self.received += delivered
+        return delivered
+
+    async def poll(self) -> None:
+        """Continuously deliver messages published by other workers."""
+        while (True):
+            await asyncio.sleep(self.POLL_INTERVAL)
+            try:
+                if (self.writes and (self.writeTask is None or self.writeTask.done())):
+                    await self.flush()  # (retry failed writes)
+                await self.receive()
+            except sqlite3.Error as e:
+                print(f'State bus error: {e}')
+
+    async def start(self) -> None:
+        """Start receiving messages."""
+        self.prune()
+        if (self.pollTask is None or self.pollTask.done()):
+            self.pollTask = asyncio.create_task(self.poll())
+
+    async def stop(self) -> None:
+        """Stop receiving messages, and close the database."""
+        if (self.pollTask is not None):
+            self.pollTask.cancel()
+            try:
+                await self.pollTask
+            except asyncio.CancelledError:
+                pass
+            self.pollTask = None
+        await self.flush()
+        self.connection.execute('DELETE FROM owners WHERE origin = ?', (self.origin,))
+        self.connection.close()
+        self.writer.close()
+
+    def summary(self) -> dict[str, Any]:
+        """Return the bus statistics."""
+        return {
+            'backend': 'sqlite',
+            'origin': self.origin,
+            'published': self.published,
+            'received': self.received,
+            'queuedWrites': len(self.writes),
+        }
+
+
+class Write(NamedTuple):
+    """A queued write: its statement, and (for stored values) the key and JSON written."""
+    statement: str
+    parameters: tuple[Any, ...]
+    key: tuple[str, str] | None = None
+    value: str | None = None
+
+
+def isAlive(pid: int) -> bool:
+    """Return True if the process exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, but owned by another user
+    return True
@@ -0,0 +1,62 @@
+"""Tracked background work, retried on failure."""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Final
+
+
+class BackgroundTasks:
+    """
+    Tracked background work, retried on failure.
+    Tasks are held until complete (so they are not garbage collected), and cancelled on shutdown.
+    """
+
+    def __init__(self, retries: int = 3, backoff: float = 0.5) -> None:
+        """Initialise the tracker."""
+        self.RETRIES: Final = retries  # attempts after the first
+        self.BACKOFF: Final = backoff  # seconds, doubled on each retry
+
+        self.tasks: set[asyncio.Task[Any]] = set()
+
+        # statistics (name -> count)
+        self.succeeded: dict[str, int] = {}
+        self.retried: dict[str, int] = {}
+        self.failed: dict[str, int] = {}
+
+    def run(self, name: str, work: Callable[[], Awaitable[Any]]) -> asyncio.Task[Any]:
+        """Run the work in the background (work is a factory, as each attempt needs a fresh coroutine)."""
+        task = asyncio.create_task(self.attempt(name, work))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def attempt(self, name: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Await the work, retrying with exponential backoff."""
+        for attempt in range(self.RETRIES + 1):
+            try:
+                result = await work()
+            except Exception as e:
+                if (attempt == self.RETRIES):
+                    print(f'Background task {name} failed: {e}')
+                    self.failed[name] = self.failed.get(name, 0) + 1
+                    return None
+                self.retried[name] = self.retried.get(name, 0) + 1
+                await asyncio.sleep(self.BACKOFF * 2 ** attempt)
+            else:
+                self.succeeded[name] = self.succeeded.get(name, 0) + 1
+                return result
+        return None
+
+    async def close(self) -> None:
+        """Cancel all outstanding work."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def summary(self) -> dict[str, Any]:
+        """Return the task statistics."""
+        return {
+            'running': len(self.tasks),
+            'succeeded': self.succeeded,
+            'retried': self.retried,
+            'failed': self.failed,
+        }
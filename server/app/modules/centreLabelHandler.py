@@ -1,35 +1,111 @@
 """Handler class for the centre labels."""
+import asyncio
+import multiprocessing
 import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
 from typing import Any, Final
 
 import cv2
+import httpx
 import numpy as np
 from fastapi import HTTPException
 
 from app.APIs.DiscogsAPI import DiscogsAPI
+from app.modules.labelCache import LEGACY_FORMAT, LabelCache, encodeLabel
+from app.modules.metrics import TimingStats
+from app.modules.ttlCache import TTLCache, cacheKey
 
+LABEL_CACHE_BYTES: Final = 64 * 2**20  # default budget of the centre label cache
+CANDIDATE_CONCURRENCY: Final = 2  # candidate images downloaded ahead of detection
+DETECTION_WORKERS: Final = os.cpu_count() or 1  # processes detecting labels (detection is CPU-bound)
+DETECTION_SIZE: Final = 200  # px; circles are detected on the smallest pyramid level at least this size
+REFINE_MARGIN: Final = 3  # px (at the detection level); the error allowed for, when refining a circle
+REFINE_RAYS: Final = 72  # rays sampled through the circumference, when refining a circle
+REFINE_MIN_EDGE: Final = 20  # minimum intensity step, for an edge to count towards refinement
+REFINE_MIN_SUPPORT: Final = 0.6  # fraction of rays which must find the circle's edge, for it to be confirmed
+REFINE_CANDIDATES: Final = 3  # circles (strongest first) checked at full resolution
 
-def detectCircle(imagePath: str) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]]:
-    """Detect circle within an image."""
-    image = cv2.imread(imagePath)
 
+def decodeImage(data: bytes) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]] | None:
+    """Decode an image from its (encoded) bytes (None, if not a valid image)."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def detectCircle(
+    image: np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]],
+) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]] | None:
+    """
+    Detect circle within an image.
+    Circles are detected on a downscaled (pyramid) level of the image, then refined locally at full resolution.
+    """
     grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(grey, (15, 15), 0)
 
-    # Detect circles
+    # downscale (each level halves the resolution)
+    level = grey
+    scale = 1
+    while (min(level.shape[:2]) >= 2 * DETECTION_SIZE):
+        level = cv2.pyrDown(level)
+        scale *= 2
+
+    # detect (with the parameters scaled to the level)
+    blurSize = max(3, (15 // scale) | 1)
     circles = cv2.HoughCircles(
-        blurred, cv2.HOUGH_GRADIENT,
-        dp=1.5, minDist=100,
-        param1=80, param2=80,
-        minRadius=200, maxRadius=0
+        cv2.GaussianBlur(level, (blurSize, blurSize), 0), cv2.HOUGH_GRADIENT,
+        dp=1.5, minDist=100 / scale,
+        param1=80, param2=80 / np.sqrt(scale),
+        minRadius=200 // scale, maxRadius=0
     )
-    return circles
+    if (circles is None or scale == 1):
+        return circles
+
+    # refine the strongest circles at full resolution, keeping the first confirmed by its edges
+    for circle in circles[0, :REFINE_CANDIDATES]:
+        (x, y, r) = (float(value) * scale for value in circle[:3])
+        refined = refineCircle(grey, x, y, r, margin=REFINE_MARGIN * scale)
+        if (refined is not None):
+            return np.array([[refined]], dtype=np.float32)
+    return None
+
+def refineCircle(
+    grey: np.ndarray[Any, Any], x: float, y: float, r: float, margin: float
+) -> tuple[float, float, float] | None:
+    """
+    Refine a circle's estimate, from the strongest edge along rays through its circumference (within the margin),
+    fitted by least squares. None, if too few rays find an edge on the circle (i.e. it is not a circle).
+    """
+    angles = np.linspace(0, 2 * np.pi, REFINE_RAYS, endpoint=False)
+    radii = np.arange(max(r - margin, 1), r + margin + 1)
+    xs = np.clip(np.rint(x + np.cos(angles)[:, None] * radii), 0, grey.shape[1] - 1).astype(int)
+    ys = np.clip(np.rint(y + np.sin(angles)[:, None] * radii), 0, grey.shape[0] - 1).astype(int)
+    profiles = grey[ys, xs].astype(np.float32)
+
+    # strongest edge along each ray (over 2px, to suppress noise)
+    edges = np.abs(profiles[:, 2:] - profiles[:, :-2])
+    strongest = edges.argmax(axis=1)
+    edgeRadii = radii[strongest + 1]
+    # (discard rays without a clear edge, or whose edge is an outlier, e.g. text on the label)
+    valid = edges.max(axis=1) >= REFINE_MIN_EDGE
+    deviation = np.abs(edgeRadii - np.median(edgeRadii[valid])) if valid.any() else edgeRadii
+    valid &= deviation <= max(2, 2 * np.median(deviation[valid])) if valid.any() else valid
+    if (valid.sum() < REFINE_RAYS * REFINE_MIN_SUPPORT):
+        return None
+
+    # least-squares (algebraic) circle fit: x² + y² = 2ax + 2by + c
+    px = x + np.cos(angles[valid]) * edgeRadii[valid]
+    py = y + np.sin(angles[valid]) * edgeRadii[valid]
+    A = np.column_stack([2 * px, 2 * py, np.ones_like(px)])
+    ((a, b, c), *_) = np.linalg.lstsq(A, px ** 2 + py ** 2, rcond=None)
+    fittedR = np.sqrt(c + a ** 2 + b ** 2)
+    if (not np.isfinite(fittedR) or abs(fittedR - r) > margin or np.hypot(a - x, b - y) > margin):
+        return None
+    return (float(a), float(b), float(fittedR))
 
-def cropLabel(imagePath: str) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]] | None:
-    """Crop the current image to the largest circle detected."""
-    circles = detectCircle(imagePath)
+def cropLabel(
+    image: np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]],
+) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]] | None:
+    """Crop the image to the largest circle detected."""
+    circles = detectCircle(image)
     if (circles is not None):
-        image = cv2.imread(imagePath)
         circles = np.round(circles[0, :]).astype("int")
 
         for (x, y, r) in circles:
@@ -42,76 +118,211 @@ def cropLabel(imagePath: str) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.f
             return cropped
     return None
 
-def processImages(directory: str) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]] | None:
-    """Process the images in the given directory, returning the best selection."""
-    for file in os.listdir(directory):
-        imagePath = os.path.join(directory, file)
-        cropped = cropLabel(imagePath)
-        if (cropped is not None):
-            return cropped
-    return None
+def findLabel(data: bytes) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]] | None:
+    """
+    Decode a candidate image and crop it to its label (None, if not an image or no label is found).
+    Run in the detection workers: only the (encoded) bytes are sent to the worker, and only the crop returned.
+    """
+    image = decodeImage(data)
+    return cropLabel(image) if image is not None else None
+
+def initDetectionWorker() -> None:
+    """Initialise a detection worker (single-threaded, as the pool already occupies every core)."""
+    cv2.setNumThreads(1)
 
 class CentreLabelHandler:
     """Handler class for the centre labels."""
 
-    def __init__(self, dataPath: str, discogsAPI: DiscogsAPI) -> None:
+    def __init__(
+        self,
+        dataPath: str,
+        discogsAPI: DiscogsAPI,
+        releaseCache: TTLCache | None = None,
+        labelCache: LabelCache | None = None,
+        executor: Executor | None = None,
+    ) -> None:
         """Initialise the centre labels."""
         self.DATA_DIR: Final = dataPath
         self.DISCOGS_API: Final = discogsAPI
+        self.releaseCache = releaseCache  # search -> release ID, metadata and candidate images
+        self.labelCache = labelCache if labelCache is not None else LabelCache(
+            os.path.join(dataPath, 'centreLabels'), LABEL_CACHE_BYTES
+        )
 
-        for subDir in ['centreLabels', 'centreLabelCandidates']:
-            if (not os.path.exists(os.path.join(dataPath, subDir))):
-                os.makedirs(os.path.join(dataPath, subDir))
+        # detection runs off the event loop, in (spawned, rather than forked from the threaded server) processes
+        self.executor: Executor = executor if executor is not None else ProcessPoolExecutor(
+            max_workers=DETECTION_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=initDetectionWorker,
+        )
 
-    def findReleaseData(self, albumName: str, artistName: str | None, year: str | None, medium: str | None) -> Any | None:
-        """Find the release data for the given album."""
-        album = self.DISCOGS_API.searchRelease(albumName, artistName, year, medium)
-        if (album is not None):
-            return self.DISCOGS_API.getDataForRelease(album['id'])
-        else:
-            raise HTTPException(status_code=404, detail='Failed to find album on Discogs.')
+        # statistics
+        self.searches = 0
+        self.candidatesAvailable = 0
+        self.candidatesFetched = 0
+        self.coalesced = 0
+        self.timings = TimingStats()
+
+        self.inFlight: dict[str, asyncio.Task[tuple[bytes | None, Any]]] = {}  # album ID -> (coalesced) search
 
-    def downloadCandidates(self, albumID: str, images: list[Any]) -> None:
-        """Download images for an album."""
+    async def findReleaseData(
+        self, albumName: str, artistName: str | None, year: str | None, medium: str | None
+    ) -> tuple[list[dict[str, str]], dict[str, Any]]:
+        """Find the release data (candidate images, and metadata) for the given album (cached, when possible)."""
+        KEY: Final = cacheKey([albumName, artistName, year, medium])
+        if (self.releaseCache is not None):
+            cached = self.releaseCache.get(KEY)
+            if (isinstance(cached, dict)):
+                return cached['images'], cached['metadata']
 
-        candidatesDir = os.path.join(self.DATA_DIR, 'centreLabelCandidates')
+        album = await self.DISCOGS_API.searchRelease(albumName, artistName, year, medium)
+        if (album is None):
+            raise HTTPException(status_code=404, detail='Failed to find album on Discogs.')
+        (releaseImages, metadata) = await self.DISCOGS_API.getDataForRelease(album['id'])
+        # (only the image URIs are used, as candidates)
+        images = [{'uri': image['uri']} for image in releaseImages]
 
-        # clear existing candidates
-        for file in os.listdir(candidatesDir):
-            os.remove(os.path.join(candidatesDir, file))
+        if (self.releaseCache is not None):
+            self.releaseCache.set(KEY, {'releaseID': album['id'], 'images': images, 'metadata': metadata})
+        return images, metadata
 
-        for (index, image) in enumerate(images):
-            url = image['uri']
-            self.DISCOGS_API.downloadImage(url, os.path.join(candidatesDir, f'{albumID}({index}).png'))
+    async def findCentreLabel(
+        self, images: list[Any]
+    ) -> np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]] | None:
+        """
+        Find the centre label amongst the candidate images.
+        Candidates are fetched concurrently (a few at a time, in order) and checked (by the detection workers)
+        as each arrives; once a label is found, the remaining downloads are cancelled.
+        """
+        semaphore = asyncio.Semaphore(CANDIDATE_CONCURRENCY)
+        loop = asyncio.get_running_loop()
 
-    def getCandidates(self, albumName: str, artistName: str | None, year: str | None, medium: str | None) -> None:
-        """Get the candidate centre labels."""
+        async def fetchCandidate(url: str) -> bytes | None:
+            async with semaphore:
+                try:
+                    return await self.DISCOGS_API.fetchImage(url)
+                except httpx.HTTPError as e:
+                    print(f'Failed to fetch candidate {url}: {e}')
+                    return None
 
-        # download from Discogs
-        album = self.DISCOGS_API.searchRelease(albumName, artistName, year, medium)
-        if (album is not None):
-            images, _ = self.DISCOGS_API.getDataForRelease(album['id'])
-            if (images is None or len(images) == 0):
-                raise HTTPException(status_code=404, detail='Failed to find images for album')
-            self.downloadCandidates(album['id'], images)
-        else:
-            raise HTTPException(status_code=404, detail='Failed to find album on Discogs.')
+        downloads = [asyncio.create_task(fetchCandidate(image['uri'])) for image in images]
+        self.searches += 1
+        self.candidatesAvailable += len(images)
+        try:
+            for download in asyncio.as_completed(downloads):
+                data = await download
+                self.candidatesFetched += 1
+                if (data is None):
+                    continue
+                startTime = time.perf_counter()
+                cropped = await loop.run_in_executor(self.executor, findLabel, data)
+                self.timings.record('detection', time.perf_counter() - startTime)
+                if (cropped is not None):
+                    return cropped
+        finally:
+            for download in downloads:
+                download.cancel()
+            await asyncio.gather(*downloads, return_exceptions=True)
+        return None
+
+    async def getCandidates(self, albumName: str, artistName: str | None, year: str | None, medium: str | None) -> list[Any]:
+        """Get the candidate centre label images (from Discogs)."""
+        images, _ = await self.findReleaseData(albumName, artistName, year, medium)
+        if (len(images) == 0):
+            raise HTTPException(status_code=404, detail='Failed to find images for album')
+        return list(images)
 
-    def serveCentreLabel(self, albumID: str, albumName: str | None = None, artistName: str | None = None, year: str | None = None, medium: str | None = None, images: Any = None) -> bool:
-        """Serve the centre label for the given album."""
+    async def serveCentreLabel(self, albumID: str, albumName: str | None = None, artistName: str | None = None, year: str | None = None, medium: str | None = None, images: Any = None) -> bytes | None:
+        """Serve the centre label for the given album (returning it, encoded; None if not found)."""
 
         if (images is None):
             if (albumName is None):
                 raise HTTPException(status_code=400, detail='No album name provided.')
-            self.getCandidates(albumName, artistName, year, medium)
-        else:
-            self.downloadCandidates(albumID, images)
+            images = await self.getCandidates(albumName, artistName, year, medium)
 
-        centreLabel = processImages(os.path.join(self.DATA_DIR, 'centreLabelCandidates'))
+        centreLabel = await self.findCentreLabel(images)
         if (centreLabel is not None):
-            # store as file:
+            # store in the cache:
             #   1. to serve to client
             #   2. for persistent caching
-            cv2.imwrite(os.path.join(self.DATA_DIR, 'centreLabels', f'{albumID}.png'), centreLabel)
-            return True
-        return False # failed
+            label = await asyncio.get_running_loop().run_in_executor(self.executor, encodeLabel, centreLabel)
+            self.labelCache.put(albumID, label)
+            return label
+        return None # failed
+
+    async def getCentreLabel(
+        self, albumID: str, albumName: str, artistName: str | None, year: str | None
+    ) -> tuple[bytes | None, Any]:
+        """
+        Get the centre label (encoded, None if not found) and release metadata for the given album.
+        Concurrent requests for an album share a single search.
+        """
+        task = self.inFlight.get(albumID)
+        if (task is None):
+            task = asyncio.create_task(self.loadCentreLabel(albumID, albumName, artistName, year))
+            self.inFlight[albumID] = task
+            task.add_done_callback(lambda _: self.inFlight.pop(albumID, None))
+        else:
+            self.coalesced += 1
+        # (shielded, so one caller's cancellation does not fail the others)
+        return await asyncio.shield(task)
+
+    async def loadCentreLabel(
+        self, albumID: str, albumName: str, artistName: str | None, year: str | None
+    ) -> tuple[bytes | None, Any]:
+        """Load the centre label (from the cache, or else by searching the candidates) and release metadata."""
+        label = self.labelCache.get(albumID)
+        if (label is None):
+            label = await self.migrateLabel(albumID)
+        if (label is not None):
+            # (a cached label is served even if its metadata cannot be found, e.g. whilst Discogs is unavailable)
+            try:
+                (_, metadata) = await self.findReleaseData(albumName, artistName, year, 'vinyl')
+            except (HTTPException, httpx.HTTPError) as e:
+                print(f"Failed to find the release metadata for '{albumName}': {e}")
+                metadata = {}
+            return label, metadata
+
+        # if label not cached, attempt to find it
+        (images, metadata) = await self.findReleaseData(albumName, artistName, year, 'vinyl')
+        label = await self.serveCentreLabel(albumID, images=images)
+        if (label is None):
+            # re-attempt with broader search (unless it finds the same candidates)
+            try:
+                broaderImages = await self.getCandidates(albumName, None, None, None)
+            except HTTPException:
+                broaderImages = images
+            if (broaderImages != images):
+                label = await self.serveCentreLabel(albumID, images=broaderImages)
+
+        return label, metadata
+
+    async def migrateLabel(self, albumID: str) -> bytes | None:
+        """Move a label stored in the previous format (PNG, named by album ID) into the cache (None, if none)."""
+        if (os.path.basename(albumID) != albumID):
+            return None
+        legacyName = f'{albumID}{LEGACY_FORMAT}'
+        legacyPath = os.path.join(self.labelCache.DIRECTORY, legacyName)
+        centreLabel = cv2.imread(legacyPath) if os.path.exists(legacyPath) else None
+        if (centreLabel is None):
+            return None
+        label = await asyncio.get_running_loop().run_in_executor(self.executor, encodeLabel, centreLabel)
+        self.labelCache.put(albumID, label)
+        self.labelCache.remove(legacyName)
+        return label
+
+    def summary(self) -> dict[str, Any]:
+        """Return the search statistics."""
+        return {
+            'searches': self.searches,
+            'candidatesAvailable': self.candidatesAvailable,
+            'candidatesFetched': self.candidatesFetched,
+            'meanFetched': round(self.candidatesFetched / self.searches, 2) if self.searches else 0,
+            'coalesced': self.coalesced,
+            'timings': self.timings.summary(),
+        }
+
+    def close(self) -> None:
+        """Stop the detection workers (abandoning any queued detections), and record the labels' recency."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.labelCache.saveRecency()
@@ -0,0 +1,77 @@
+"""Server-Sent Events feed of state broadcasts, for read-only viewers."""
+
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Final
+
+
+class EventStream:
+    """
+    Shared buffer of pre-encoded Server-Sent Events.
+    Each broadcast is encoded once, however many viewers are subscribed.
+    """
+
+    def __init__(self, getSnapshot: Callable[[], str | bytes], bufferSize: int = 64, keepAlive: float = 15) -> None:
+        """Initialise the event stream."""
+        self.getSnapshot = getSnapshot
+        self.KEEP_ALIVE: Final = keepAlive
+
+        self.lastID = 0
+        self.events: deque[tuple[int, bytes]] = deque(maxlen=bufferSize)
+        self.newEvent = asyncio.Event()
+
+        self.subscribers = 0
+        self.published = 0
+
+    def publish(self, data: dict[str, Any]) -> None:
+        """Encode a broadcast into the buffer, and wake all subscribers."""
+        self.lastID += 1
+        self.events.append((self.lastID, encodeEvent(json.dumps(data, separators=(',', ':')), self.lastID)))
+        self.published += 1
+
+        # wake current subscribers; later ones wait on a fresh event
+        self.newEvent.set()
+        self.newEvent = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        """Yield the encoded events for a single viewer, starting with a snapshot of the state."""
+        self.subscribers += 1
+        try:
+            lastSeenID = self.lastID
+            yield encodeEvent(self.getSnapshot(), lastSeenID)
+
+            while (True):
+                newEvent = self.newEvent
+                if (self.lastID == lastSeenID):
+                    try:
+                        await asyncio.wait_for(newEvent.wait(), self.KEEP_ALIVE)
+                    except asyncio.TimeoutError:
+                        yield b': keep-alive\n\n'  # also detects disconnected viewers
+                        continue
+
+                if (not self.events or self.events[0][0] > lastSeenID + 1):
+                    # viewer fell behind the buffer; resynchronise from a fresh snapshot
+                    lastSeenID = self.lastID
+                    yield encodeEvent(self.getSnapshot(), lastSeenID)
+                    continue
+
+                pending = [event for (eventID, event) in self.events if eventID > lastSeenID]
+                lastSeenID = self.lastID
+                yield b''.join(pending)
+        finally:
+            self.subscribers -= 1
+
+    def summary(self) -> dict[str, int]:
+        """Return the event stream statistics."""
+        return {
+            'subscribers': self.subscribers,
+            'published': self.published,
+        }
+
+
+def encodeEvent(data: str | bytes, eventID: int) -> bytes:
+    """Encode a single-line payload as a Server-Sent Event."""
+    if (isinstance(data, bytes)):
+        data = data.decode('utf-8')
+    return f'id: {eventID}\ndata: {data}\n\n'.encode('utf-8')
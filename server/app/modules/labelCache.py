@@ -0,0 +1,213 @@
+"""Bounded, content-addressed cache of centre label images, on disk."""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Final
+
+import cv2
+import numpy as np
+
+LABEL_FORMAT: Final = '.webp'
+LABEL_MIME_TYPE: Final = 'image/webp'
+LABEL_QUALITY: Final = 90  # (WebP; labels are around a tenth of the size of the PNGs previously stored)
+REFERENCE_FORMAT: Final = '.ref'
+LEGACY_FORMAT: Final = '.png'  # (labels stored in the previous format, named by album ID, until migrated)
+
+
+def encodeLabel(image: np.ndarray[Any, np.dtype[np.integer[Any] | np.floating[Any]]]) -> bytes:
+    """Encode a centre label image, in the cached format (run in the detection workers; encoding is CPU-bound)."""
+    (_, encoded) = cv2.imencode(LABEL_FORMAT, image, [cv2.IMWRITE_WEBP_QUALITY, LABEL_QUALITY])
+    return encoded.tobytes()
+
+
+class LabelCache:
+    """
+    Size-bounded cache of centre labels on disk, evicting the least recently used once over budget.
+    Labels are stored under the hash of their (encoded) contents, so albums sharing a label (e.g. reissues) share a
+    single file; each album's reference file names the label it uses.
+    The index (each label's size, in order of use) is kept in memory, and rebuilt from the directory on startup;
+    labels in the previous format are indexed too, so they count towards the budget (and are evicted) until migrated.
+    Recency is only written to disk (as the labels' modification times) when evicting, and when the server stops.
+    """
+
+    def __init__(self, directory: str, maxBytes: int) -> None:
+        """Initialise the cache, indexing the labels already stored."""
+        self.DIRECTORY: Final = directory
+        self.MAX_BYTES: Final = maxBytes
+
+        # label file name -> size (bytes), least recently used first
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.references: dict[str, str] = {}  # reference file name -> label file name
+        self.used: OrderedDict[str, None] = OrderedDict()  # labels used since recency was last recorded, in order
+        self.size = 0
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.deduplicated = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.rebuild()
+
+    @staticmethod
+    def labelName(data: bytes) -> str:
+        """Return the file name of a label (the hash of its contents)."""
+        return hashlib.sha256(data).hexdigest()[:32] + LABEL_FORMAT
+
+    @staticmethod
+    def referenceName(key: str) -> str:
+        """Return the file name of a key's reference (hashed, so any key is a safe file name)."""
+        return hashlib.sha256(key.encode()).hexdigest()[:32] + REFERENCE_FORMAT
+
+    def rebuild(self) -> None:
+        """
+        Rebuild the index from the directory (a single scan), removing interrupted writes,
+        and references to labels that have been evicted.
+        """
+        files: list[tuple[int, str, int]] = []
+        references: list[tuple[str, str]] = []
+        with os.scandir(self.DIRECTORY) as entries:
+            for entry in entries:
+                if (entry.name.endswith('.tmp')):
+                    os.remove(entry.path)
+                elif (entry.name.endswith((LABEL_FORMAT, LEGACY_FORMAT)) and entry.is_file()):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime_ns, entry.name, stat.st_size))
+                elif (entry.name.endswith(REFERENCE_FORMAT)):
+                    with open(entry.path, encoding='utf-8') as referenceFile:
+                        references.append((entry.name, referenceFile.read().strip()))
+
+        self.entries.clear()
+        for (_, name, size) in sorted(files):
+            self.entries[name] = size
+        self.size = sum(self.entries.values())
+
+        self.references.clear()
+        for (referenceName, name) in references:
+            if (name in self.entries):
+                self.references[referenceName] = name
+            else:
+                self.removeFile(referenceName)
+        self.used.clear()
+        self.evict()
+
+    def readReference(self, referenceName: str) -> str | None:
+        """Return the label file named by a reference (None, if there is no reference)."""
+        try:
+            with open(os.path.join(self.DIRECTORY, referenceName), encoding='utf-8') as referenceFile:
+                return referenceFile.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def get(self, key: str) -> bytes | None:
+        """Return the cached label (None if not cached), marking it as recently used."""
+        referenceName = self.referenceName(key)
+        # (the reference may have been stored by another server worker)
+        name = self.references.get(referenceName) or self.readReference(referenceName)
+        data: bytes | None = None
+        if (name is not None):
+            try:
+                with open(os.path.join(self.DIRECTORY, name), 'rb') as labelFile:
+                    data = labelFile.read()
+            except FileNotFoundError:
+                # (evicted by another server worker)
+                self.size -= self.entries.pop(name, 0)
+                if (self.readReference(referenceName) == name):
+                    self.removeFile(referenceName)
+        if (name is None or data is None):
+            self.references.pop(referenceName, None)
+            self.misses += 1
+            return None
+
+        self.references[referenceName] = name
+        if (name not in self.entries):
+            self.entries[name] = len(data)
+            self.size += len(data)
+        self.entries.move_to_end(name)
+        self.used[name] = None
+        self.used.move_to_end(name)
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store a label (unless already stored, for another album), evicting the least recently used if over budget."""
+        name = self.labelName(data)
+        if (os.path.exists(os.path.join(self.DIRECTORY, name))):
+            self.deduplicated += 1
+        else:
+            self.writeFile(name, data)
+        referenceName = self.referenceName(key)
+        # (the label is written before its reference, so a reference never names a label not yet written)
+        self.writeFile(referenceName, name.encode())
+        self.references[referenceName] = name
+
+        self.size += len(data) - self.entries.pop(name, 0)
+        self.entries[name] = len(data)
+        self.used[name] = None
+        self.used.move_to_end(name)
+        self.evict()
+
+    def remove(self, name: str) -> None:
+        """Remove a file from the cache, and its index (e.g. a label in the previous format, once migrated)."""
+        self.size -= self.entries.pop(name, 0)
+        self.used.pop(name, None)
+        self.removeFile(name)
+
+    def writeFile(self, name: str, data: bytes) -> None:
+        """Write a file to the cache directory."""
+        path = os.path.join(self.DIRECTORY, name)
+        # (written to a temporary file, then moved into place, so the file is never read partially written)
+        tempPath = f'{path}.{os.getpid()}.tmp'
+        with open(tempPath, 'wb') as file:
+            file.write(data)
+        os.replace(tempPath, path)
+
+    def removeFile(self, name: str) -> None:
+        """Remove a file from the cache directory (if it has not already been removed, e.g. by another worker)."""
+        try:
+            os.remove(os.path.join(self.DIRECTORY, name))
+        except FileNotFoundError:
+            pass
+
+    def saveRecency(self) -> None:
+        """Record the order in which labels have been used (as their modification times), for the next rebuild."""
+        now = time.time_ns()
+        for (i, name) in enumerate(self.used):
+            try:
+                os.utime(os.path.join(self.DIRECTORY, name), ns=(now + i, now + i))
+            except FileNotFoundError:
+                pass
+        self.used.clear()
+
+    def evict(self) -> None:
+        """Remove the least recently used labels and their references, until within budget (keeping the most recent)."""
+        if (self.size <= self.MAX_BYTES or len(self.entries) <= 1):
+            return
+        self.saveRecency()
+        evicted: set[str] = set()
+        while (self.size > self.MAX_BYTES and len(self.entries) > 1):
+            (name, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            evicted.add(name)
+            self.removeFile(name)
+        for (referenceName, name) in list(self.references.items()):
+            if (name in evicted):
+                del self.references[referenceName]
+                self.removeFile(referenceName)
+
+    def summary(self) -> dict[str, Any]:
+        """Return the cache statistics."""
+        return {
+            'entries': len(self.entries),
+            'references': len(self.references),
+            'sizeBytes': self.size,
+            'maxBytes': self.MAX_BYTES,
+            'evictions': self.evictions,
+            'deduplicated': self.deduplicated,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRatio': round(self.hits / (self.hits + self.misses), 3) if (self.hits + self.misses) else 0,
+        }
@@ -0,0 +1,119 @@
+"""Wire formats for the websocket protocol, negotiated per connection via subprotocols."""
+
+import json
+from typing import Any, Final
+
+import msgpack
+from fastapi import WebSocket
+
+from app.enums.StateKeys import Commands, StateKeys
+from app.modules.messageSchema import CLIENT_MESSAGE, ClientMessage
+
+
+# small integer opcodes, derived from the enums
+# (state keys and commands are offset, so each enum can grow independently)
+COMMAND_OFFSET: Final = 64
+OPCODES: Final[dict[str, int]] = {
+    **{key.value: index for (index, key) in enumerate(StateKeys)},
+    **{command.value: COMMAND_OFFSET + index for (index, command) in enumerate(Commands)},
+}
+OPCODE_NAMES: Final[dict[int, str]] = {opcode: name for (name, opcode) in OPCODES.items()}
+
+
+class JSONCodec:
+    """Default text framing: one JSON object per frame."""
+
+    NAME: Final = 'json'
+    SUBPROTOCOL: Final = 'vtt.json'
+
+    def encode(self, data: dict[str, Any]) -> str:
+        """Encode a message into a frame."""
+        return json.dumps(data, separators=(',', ':'))
+
+    def decode(self, frame: str | bytes) -> dict[str, Any]:
+        """Decode a frame into a message."""
+        data = json.loads(frame)
+        if (not isinstance(data, dict)):
+            raise ValueError('Message is not an object.')
+        return data
+
+    def decodeMessage(self, frame: str | bytes) -> ClientMessage:
+        """Decode a frame straight into a typed client message."""
+        return CLIENT_MESSAGE.validate_json(frame)
+
+    async def send(self, websocket: WebSocket, frame: str | bytes) -> None:
+        """Send an encoded frame."""
+        await websocket.send_text(str(frame))
+
+    async def receive(self, websocket: WebSocket) -> str | bytes:
+        """Receive an encoded frame."""
+        return await websocket.receive_text()
+
+
+class MessagePackCodec:
+    """
+    Compact binary framing: a MessagePack array of [opcode, value, extras?].
+    Commands without an opcode are sent by name in place of the opcode.
+    """
+
+    NAME: Final = 'msgpack'
+    SUBPROTOCOL: Final = 'vtt.msgpack'
+
+    def encode(self, data: dict[str, Any]) -> bytes:
+        """Encode a message into a frame."""
+        command = data.get('command')
+        frame: list[Any] = [OPCODES.get(command, command), data.get('value')]  # type: ignore[arg-type]
+
+        extras = {key: value for (key, value) in data.items() if key not in ('command', 'value')}
+        if (extras):
+            frame.append(extras)
+        return bytes(msgpack.packb(frame))
+
+    def decode(self, frame: str | bytes) -> dict[str, Any]:
+        """Decode a frame into a message."""
+        if (isinstance(frame, str)):
+            frame = frame.encode('utf-8')
+        data = msgpack.unpackb(frame)
+        if (not isinstance(data, list) or len(data) < 2):
+            raise ValueError('Message is not a valid frame.')
+
+        command = data[0]
+        message = {
+            'command': OPCODE_NAMES.get(command, command) if isinstance(command, int) else command,
+            'value': data[1],
+        }
+        if (len(data) > 2 and isinstance(data[2], dict)):
+            message.update(data[2])
+        return message
+
+    def decodeMessage(self, frame: str | bytes) -> ClientMessage:
+        """Decode a frame into a typed client message."""
+        return CLIENT_MESSAGE.validate_python(self.decode(frame))
+
+    async def send(self, websocket: WebSocket, frame: str | bytes) -> None:
+        """Send an encoded frame."""
+        await websocket.send_bytes(bytes(frame) if isinstance(frame, bytes) else frame.encode('utf-8'))
+
+    async def receive(self, websocket: WebSocket) -> str | bytes:
+        """Receive an encoded frame."""
+        return await websocket.receive_bytes()
+
+
+MessageCodec = JSONCodec | MessagePackCodec
+
+DEFAULT_CODEC: Final = JSONCodec()
+CODECS: Final[dict[str, MessageCodec]] = {
+    codec.SUBPROTOCOL: codec for codec in (DEFAULT_CODEC, MessagePackCodec())
+}
+
+
+def negotiateCodec(requestedSubprotocols: list[str]) -> tuple[MessageCodec, str | None]:
+    """
+    Select the codec for a connection, from the client's requested subprotocols (in preference order).
+    Returns the codec, and the subprotocol to accept (None for clients which requested none).
+    """
+    for subprotocol in requestedSubprotocols:
+        codec = CODECS.get(subprotocol)
+        if (codec is not None):
+            return codec, subprotocol
+    return DEFAULT_CODEC, None
@@ -0,0 +1,76 @@
+"""Typed schema for messages received over the websocket protocol."""
+
+from typing import Annotated, Any, Final, Literal
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from typing_extensions import TypedDict  # required by pydantic, on Python < 3.12
+
+
+class Settings(TypedDict, total=False):
+    """Host settings, as shared between clients."""
+    enableMotor: bool
+    enableRemote: bool
+    enforceSignature: bool
+    volume: int
+
+
+class Message(BaseModel):
+    """Base class for client messages."""
+    model_config = ConfigDict(frozen=True, extra='ignore')
+
+
+class PlayStateMessage(Message):
+    """Play/pause the host."""
+    command: Literal['playState']
+    value: bool
+
+
+class CurrentTrackMessage(Message):
+    """The host's current track (provider-specific track object)."""
+    command: Literal['currentTrack']
+    value: dict[str, Any] | None = None
+
+
+class SettingsMessage(Message):
+    """Update the host settings."""
+    command: Literal['settings']
+    value: Settings
+
+
+class TransportMessage(Message):
+    """Value-less remote-to-host commands."""
+    command: Literal['playNext', 'playPrevious', 'upload', 'forwards', 'reverse']
+    value: Any = None
+
+
+class SeekMessage(Message):
+    """Seek the host's playback by a relative number of seconds."""
+    command: Literal['seek']
+    value: float
+
+
+class PlayMessage(Message):
+    """Start playback of a provider album, track or playlist on the host."""
+    command: Literal['playAlbum', 'playTrack', 'playPlaylist']
+    value: str
+
+
+class PongMessage(Message):
+    """Heartbeat response, echoing the value of the server's ping."""
+    command: Literal['pong']
+    value: float | None = None
+
+
+ClientMessage = Annotated[
+    PlayStateMessage
+    | CurrentTrackMessage
+    | SettingsMessage
+    | TransportMessage
+    | SeekMessage
+    | PlayMessage
+    | PongMessage,
+    Field(discriminator='command'),
+]
+
+# compiled once; decodes frames straight into the typed message classes
+CLIENT_MESSAGE: Final[TypeAdapter[ClientMessage]] = TypeAdapter(ClientMessage)
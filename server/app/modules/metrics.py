@@ -0,0 +1,34 @@
+"""Lightweight in-process metrics, exposed by the /metrics endpoint."""
+
+from typing import Any
+
+
+class TimingStats:
+    """Aggregated durations, keyed by name (e.g. per websocket command)."""
+
+    def __init__(self) -> None:
+        """Initialise the timing statistics."""
+        # key -> [count, total seconds, max seconds]
+        self.timings: dict[str, list[float]] = {}
+
+    def record(self, key: str, seconds: float) -> None:
+        """Record a single duration against the key."""
+        timing = self.timings.get(key)
+        if (timing is None):
+            self.timings[key] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Return the statistics, in milliseconds."""
+        return {
+            key: {
+                'count': int(count),
+                'meanMs': round(total / count * 1000, 3),
+                'maxMs': round(maximum * 1000, 3),
+                'totalMs': round(total * 1000, 3),
+            }
+            for (key, (count, total, maximum)) in self.timings.items()
+        }
@@ -9,12 +9,15 @@ import torch.nn as nn
 from PIL import Image
 import torchvision.transforms as transforms
 
+from app.modules.ttlCache import cacheKey
 from modelling.models.utils.ModelType import ModelType
 from modelling.models.utils.Transforms import globalTransforms
 from modelling.models.BabyOuroboros import BabyOuroboros
 from modelling.models.Ouroboros import Ouroboros
 from modelling.models.Amphisbaena import Amphisbaena
 
+PROVIDER_IDS_FILE: Final = 'providerIDs.json'  # (alongside the class manifest)
+
 
 class ModelHandler:
     """Handler class for the model."""
@@ -27,6 +30,7 @@ class ModelHandler:
         self.model: nn.Module | None = None
         self.globalTransformer = transforms.Compose(globalTransforms)
         self.classes: dict[str, dict[str, str]] = {}
+        self.providerIDs: dict[str, dict[str, dict[str, str | None]]] = {}  # provider -> class -> resolved ID
 
 
     def loadModel(self, modelType: ModelType, modelName: str) -> None:
@@ -67,6 +71,22 @@ class ModelHandler:
         with open(CLASS_MANIFEST, 'r', encoding='utf-8') as f:
             self.classes = json.load(f) # structured metadata
 
+        # precomputed music provider IDs (see modelling/resolveProviderIDs.py)
+        PROVIDER_IDS: Final = os.path.join(os.path.dirname(CLASS_MANIFEST), PROVIDER_IDS_FILE)
+        if (os.path.exists(PROVIDER_IDS)):
+            with open(PROVIDER_IDS, 'r', encoding='utf-8') as f:
+                self.providerIDs = json.load(f)
+
+    def getProviderID(self, provider: str, albumClass: str) -> dict[str, str] | None:
+        """Return the precomputed provider ID of a class, if it was resolved from its current manifest entry."""
+        resolved = self.providerIDs.get(provider, {}).get(albumClass)
+        if (
+            resolved is None or resolved.get('id') is None
+            or resolved.get('key') != cacheKey(self.classes.get(albumClass))
+        ):
+            return None
+        return {'medium': str(resolved['medium']), 'id': str(resolved['id'])}
+
 
     def scan(self, imagePath: str) -> dict[str, str | int | float]:
         """Scan an image and predict the class."""
@@ -0,0 +1,137 @@
+"""Token-bucket rate limiting of client commands."""
+
+import time
+from typing import Any, Final
+
+from app.enums.StateKeys import Commands, StateKeys
+from app.modules.sessionManager import SessionContext
+
+
+class TokenBucket:
+    """A token bucket: allows bursts of up to `capacity`, refilled at `rate` tokens per second."""
+
+    def __init__(self, capacity: float, rate: float) -> None:
+        """Initialise a full bucket."""
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        """Top up the bucket, for the time elapsed since the last update."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def tryConsume(self, cost: float = 1) -> bool:
+        """Consume tokens, if available."""
+        self.refill()
+        if (self.tokens >= cost):
+            self.tokens -= cost
+            return True
+        return False
+
+    def retryAfter(self, cost: float = 1) -> float:
+        """Return the number of seconds until the given cost can be afforded."""
+        if (self.rate <= 0):
+            return float('inf')
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def isFull(self) -> bool:
+        """Return True if the bucket has fully refilled (i.e. is idle)."""
+        self.refill()
+        return self.tokens >= self.capacity
+
+
+# command classes, grouping commands by their cost to the host
+COMMAND_CLASSES: Final[dict[str, str]] = {
+    StateKeys.PLAY_STATE.value: 'state',
+    StateKeys.CURRENT_TRACK.value: 'state',
+    StateKeys.SETTINGS.value: 'settings',
+    Commands.PLAY_NEXT.value: 'transport',
+    Commands.PLAY_PREVIOUS.value: 'transport',
+    Commands.FAST_FORWARD.value: 'transport',
+    Commands.REWIND.value: 'transport',
+    Commands.SEEK.value: 'transport',
+    Commands.GET_UPLOAD.value: 'transport',
+    # these trigger provider (e.g. Spotify) calls on the host
+    Commands.PLAY_ALBUM.value: 'playback',
+    Commands.PLAY_TRACK.value: 'playback',
+    Commands.PLAY_PLAYLIST.value: 'playback',
+}
+
+# (burst capacity, refill per second), per command class
+HOST_BUDGETS: Final[dict[str, tuple[float, float]]] = {
+    'state': (30, 10),
+    'settings': (30, 10),
+    'transport': (20, 5),
+    'playback': (10, 1),
+}
+SIDE_BUDGETS: Final[dict[str, tuple[float, float]]] = {
+    'state': (10, 2),
+    'settings': (20, 5),  # allow for volume spins
+    'transport': (5, 1),
+    'playback': (3, 0.2),
+}
+
+
+class RateLimiter:
+    """Rate limits client commands, with a token bucket per session and command class."""
+
+    def __init__(
+        self,
+        hostBudgets: dict[str, tuple[float, float]] = HOST_BUDGETS,
+        sideBudgets: dict[str, tuple[float, float]] = SIDE_BUDGETS,
+    ) -> None:
+        """Initialise the rate limiter."""
+        self.hostBudgets = hostBudgets
+        self.sideBudgets = sideBudgets
+
+        # sessionID -> command class -> bucket
+        self.buckets: dict[str, dict[str, TokenBucket]] = {}
+        # command class -> number of throttled messages
+        self.throttled: dict[str, int] = {}
+
+    def getBucket(self, session: SessionContext, commandClass: str) -> TokenBucket | None:
+        """Get (or create) the bucket for the session's command class."""
+        sessionBuckets = self.buckets.setdefault(session.sessionID, {})
+        bucket = sessionBuckets.get(commandClass)
+        if (bucket is None):
+            budgets = self.hostBudgets if session.isHost else self.sideBudgets
+            budget = budgets.get(commandClass)
+            if (budget is None):
+                return None  # unlimited
+            bucket = sessionBuckets[commandClass] = TokenBucket(*budget)
+        return bucket
+
+    def check(self, session: SessionContext, command: str) -> float | None:
+        """
+        Check whether the session may issue the command, consuming from its budget.
+        Returns None if allowed, else the number of seconds until it would be.
+        """
+        commandClass = COMMAND_CLASSES.get(command)
+        if (commandClass is None):
+            return None
+        bucket = self.getBucket(session, commandClass)
+        if (bucket is None or bucket.tryConsume()):
+            return None
+
+        self.throttled[commandClass] = self.throttled.get(commandClass, 0) + 1
+        return bucket.retryAfter()
+
+    def prune(self) -> None:
+        """Forget idle (fully-refilled) buckets."""
+        for sessionID in list(self.buckets.keys()):
+            sessionBuckets = self.buckets[sessionID]
+            for commandClass in [key for (key, bucket) in sessionBuckets.items() if bucket.isFull()]:
+                del sessionBuckets[commandClass]
+            if (not sessionBuckets):
+                del self.buckets[sessionID]
+
+    def summary(self) -> dict[str, Any]:
+        """Return the throttling statistics."""
+        return {
+            'throttled': dict(self.throttled),
+            'throttledTotal': sum(self.throttled.values()),
+            'trackedSessions': len(self.buckets),
+        }
@@ -0,0 +1,146 @@
+"""Single-task scheduler of credential refreshes."""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Final, Hashable
+
+# (on failure, a refresh is retried after RETRY_DELAY, doubling up to MAX_RETRY_DELAY)
+RETRY_DELAY: Final = 15  # seconds
+MAX_RETRY_DELAY: Final = 600  # seconds
+
+
+class RefreshScheduler:
+    """
+    Single-task scheduler of credential refreshes (e.g. access tokens), serving any number of sessions.
+    Refreshes are held in a heap, keyed on when they are due; rescheduled and cancelled entries are skipped lazily.
+    Each refresh returns when it is next due (or None, to stop); concurrent refreshes of a key are shared.
+    """
+
+    def __init__(self, retryDelay: float = RETRY_DELAY, maxRetryDelay: float = MAX_RETRY_DELAY) -> None:
+        """Initialise the scheduler."""
+        self.RETRY_DELAY: Final = retryDelay
+        self.MAX_RETRY_DELAY: Final = maxRetryDelay
+
+        self.heap: list[tuple[float, int, Hashable]] = []  # (due at, generation, key)
+        self.entries: dict[Hashable, tuple[float, int]] = {}  # key -> current (due at, generation)
+        self.refreshers: dict[Hashable, Callable[[], Awaitable[float | None]]] = {}
+        self.inFlight: dict[Hashable, asyncio.Task[bool]] = {}
+        self.failures: dict[Hashable, int] = {}
+        self.generations = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task[None] | None = None
+
+        # statistics
+        self.refreshed = 0
+        self.failed = 0
+        self.onDemand = 0
+
+    def schedule(self, key: Hashable, dueAt: float, refresh: Callable[[], Awaitable[float | None]]) -> None:
+        """Schedule (or reschedule) the refresh of a key, at the given time (epoch seconds)."""
+        self.refreshers[key] = refresh
+        generation = next(self.generations)
+        self.entries[key] = (dueAt, generation)
+        heapq.heappush(self.heap, (dueAt, generation, key))
+
+        # (discard stale entries, should cancellations outpace expiries)
+        if (len(self.heap) > 2 * len(self.entries) + 64):
+            self.heap = [(due, gen, k) for (due, gen, k) in self.heap if self.entries.get(k) == (due, gen)]
+            heapq.heapify(self.heap)
+        if (self.heap[0][1] == generation):
+            self.wakeup.set()  # (now the earliest; the scheduler must wake sooner)
+
+    def cancel(self, key: Hashable) -> None:
+        """Stop refreshing a key."""
+        self.entries.pop(key, None)
+        self.refreshers.pop(key, None)
+        self.failures.pop(key, None)
+
+    async def refreshNow(self, key: Hashable) -> bool:
+        """Refresh a key immediately (e.g. once its credentials are rejected). Returns whether it succeeded."""
+        if (key not in self.refreshers):
+            return False
+        self.onDemand += 1
+        return await self.startRefresh(key)
+
+    def startRefresh(self, key: Hashable) -> asyncio.Task[bool]:
+        """Start refreshing a key (joining the refresh already in flight, if any)."""
+        task = self.inFlight.get(key)
+        if (task is None):
+            task = asyncio.create_task(self.refresh(key))
+            self.inFlight[key] = task
+            task.add_done_callback(lambda _: self.inFlight.pop(key, None))
+        return task
+
+    async def refresh(self, key: Hashable) -> bool:
+        """Refresh a key, and reschedule it (retrying with backoff, on failure)."""
+        refresher = self.refreshers.get(key)
+        if (refresher is None):
+            return False
+        try:
+            dueAt = await refresher()
+        except Exception as e:
+            print(f'Error refreshing {key}: {e}')
+            self.failed += 1
+            self.failures[key] = self.failures.get(key, 0) + 1
+            if (key in self.refreshers):
+                delay = min(self.MAX_RETRY_DELAY, self.RETRY_DELAY * 2 ** (self.failures[key] - 1))
+                self.schedule(key, time.time() + delay, refresher)
+            return False
+
+        self.refreshed += 1
+        self.failures.pop(key, None)
+        if (dueAt is None):
+            self.cancel(key)
+        elif (key in self.refreshers):  # (unless cancelled whilst refreshing)
+            self.schedule(key, dueAt, refresher)
+        return True
+
+    async def run(self) -> None:
+        """Start each refresh as it falls due."""
+        while True:
+            self.wakeup.clear()
+            # (skip entries since rescheduled, or cancelled)
+            while (self.heap and self.entries.get(self.heap[0][2]) != self.heap[0][:2]):
+                heapq.heappop(self.heap)
+
+            if (not self.heap):
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - time.time()
+            if (delay > 0):
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            (_, _, key) = heapq.heappop(self.heap)
+            del self.entries[key]
+            self.startRefresh(key)
+
+    def start(self) -> None:
+        """Start the scheduler task."""
+        if (self.task is None):
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the scheduler task, and any refreshes in flight."""
+        tasks = [*self.inFlight.values(), *([self.task] if self.task is not None else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = None
+
+    def summary(self) -> dict[str, Any]:
+        """Return the scheduler statistics."""
+        return {
+            'scheduled': len(self.entries),
+            'inFlight': len(self.inFlight),
+            'refreshed': self.refreshed,
+            'failed': self.failed,
+            'onDemand': self.onDemand,
+            'nextDueIn': round(min(due for (due, _) in self.entries.values()) - time.time(), 1)
+            if self.entries else None,
+        }
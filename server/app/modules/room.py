@@ -0,0 +1,77 @@
+"""A single turntable hosted by the server."""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Final
+
+from app.APIs.MusicAPI.IMusicAPI import IMusicAPI
+from app.modules.eventStream import EventStream
+from app.modules.Hardware.IHardwareController import IHardwareController
+from app.modules.messageSchema import ClientMessage
+from app.modules.sessionManager import SessionContext, SessionManager
+from app.modules.stateManager import StateManager
+from app.modules.StateBus.IStateBus import IStateBus
+from app.modules.StateBus.scopedStateBus import ScopedStateBus
+from app.modules.websocketHandler import WebsocketHandler
+
+DEFAULT_ROOM: Final = 'default'
+
+
+class Room:
+    """
+    A single turntable hosted by the server.
+    Each room has its own state, sessions, playlist and websocket group;
+    the model, caches and HTTP clients are shared by all rooms.
+    """
+
+    def __init__(
+        self,
+        roomID: str,
+        stateBus: IStateBus,
+        handleCommand: Callable[[SessionContext, ClientMessage], Awaitable[None]],
+        createMusicAPI: Callable[[SessionManager, Any, Any], IMusicAPI],
+        hardwareController: IHardwareController | None = None,
+        heartbeatInterval: float = 15,
+        heartbeatTimeout: float = 45,
+    ) -> None:
+        """Initialise the room."""
+        self.roomID: Final = roomID
+        self.uploadFileName: Final = f'upload-{roomID}.png'
+        self.stateBus = ScopedStateBus(stateBus, roomID)
+        # serialises state modifications within the room (rooms do not contend with each other)
+        self.lock = asyncio.Lock()
+
+        self.sessionManager = SessionManager(self.stateBus, roomID)
+        self.websocketHandler = WebsocketHandler(
+            None,  # (the snapshot getter is bound below, once the state exists)
+            handleCommand,
+            stateBus=self.stateBus,
+            resolveSession=self.sessionManager.getSessionContext,
+            heartbeatInterval=heartbeatInterval,
+            heartbeatTimeout=heartbeatTimeout,
+        )
+        self.sessionManager.addDeleteListener(self.websocketHandler.closeSession)
+        self.musicAPI = createMusicAPI(self.sessionManager, self.websocketHandler.broadcast, self.resetState)
+        self.stateManager = StateManager(
+            self.websocketHandler,
+            hardwareController,
+            self.musicAPI.getProviderName(),
+            self.stateBus,
+        )
+        # (bound now that the state exists; no client can connect until the room is constructed)
+        self.eventStream = EventStream(self.stateManager.getSnapshot)
+        self.websocketHandler.getSnapshot = self.stateManager.getSnapshot
+        self.websocketHandler.eventStream = self.eventStream
+
+    def resetState(self) -> None:
+        """Reset the state of the room."""
+        self.stateManager.resetState()
+
+    def summary(self) -> dict[str, Any]:
+        """Return the room statistics."""
+        return {
+            'sessions': self.sessionManager.summary(),
+            'rateLimits': self.websocketHandler.rateLimiter.summary(),
+            'connections': self.websocketHandler.summary(),
+            'events': self.eventStream.summary(),
+            'musicAPI': self.musicAPI.summary(),
+        }
@@ -1,37 +1,197 @@
 """Handler class for the authentication sessions."""
 
-from typing import Final
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Final
 
 from fastapi import HTTPException
 
+from app.modules.StateBus.IStateBus import IStateBus
+from app.modules.StateBus.localStateBus import LocalStateBus
+
+
+@dataclass(frozen=True)
+class SessionContext:
+    """Per-connection view of a session, resolved once when the connection is opened."""
+    sessionID: str
+    userID: str | None
+    isHost: bool
+    roomID: str = 'default'
+
+
+# session lifetimes (seconds)
+IDLE_TTL: Final = 24 * 60 * 60  # since last activity
+ABSOLUTE_TTL: Final = 30 * 24 * 60 * 60  # since login
+MAX_SESSIONS: Final = 10_000  # beyond which, the least recently active sessions are evicted
+SWEEP_INTERVAL: Final = 60  # minimum time between expiry sweeps
+TOUCH_INTERVAL: Final = 60  # granularity of recorded activity (limits writes to the state bus)
+
 
 class SessionManager:
-    """Handler class for the authentication sessions."""
+    """
+    Handler class for the authentication sessions.
+    Sessions are held in the state bus, so are shared by all server workers.
+    Sessions expire after a period of inactivity, or a fixed lifetime; expired sessions are evicted lazily
+    (when accessed, and by sweeps as new sessions are created). Beyond a hard cap, the least recently
+    active sessions are evicted.
+    """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        stateBus: IStateBus | None = None,
+        roomID: str = 'default',
+        idleTTL: float = IDLE_TTL,
+        absoluteTTL: float = ABSOLUTE_TTL,
+        maxSessions: int = MAX_SESSIONS,
+    ) -> None:
         """Initialise the session handler."""
-        self.sessions: dict[str, dict[str, str | bool]] = {}
-        self.hostPlaylistID: str | None = None
-        self.hostUserID: str | None = None
+        self.stateBus: IStateBus = stateBus if stateBus is not None else LocalStateBus()
+        self.roomID = roomID
+        self.IDLE_TTL: Final = idleTTL
+        self.ABSOLUTE_TTL: Final = absoluteTTL
+        self.MAX_SESSIONS: Final = maxSessions
+
+        # sessionID -> last activity, least recently active first
+        # (this worker's view; reconciled with the state bus before evicting)
+        self.recency: OrderedDict[str, float] = OrderedDict(sorted(
+            ((sessionID, float(session.get('lastSeen', 0))) for (sessionID, session) in self.sessions.items()),
+            key=lambda item: item[1],
+        ))
+        self.lastSweep = time.time()
+        self.evicted: dict[str, int] = {'idle': 0, 'absolute': 0, 'capacity': 0}
+        # (notified of each deleted session ID, e.g. to stop refreshing its tokens)
+        self.deleteListeners: list[Callable[[str], None]] = []
+
+    @property
+    def sessions(self) -> dict[str, dict[str, str | bool]]:
+        """A copy of all sessions, keyed by session ID."""
+        return self.stateBus.items('sessions')
 
     def createSession(self, sessionID: str, isHost: bool) -> None:
         """Create a new session for the user."""
-        self.sessions[sessionID] = { 'isHost': isHost }
+        now = time.time()
+        self.stateBus.set('sessions', sessionID, { 'isHost': isHost, 'createdAt': now, 'lastSeen': now })
+        self.recency[sessionID] = now
+        self.recency.move_to_end(sessionID)
+        if (isHost):
+            # (one entry per session, so workers creating host sessions concurrently never overwrite each other's)
+            self.stateBus.set('hostSessions', sessionID, now)
+
+        # lazily sweep expired sessions, and enforce the cap
+        if (now - self.lastSweep >= SWEEP_INTERVAL):
+            self.evictExpired()
+        while (len(self.recency) > self.MAX_SESSIONS):
+            self.evictLeastRecent()
 
     def deleteSession(self, sessionID: str) -> None:
         """Delete the session for the user."""
-        self.sessions.pop(sessionID, None)
+        self.stateBus.delete('sessions', sessionID)
+        self.recency.pop(sessionID, None)
+        self.stateBus.delete('hostSessions', sessionID)
+        for listener in self.deleteListeners:
+            listener(sessionID)
+
+    def addDeleteListener(self, listener: Callable[[str], None]) -> None:
+        """Register a callback, for each session deleted (or evicted) by this worker."""
+        self.deleteListeners.append(listener)
 
     def getSession(self, sessionID: str) -> dict[str, str | bool]:
-        """Get the session for the user."""
-        return self.sessions.get(sessionID, {})
+        """Get the session for the user (empty, if it does not exist or has expired)."""
+        session = self.stateBus.get('sessions', sessionID)
+        if (not isinstance(session, dict) or not session):
+            return {}
+        reason = self.getExpiry(session, time.time())
+        if (reason is not None):
+            self.evict(sessionID, reason)
+            return {}
+        return session
+
+    def getExpiry(self, session: dict[str, Any], now: float) -> str | None:
+        """Return the reason the session has expired, if it has."""
+        if (now - float(session.get('createdAt', now)) > self.ABSOLUTE_TTL):
+            return 'absolute'
+        if (now - float(session.get('lastSeen', now)) > self.IDLE_TTL):
+            return 'idle'
+        return None
+
+    def touchSession(self, sessionID: str) -> None:
+        """Record activity on the session."""
+        session = self.getSession(sessionID)
+        if (not session):
+            return
+        now = time.time()
+        self.recency[sessionID] = now
+        self.recency.move_to_end(sessionID)
+        if (now - float(session.get('lastSeen', 0)) >= TOUCH_INTERVAL):
+            self.stateBus.set('sessions', sessionID, {**session, 'lastSeen': now})
 
-    def updateSession(self, sessionID: str, values: dict[str, str]) -> None:
+    def evict(self, sessionID: str, reason: str) -> None:
+        """Remove an expired (or excess) session."""
+        self.deleteSession(sessionID)
+        self.evicted[reason] += 1
+        print(f"Session '{sessionID}' evicted ({reason}).")
+
+    def evictExpired(self) -> int:
+        """Evict sessions which have been idle for too long. Returns the number evicted."""
+        now = time.time()
+        self.lastSweep = now
+        evicted = 0
+        # (least recently active first, so stop at the first active session)
+        while (self.recency):
+            (sessionID, lastSeen) = next(iter(self.recency.items()))
+            if (now - lastSeen <= self.IDLE_TTL):
+                break
+            if (not self.reconcile(sessionID)):
+                continue
+            session = self.stateBus.get('sessions', sessionID) or {}
+            self.evict(sessionID, self.getExpiry(session, now) or 'idle')
+            evicted += 1
+        return evicted
+
+    def evictLeastRecent(self) -> None:
+        """Evict the least recently active session."""
+        while (self.recency):
+            sessionID = next(iter(self.recency))
+            if (self.reconcile(sessionID)):
+                self.evict(sessionID, 'capacity')
+                return
+
+    def reconcile(self, sessionID: str) -> bool:
+        """
+        Reconcile the least recently active session with the state bus, as other workers may have used it.
+        Returns True if it is still the least recently active.
+        """
+        session = self.stateBus.get('sessions', sessionID)
+        if (not session):
+            self.recency.pop(sessionID, None)  # already deleted
+            return False
+        lastSeen = float(session.get('lastSeen', 0))
+        if (lastSeen > self.recency[sessionID]):
+            self.recency[sessionID] = lastSeen
+            self.recency.move_to_end(sessionID)
+            return False
+        return True
+
+    def getSessionContext(self, sessionID: str) -> SessionContext | None:
+        """Resolve the session into a context, for the lifetime of a connection."""
+        self.touchSession(sessionID)
+        session = self.getSession(sessionID)
+        if (not session):
+            return None
+        userID = session.get('userID')
+        return SessionContext(
+            sessionID=sessionID,
+            userID=str(userID) if userID is not None else None,
+            isHost=bool(session.get('isHost', False)),
+            roomID=self.roomID,
+        )
+
+    def updateSession(self, sessionID: str, values: dict[str, Any]) -> None:
         """Update the session for the user."""
         session = self.getSession(sessionID)
         if (session):
-            for (key, value) in values.items():
-                self.sessions[sessionID][key] = value
+            self.stateBus.set('sessions', sessionID, {**session, **values})
 
         if (session.get('isHost')):
             if (values.get('userID')):
@@ -39,33 +199,45 @@ class SessionManager:
 
     def setHostPlaylistID(self, hostPlaylistID: str | None) -> None:
         """Setter for hostPlaylistID"""
-        self.hostPlaylistID = hostPlaylistID
+        self.stateBus.set('host', 'playlistID', hostPlaylistID)
 
     def getHostPlaylistID(self) -> str | None:
         """Getter for hostPlaylistID"""
-        return self.hostPlaylistID
+        hostPlaylistID = self.stateBus.get('host', 'playlistID')
+        return hostPlaylistID if isinstance(hostPlaylistID, str) else None
 
     def setHostUserID(self, hostUserID: str) -> None:
         """Setter for hostUserID"""
-        self.hostUserID = hostUserID
+        self.stateBus.set('host', 'userID', hostUserID)
 
     def getHostUserID(self) -> str | None:
         """Getter for hostUserID"""
-        return self.hostUserID
+        hostUserID = self.stateBus.get('host', 'userID')
+        return hostUserID if isinstance(hostUserID, str) else None
+
+    def getHostSessionIDs(self) -> list[str]:
+        """Return the IDs of the host sessions (oldest first)."""
+        hostSessions = self.stateBus.items('hostSessions')
+        return sorted(hostSessions, key=lambda hostID: hostSessions[hostID])
+
+    def getHostSessionID(self) -> str | None:
+        """Return the ID of the current (oldest live) host session."""
+        for sessionID in self.getHostSessionIDs():
+            if (self.getSession(sessionID)):
+                return sessionID
+        return None
 
     def getHostToken(self) -> str | None:
         """Return the access token for the host."""
-        hostToken = None
-        for session in self.sessions.values():
-            if (session and session.get('isHost')):
-                token = session.get('accessToken')
-                if (token is not None):
-                    hostToken = str(token)
-                break
-        return hostToken
+        sessionID = self.getHostSessionID()
+        if (sessionID is None):
+            return None
+        token = self.getSession(sessionID).get('accessToken')
+        return str(token) if token is not None else None
 
     def getToken(self, sessionID: str) -> str:
         """Return the access token."""
+        self.touchSession(sessionID)
         SESSION: Final = self.getSession(sessionID)
         if (SESSION):
             ACCESS_TOKEN: Final = SESSION.get('accessToken', None)
@@ -75,4 +247,11 @@ class SessionManager:
             return str(ACCESS_TOKEN)
         else:
             print(f"Session '{sessionID}' not found.")
-            raise HTTPException(status_code=401, detail='Invalid session.')
\ No newline at end of file
+            raise HTTPException(status_code=401, detail='Invalid session.')
+
+    def summary(self) -> dict[str, Any]:
+        """Return the session statistics."""
+        return {
+            'sessions': len(self.recency),
+            'evicted': dict(self.evicted),
+        }
@@ -1,52 +1,115 @@
 """This file contains the StateManager class, which is responsible for managing the state of the application."""
 
-from typing import Any
+import copy
+from typing import Any, Final
 
 from app.enums.StateKeys import Commands, StateKeys
 from app.modules.Hardware.piController import PiController
 from app.modules.websocketHandler import WebsocketHandler
 from app.modules.Hardware.IHardwareController import IHardwareController
+from app.modules.messageCodec import DEFAULT_CODEC, MessageCodec
+from app.modules.StateBus.IStateBus import IStateBus
+from app.modules.StateBus.localStateBus import LocalStateBus
+
+DEFAULT_STATE: Final[dict[str, bool | dict[str, bool | int]]] = {
+    'playState': False,
+    'settings': {
+        'enableMotor': True,
+        'enableRemote': True,
+        'enforceSignature': True,
+        'volume': 50,
+    },
+}
 
 
 class StateManager:
     """
     StateManager class is responsible for managing the state of the application.
     Utilises an observer paattern to notify clients of state changes, allowing real-time reactivity.
-    Uses a dictionary to store the state of the application.
+    Uses a dictionary to store the state of the application,
+    mirrored in the state bus so that all server workers share it.
     """
 
     def __init__(self,
         websocketHandler: WebsocketHandler,
         hardwareController: IHardwareController | None,
         provider: str | None,
+        stateBus: IStateBus | None = None,
     ) -> None:
         """Initialise the StateManager class."""
-        self.__state: dict[str, bool | dict[str, bool | int]] = {
-            'playState': False,
-            'settings': {
-                'enableMotor': True,
-                'enableRemote': True,
-                'enforceSignature': True,
-                'volume': 50,
-            },
-        }
+        self.stateBus: IStateBus = stateBus if stateBus is not None else LocalStateBus()
+        # resume the shared state (e.g. set by another worker), if any
+        self.__state: dict[str, bool | dict[str, bool | int]] = self.stateBus.items('state')
+        if (not self.__state):
+            self.__state = copy.deepcopy(DEFAULT_STATE)
+            for (key, value) in self.__state.items():
+                self.stateBus.set('state', key, value)
+        self.stateBus.subscribe('state', self.applyRemoteState)
+
         self.websocketHandler = websocketHandler
         self.hardwareController = hardwareController
         self.provider = provider
 
+        # snapshot of the state, sent to newly-connected clients
+        # (built once per state version, and cached until the next mutation)
+        self.version = 0
+        self.__snapshots: dict[str, str | bytes] = {}  # per wire format
+
     def getState(self) -> dict[str, bool | dict[str, bool | int]]:
         """Return the current state of the application."""
         return self.__state
 
+    def getSnapshot(self, codec: MessageCodec = DEFAULT_CODEC) -> str | bytes:
+        """Return the encoded snapshot of the current state."""
+        snapshot = self.__snapshots.get(codec.NAME)
+        if (snapshot is None):
+            snapshot = self.__snapshots[codec.NAME] = codec.encode({
+                'command': Commands.SNAPSHOT.value,
+                'version': self.version,
+                'value': self.__state,
+                'provider': self.provider,
+            })
+        return snapshot
+
+    def invalidateSnapshot(self) -> None:
+        """Mark the state as modified, discarding the cached snapshots."""
+        self.version += 1
+        self.__snapshots = {}
+
     async def updateState(self, key: StateKeys, value: Any) -> None:
         """TODO"""
         if (self.__state.get(key.value) == value):
             # non-update, can be ignored
             return
         self.__state[key.value] = value
+        self.invalidateSnapshot()
+        self.stateBus.set('state', key.value, value)
+        self.stateBus.publish('state', {'key': key.value, 'value': value})
 
         # react to state change
-        # manage hardware broadcasts
+        self.reactToState(key, value)
+
+        # manage software broadcasts
+        if (key in [StateKeys.PLAY_STATE, StateKeys.CURRENT_TRACK, StateKeys.SETTINGS]):
+            await self.websocketHandler.broadcast(
+                {'command': key.value, 'value': value, 'provider': self.provider }
+            )
+
+    async def applyRemoteState(self, message: dict[str, Any]) -> None:
+        """Apply a state change made by another worker (which also broadcasts it to clients)."""
+        if (message.get('reset')):
+            self.__state = copy.deepcopy(DEFAULT_STATE)
+            self.invalidateSnapshot()
+            self.resetHardware()
+            return
+
+        key = StateKeys(message['key'])
+        self.__state[key.value] = message['value']
+        self.invalidateSnapshot()
+        self.reactToState(key, message['value'])
+
+    def reactToState(self, key: StateKeys, value: Any) -> None:
+        """Update the hardware to reflect a state change."""
         if (self.hardwareController is not None):
             if (key == StateKeys.SETTINGS):
                 if (value.get('enableMotor', False)):
@@ -61,23 +124,19 @@ class StateManager:
             elif (key == Commands.REWIND):
                 self.hardwareController.setMotorState(-1)
 
-        # manage software broadcasts
-        if (key in [StateKeys.PLAY_STATE, StateKeys.CURRENT_TRACK, StateKeys.SETTINGS]):
-            await self.websocketHandler.broadcast(
-                {'command': key.value, 'value': value, 'provider': self.provider }
-            )
-
     def resetState(self) -> None:
         """Reset the state of the application."""
-        self.__state = {
-            'playState': False,
-            'settings': {
-                'enableMotor': True,
-                'enableRemote': True,
-                'enforceSignature': True,
-                'volume': 50,
-            },
-        }
+        self.__state = copy.deepcopy(DEFAULT_STATE)
+        self.invalidateSnapshot()
+        for key in self.stateBus.items('state'):
+            self.stateBus.delete('state', key)
+        for (key, value) in self.__state.items():
+            self.stateBus.set('state', key, value)
+        self.stateBus.publish('state', {'reset': True})
+        self.resetHardware()
+
+    def resetHardware(self) -> None:
+        """Return the hardware to its default state."""
         if (self.hardwareController is not None):
             self.hardwareController.setMotorSpeed(100)
             self.hardwareController.setMotorState(0)
@@ -0,0 +1,80 @@
+"""Expiring cache, persisted in the state bus."""
+import json
+import time
+from typing import Any, Final
+
+from app.modules.StateBus.IStateBus import IStateBus
+
+SWEEP_INTERVAL: Final = 256  # values cached between sweeps
+
+
+def cacheKey(value: Any) -> str:
+    """Return a stable cache key for a JSON-serialisable value (e.g. a manifest entry)."""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+class TTLCache:
+    """
+    Expiring cache, persisted in the state bus.
+    Entries survive restarts (with a persistent bus), and are shared by server workers (with a shared bus).
+    Expired entries are removed when read, and swept periodically (with those expiring soonest, once over the cap),
+    so entries that are never read again do not accumulate.
+    """
+
+    def __init__(self, stateBus: IStateBus, namespace: str, ttl: float, maxEntries: int = 10_000) -> None:
+        """Initialise the cache, sweeping any entries that expired whilst the server was stopped."""
+        self.stateBus = stateBus
+        self.NAMESPACE: Final = namespace
+        self.TTL: Final = ttl  # seconds
+        self.MAX_ENTRIES: Final = maxEntries
+        self.sets = 0
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.sweep()
+
+    def get(self, key: str) -> Any:
+        """Return the cached value (None if not cached, or expired)."""
+        entry = self.stateBus.get(self.NAMESPACE, key)
+        if (entry is None or entry['expires'] < time.time()):
+            if (entry is not None):
+                self.stateBus.delete(self.NAMESPACE, key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['value']
+
+    def set(self, key: str, value: Any) -> None:
+        """Cache a value, until the TTL expires."""
+        self.stateBus.set(self.NAMESPACE, key, {'value': value, 'expires': time.time() + self.TTL})
+        self.sets += 1
+        if (self.sets % SWEEP_INTERVAL == 0):
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Remove the expired entries, and those expiring soonest whilst over the cap. Returns the number removed."""
+        now = time.time()
+        entries = sorted(
+            (entry['expires'], key) for (key, entry) in self.stateBus.items(self.NAMESPACE).items()
+        )
+        excess = max(0, len(entries) - self.MAX_ENTRIES)
+        removed = 0
+        for (i, (expires, key)) in enumerate(entries):
+            if (expires >= now and i >= excess):
+                break
+            self.stateBus.delete(self.NAMESPACE, key)
+            removed += 1
+        self.evictions += removed
+        return removed
+
+    def summary(self) -> dict[str, Any]:
+        """Return the cache statistics."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRatio': round(self.hits / (self.hits + self.misses), 3) if (self.hits + self.misses) else 0,
+        }
@@ -1,100 +1,313 @@
 """Handler class for WebSocket connections."""
 
-import json
-from typing import Any, List, Optional
+import asyncio
+import time
+from typing import Any, Callable, List, Optional
 
-from app.enums.StateKeys import StateKeys
-from fastapi import HTTPException, WebSocket
+from fastapi import WebSocket
 from fastapi.websockets import WebSocketState
 
+from app.enums.StateKeys import Commands
+from app.modules.eventStream import EventStream
+from app.modules.messageCodec import MessageCodec, negotiateCodec
+from app.modules.metrics import TimingStats
+from app.modules.rateLimiter import COMMAND_CLASSES, RateLimiter
+from app.modules.sessionManager import SessionContext
+from app.modules.StateBus.IStateBus import IStateBus
+
 
 class WebsocketHandler:
     """Handler class for WebSocket connections."""
 
-    def __init__(self, getState: Any, handleCommand: Any) -> None:
+    def __init__(
+        self,
+        getSnapshot: Callable[[MessageCodec], str | bytes] | None,
+        handleCommand: Any,
+        rateLimiter: RateLimiter | None = None,
+        eventStream: EventStream | None = None,
+        stateBus: IStateBus | None = None,
+        resolveSession: Callable[[str], SessionContext | None] | None = None,
+        heartbeatInterval: float = 15,
+        heartbeatTimeout: float = 45,
+        sendTimeout: float = 5,
+    ) -> None:
         """Initialise the WebSocket handler."""
         self.activeMainSocket: Optional[WebSocket] = None
         self.activeSideSockets: List[WebSocket] = []
+        # wire format negotiated by each connection
+        self.codecs: dict[WebSocket, MessageCodec] = {}
 
-        self.getState = getState
+        self.getSnapshot = getSnapshot  # (None until bound, e.g. by a room once its state exists)
         self.handleCommand = handleCommand
+        self.rateLimiter = rateLimiter if rateLimiter is not None else RateLimiter()
+        self.eventStream = eventStream  # read-only viewers
+        # (re-resolves a connection's session before each command, as it may since have been deleted or replaced)
+        self.resolveSession = resolveSession
+        self.sessionIDs: dict[WebSocket, str] = {}  # connection -> session ID
 
-    async def handleConnection(
-        self, websocket: WebSocket, sessionID: str, isMain: bool
-    ) -> None:
+        # relay messages for clients connected to other server workers
+        self.stateBus = stateBus
+        if (self.stateBus is not None):
+            self.stateBus.subscribe('broadcast', self.deliverBroadcast)
+            self.stateBus.subscribe('host', self.deliverToHost)
+
+        # liveness
+        self.HEARTBEAT_INTERVAL = heartbeatInterval
+        self.HEARTBEAT_TIMEOUT = heartbeatTimeout
+        self.SEND_TIMEOUT = sendTimeout
+        self.heartbeatTask: asyncio.Task[None] | None = None
+        self.lastSeen: dict[WebSocket, float] = {}
+        self.connectedAt: dict[WebSocket, tuple[float, str]] = {}  # (time, role)
+        self.receivingTasks: dict[WebSocket, asyncio.Task[Any]] = {}  # connections awaiting a frame
+
+        # statistics
+        self.opened = 0
+        self.reaped = 0
+        self.lifetimes = TimingStats()  # keyed by client role
+        self.pingTimings = TimingStats()
+
+    async def handleConnection(self, websocket: WebSocket, session: SessionContext) -> None:
         """Handle a WebSocket connection request."""
+        isMain = session.isHost
+        codec, subprotocol = negotiateCodec(websocket.scope.get('subprotocols', []))
+        self.codecs[websocket] = codec
+        self.sessionIDs[websocket] = session.sessionID
 
         if (isMain):
             # override existing connections
             self.activeMainSocket = websocket
         else:
             self.activeSideSockets.append(websocket)
-        await websocket.accept()
-        print(f'Client connected. ({sessionID})')
+        self.trackConnection(websocket, 'host' if isMain else 'side')
+        await websocket.accept(subprotocol=subprotocol)
+        print(f'Client connected. ({session.sessionID}, {codec.NAME})')
 
-        # initial information batch
-        currentState = self.getState()
-        if (currentState):
-            for key, value in currentState.items():
-                await websocket.send_text(json.dumps({'command': key, 'value': value}))
+        # initial information batch (single, pre-encoded snapshot frame)
+        snapshot = self.getSnapshot(codec) if self.getSnapshot is not None else None
+        if (snapshot):
+            await codec.send(websocket, snapshot)
 
+        lastThrottleNotices: dict[str, float] = {}  # command class -> time of last notice
+        closeCode = 1000
         try:
             # monitor the connection
-            while (websocket.client_state != WebSocketState.DISCONNECTED):
-                request = await websocket.receive_text()
+            while (websocket in self.connectedAt and websocket.client_state != WebSocketState.DISCONNECTED):
+                task = asyncio.current_task()
+                if (task is not None):
+                    self.receivingTasks[websocket] = task
+                try:
+                    request = await codec.receive(websocket)
+                finally:
+                    self.receivingTasks.pop(websocket, None)
+                self.lastSeen[websocket] = time.monotonic()
                 # if (isMain):
                     # cache data
 
-                data = json.loads(request)
-                command = data.get('command')
-                if (command is not None):
-                    print(
-                        f'{websocket.client} [{"HOST" if isMain else "SIDE"}]:', command
-                    )
-                    await self.handleCommand(sessionID, command, data.get('value'))
-                else:
-                    print(
-                        f'{websocket.client} [{"HOST" if isMain else "SIDE"}]:',
-                        request,
-                    )
+                try:
+                    message = codec.decodeMessage(request)
+                except ValueError:
+                    # malformed, or unknown command (ValidationError is a ValueError)
+                    print(f'{websocket.client} [{"HOST" if isMain else "SIDE"}]:', request)
+                    continue
+
+                if (message.command == Commands.PONG.value):
+                    # heartbeat response
+                    if (message.value is not None):
+                        self.pingTimings.record('roundTrip', time.monotonic() - message.value)
+                    continue
+
+                # (the session may have been deleted, expired or evicted, or its host replaced, since connecting)
+                if (self.resolveSession is not None):
+                    currentSession = self.resolveSession(session.sessionID)
+                    if (currentSession is None or currentSession.isHost != isMain):
+                        print(f'{websocket.client} [{"HOST" if isMain else "SIDE"}]: session ended')
+                        closeCode = 4001
+                        break
+                    session = currentSession
+
+                retryAfter = self.rateLimiter.check(session, message.command)
+                if (retryAfter is not None):
+                    # throttled; notify the client (at most once a second, per command class)
+                    commandClass = COMMAND_CLASSES[message.command]
+                    now = time.monotonic()
+                    if (now - lastThrottleNotices.get(commandClass, 0) >= 1):
+                        lastThrottleNotices[commandClass] = now
+                        print(f'{websocket.client} [{"HOST" if isMain else "SIDE"}]: throttled', message.command)
+                        await self.sendToSocket(websocket, {
+                            'command': Commands.THROTTLED.value,
+                            'value': {'command': message.command, 'retryAfter': round(retryAfter, 2)},
+                        })
+                    continue
 
+                print(f'{websocket.client} [{"HOST" if isMain else "SIDE"}]:', message.command)
+                await self.handleCommand(session, message)
+
+        except asyncio.CancelledError:
+            if (websocket in self.connectedAt):
+                raise  # not reaped; propagate genuine cancellations
         except Exception as e:
             print(f'Error: {e}')
         finally:
             try:
-                await websocket.close()
+                await websocket.close(code=closeCode)
             except Exception as e:
                 pass  # connection is already closed
 
             # cleanup
-            if (isMain):
-                self.activeMainSocket = None
-            else:
-                self.activeSideSockets.remove(websocket)
+            self.untrackConnection(websocket)
+            self.rateLimiter.prune()
             print('Client disconnected.')
 
-    async def sendToHost(self, data: dict[str, str]) -> None:
-        """Send a message to the host client."""
+    def trackConnection(self, websocket: WebSocket, role: str) -> None:
+        """Start monitoring the liveness of a new connection."""
+        now = time.monotonic()
+        self.connectedAt[websocket] = (now, role)
+        self.lastSeen[websocket] = now
+        self.opened += 1
+
+        if (self.heartbeatTask is None or self.heartbeatTask.done()):
+            self.heartbeatTask = asyncio.create_task(self.heartbeat())
+
+    def untrackConnection(self, websocket: WebSocket) -> bool:
+        """Remove a connection from the fan-out lists. Returns False if it was already removed."""
+        if (self.activeMainSocket is websocket):
+            self.activeMainSocket = None
+        if (websocket in self.activeSideSockets):
+            self.activeSideSockets.remove(websocket)
+        self.codecs.pop(websocket, None)
+        self.sessionIDs.pop(websocket, None)
+        self.lastSeen.pop(websocket, None)
+
+        connection = self.connectedAt.pop(websocket, None)
+        if (connection is None):
+            return False
+        (connectedAt, role) = connection
+        self.lifetimes.record(role, time.monotonic() - connectedAt)
+        return True
+
+    async def reap(self, websocket: WebSocket, reason: str) -> None:
+        """Drop an unresponsive connection."""
+        task = self.receivingTasks.get(websocket)
+        if (not self.untrackConnection(websocket)):
+            return
+        self.reaped += 1
+        print(f'Reaped {websocket.client} ({reason}).')
+
+        # stop the connection's receive loop (which may be stuck on a half-open socket)
+        # (connections part-way through handling a command instead exit once it completes)
+        if (task is not None and task is not asyncio.current_task()):
+            task.cancel()
+        try:
+            await asyncio.wait_for(websocket.close(code=1001), self.SEND_TIMEOUT)
+        except Exception:
+            pass  # connection is already dead
+
+    def closeSession(self, sessionID: str) -> None:
+        """Disconnect the connections of a deleted session (so it cannot keep sending commands)."""
+        for (websocket, connectionSessionID) in list(self.sessionIDs.items()):
+            if (connectionSessionID == sessionID):
+                asyncio.create_task(self.reap(websocket, 'session ended'))
+
+    async def heartbeat(self) -> None:
+        """Periodically ping all clients, reaping those which have stopped responding."""
+        while (self.connectedAt):
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+            await self.ping()
+
+    async def ping(self) -> dict[str, int]:
+        """Reap unresponsive clients, and send a heartbeat ping to the rest."""
+        now = time.monotonic()
+        sockets = self.getSockets()
+        reapedBefore = self.reaped
+
+        for websocket in [socket for socket in sockets if now - self.lastSeen.get(socket, now) > self.HEARTBEAT_TIMEOUT]:
+            await self.reap(websocket, 'heartbeat timeout')
+
+        # (clients echo the value in their pong, to measure round-trip time)
+        await self.fanOut(self.getSockets(), {'command': Commands.PING.value, 'value': now})
+        return {
+            'clients': len(self.getSockets()),
+            'reaped': self.reaped - reapedBefore,
+        }
+
+    def getSockets(self) -> list[WebSocket]:
+        """Return all active connections."""
+        sockets = list(self.activeSideSockets)
+        if (self.activeMainSocket is not None):
+            sockets.append(self.activeMainSocket)
+        return sockets
+
+    async def sendToSocket(
+        self, websocket: WebSocket, data: dict[str, Any], frames: dict[str, str | bytes] | None = None
+    ) -> bool:
+        """
+        Send a message to a single client, in its negotiated wire format.
+        Encoded frames are memoised in `frames`, so a message is encoded at most once per format.
+        Clients which cannot be sent to within the timeout are reaped.
+        """
+        codec = self.codecs.get(websocket)
+        if (codec is None):
+            codec, _ = negotiateCodec([])
+        if (frames is None):
+            frames = {}
+
+        frame = frames.get(codec.NAME)
+        if (frame is None):
+            frame = frames[codec.NAME] = codec.encode(data)
+        try:
+            await asyncio.wait_for(codec.send(websocket, frame), self.SEND_TIMEOUT)
+            return True
+        except Exception as e:
+            await self.reap(websocket, f'send failed: {e!r}')
+            return False
+
+    async def fanOut(
+        self, sockets: list[WebSocket], data: dict[str, Any], frames: dict[str, str | bytes] | None = None
+    ) -> None:
+        """Send a message to many clients concurrently, so one slow client cannot hold up the rest."""
+        if (frames is None):
+            frames = {}
+        await asyncio.gather(*(self.sendToSocket(websocket, data, frames) for websocket in sockets))
+
+    async def sendToHost(self, data: dict[str, Any], frames: dict[str, str | bytes] | None = None) -> None:
+        """Send a message to the host client (which may be connected to another server worker)."""
         # send to main socket
         if (self.activeMainSocket is not None):
-            await self.activeMainSocket.send_json(data)
+            await self.sendToSocket(self.activeMainSocket, data, frames)
+        elif (self.stateBus is not None):
+            self.stateBus.publish('host', data)
 
-    async def sentToClients(self, data: dict[str, str]) -> None:
+    async def deliverToHost(self, data: dict[str, Any]) -> None:
+        """Send a message from another server worker to the host client, if connected to this worker."""
+        if (self.activeMainSocket is not None):
+            await self.sendToSocket(self.activeMainSocket, data)
+
+    async def sentToClients(self, data: dict[str, Any], frames: dict[str, str | bytes] | None = None) -> None:
         """Send a message to the other clients."""
         # broadcast to side sockets
-        for websocket in self.activeSideSockets:
-            await websocket.send_json(data)
+        await self.fanOut(list(self.activeSideSockets), data, frames)
 
-    async def broadcast(self, data: dict[str, str]) -> None:
-        """Send a message to the all connected clients."""
-        await self.sendToHost(data)
-        await self.sentToClients(data)
-        print('Broadcast', data.get('command'))
+    async def broadcast(self, data: dict[str, Any]) -> None:
+        """Send a message to the all connected clients (including those of other server workers)."""
+        if (self.stateBus is not None):
+            self.stateBus.publish('broadcast', data)
+        await self.deliverBroadcast(data)
 
-    async def ping(self) -> dict[str, str]:
-        """DEV! This endpoint triggers a ping event to the client, from the server."""
-        if (len(self.activeSideSockets) == 0):
-            raise HTTPException(status_code=400, detail='No client connected.')
+    async def deliverBroadcast(self, data: dict[str, Any]) -> None:
+        """Send a message to all clients connected to this server worker."""
+        if (self.eventStream is not None):
+            self.eventStream.publish(data)
+        frames: dict[str, str | bytes] = {}
+        await self.fanOut(self.getSockets(), data, frames)
+        print('Broadcast', data.get('command'))
 
-        await self.broadcast({'message': 'ping'})
-        return {'message': 'ping'}
+    def summary(self) -> dict[str, Any]:
+        """Return the connection statistics."""
+        return {
+            'hostConnected': self.activeMainSocket is not None,
+            'sideConnections': len(self.activeSideSockets),
+            'opened': self.opened,
+            'reaped': self.reaped,
+            'lifetimes': self.lifetimes.summary(),
+            'ping': self.pingTimings.summary().get('roundTrip'),
+        }
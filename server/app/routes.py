@@ -5,8 +5,10 @@ import os
 from typing import Final, TYPE_CHECKING
 
 from fastapi import Cookie, FastAPI, HTTPException, Request, WebSocket
-from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
 
+from app.modules.labelCache import LABEL_MIME_TYPE
+from app.modules.room import DEFAULT_ROOM
 from app.utils import isHostIP
 
 if (TYPE_CHECKING):
@@ -40,8 +42,29 @@ def setupRoutes(server: 'Server') -> None:
 
     @app.get('/ping')
     async def ping() -> JSONResponse:
-        """DEV! This endpoint triggers a ping event to the client, from the server."""
-        return JSONResponse(await server.websocketHandler.ping())
+        """This endpoint triggers an immediate heartbeat (in every room), reaping any unresponsive clients."""
+        return JSONResponse({
+            roomID: await room.websocketHandler.ping() for (roomID, room) in server.rooms.items()
+        })
+
+    @app.get('/metrics')
+    async def metrics() -> JSONResponse:
+        """Performance metrics of the server."""
+        return JSONResponse(content={
+            'commands': server.commandTimings.summary(),
+            'scans': server.scanTimings.summary(),
+            'background': server.backgroundTasks.summary(),
+            'stateBus': server.stateBus.summary(),
+            'http': server.httpClient.summary(),
+            'tokenRefresh': server.tokenScheduler.summary(),
+            'centreLabels': server.centreLabelhandler.summary(),
+            'caches': {
+                'albumIDs': server.albumCache.summary(),
+                'discogsReleases': server.releaseCache.summary(),
+                'centreLabels': server.labelCache.summary(),
+            },
+            'rooms': {roomID: room.summary() for (roomID, room) in server.rooms.items()},
+        })
 
     authRoutes(server)
     websocketRoutes(server)
@@ -54,33 +77,38 @@ def authRoutes(server: 'Server') -> None:
     app: FastAPI = server.app
 
     @app.get('/auth/login')
-    async def login(request: Request) -> RedirectResponse:
+    async def login(request: Request, room: str | None = None, roomID: str = Cookie(None)) -> RedirectResponse:
         if (request.headers.get('x-forwarded-for')):
             clientIP = request.headers['x-forwarded-for']
         else:
             clientIP = request.client.host
 
+        # join the requested room (else, remain in the current one)
+        ROOM: Final = server.getRoom(room or roomID)
         isHost = isHostIP(clientIP)
-        return await server.musicAPI.login(isHost)
+        response = await ROOM.musicAPI.login(isHost)
+        response.set_cookie(key='roomID', value=ROOM.roomID, httponly=True, secure=False, samesite='lax')
+        return response
 
     @app.get('/auth/callback')
-    async def callback(request: Request) -> RedirectResponse:
+    async def callback(request: Request, roomID: str = Cookie(None)) -> RedirectResponse:
         SESSION_ID: Final = request.query_params.get('state')
-        RESPONSE: Final = await server.musicAPI.callback(request, SESSION_ID)
+        RESPONSE: Final = await server.getRoom(roomID).musicAPI.callback(request, SESSION_ID)
         return RESPONSE
 
     @app.get('/auth/token')
-    async def token(sessionID: str = Cookie(None)) -> JSONResponse:
+    async def token(sessionID: str = Cookie(None), roomID: str = Cookie(None)) -> JSONResponse:
         if (not sessionID):
             raise HTTPException(status_code=400, detail='No session ID provided.')
+        ROOM: Final = server.getRoom(roomID)
         return JSONResponse({
-            'accessToken': server.sessionManager.getToken(sessionID),
-            'provider': server.musicAPI.getProviderName(),
+            'accessToken': ROOM.sessionManager.getToken(sessionID),
+            'provider': ROOM.musicAPI.getProviderName(),
         })
 
     @app.get('/auth/logout')
-    async def logout(sessionID: str = Cookie(None)) -> RedirectResponse:
-        server.sessionManager.deleteSession(sessionID)
+    async def logout(sessionID: str = Cookie(None), roomID: str = Cookie(None)) -> RedirectResponse:
+        server.getRoom(roomID).sessionManager.deleteSession(sessionID)
         return RedirectResponse(url='/')
 
 
@@ -94,7 +122,8 @@ def servingRoutes(server: 'Server', allowedTracks: dict[str, str]) -> None:
         """
         This endpoint serves the camera capture.
         """
-        if (not server.sessionManager.getSession(sessionID).get('isHost', False)):
+        # (the camera belongs to the hardware's room)
+        if (not server.hardwareRoom.sessionManager.getSession(sessionID).get('isHost', False)):
             raise HTTPException(403, 'Unauthorised')
 
         data = None
@@ -109,15 +138,16 @@ def servingRoutes(server: 'Server', allowedTracks: dict[str, str]) -> None:
         return JSONResponse(content=response)
 
     @app.get('/upload')
-    async def uploadGet(sessionID: str = Cookie(None)) -> JSONResponse:
+    async def uploadGet(sessionID: str = Cookie(None), roomID: str = Cookie(None)) -> JSONResponse:
         """
         This endpoint serves the camera capture.
         """
-        if (not server.sessionManager.getSession(sessionID).get('isHost', False)):
+        ROOM: Final = server.getRoom(roomID)
+        if (not ROOM.sessionManager.getSession(sessionID).get('isHost', False)):
             raise HTTPException(403, 'Unauthorised')
 
         data = None
-        filePath = os.path.join(server.ROOT_DIR, 'data', 'upload.png')
+        filePath = os.path.join(server.ROOT_DIR, 'data', ROOM.uploadFileName)
         if (os.path.exists(filePath)):
             with open(filePath, 'rb') as labelFile:
                 data = base64.b64encode(labelFile.read()).decode('utf-8')
@@ -138,36 +168,38 @@ def servingRoutes(server: 'Server', allowedTracks: dict[str, str]) -> None:
         return JSONResponse(content={ 'clientIP': proxiedIP, 'isHost': isHostIP(proxiedIP) })
 
     @app.get('/playlist')
-    async def playlistIDGet(sessionID: str = Cookie(None)) -> JSONResponse:
+    async def playlistIDGet(sessionID: str = Cookie(None), roomID: str = Cookie(None)) -> JSONResponse:
         """
         This endpoint serves the playlist ID back to the client.
         """
-        if (server.sessionManager.getHostPlaylistID() is not None):
+        ROOM: Final = server.getRoom(roomID)
+        if (ROOM.sessionManager.getHostPlaylistID() is not None):
             return JSONResponse(
                 content={
-                    'provider': server.musicAPI.getProviderName(),
-                    'playlistID': server.sessionManager.getHostPlaylistID(),
+                    'provider': ROOM.musicAPI.getProviderName(),
+                    'playlistID': ROOM.sessionManager.getHostPlaylistID(),
                 }
             )
         return JSONResponse(
             content={
-                'provider': server.musicAPI.getProviderName(),
-                'playlistID': server.musicAPI.getPlaylistByName(
+                'provider': ROOM.musicAPI.getProviderName(),
+                'playlistID': await ROOM.musicAPI.getPlaylistByName(
                     sessionID, 'Virtual Turntable'
                 )
             }
         )
 
     @app.get('/host')
-    async def hostUserGet() -> JSONResponse:
+    async def hostUserGet(roomID: str = Cookie(None)) -> JSONResponse:
         """
         This endpoint serves the host user's ID back to the client.
         """
-        if (server.sessionManager.getHostUserID() is None):
+        ROOM: Final = server.getRoom(roomID)
+        if (ROOM.sessionManager.getHostUserID() is None):
             raise HTTPException(404, 'Host user not found')
         return JSONResponse(content={
-            'hostUserID': server.sessionManager.getHostUserID(),
-            'provider': server.musicAPI.getProviderName(),
+            'hostUserID': ROOM.sessionManager.getHostUserID(),
+            'provider': ROOM.musicAPI.getProviderName(),
         })
 
     @app.get('/track/{trackName}')
@@ -200,21 +232,23 @@ def processingRoutes(server: 'Server') -> None:
 
     # CLIENT-DRIVEN IMAGE
     @app.post('/scan')
-    async def scanPost(request: Request) -> JSONResponse:
+    async def scanPost(request: Request, roomID: str = Cookie(None)) -> JSONResponse:
         """
         This endpoint allows a client to send an image to the server for album detection.
         """
+        ROOM: Final = server.getRoom(roomID)
+
         # validate body content
         body = await request.body()
         if (not body):
             raise HTTPException(status_code=400, detail='No image data provided.')
 
         # save image
-        IMAGE_PATH: Final = os.path.join(server.ROOT_DIR, 'data', 'upload.png')
+        IMAGE_PATH: Final = os.path.join(server.ROOT_DIR, 'data', ROOM.uploadFileName)
         with open(IMAGE_PATH, 'wb') as file:
             file.write(body)
 
-        return await server.predictAndPlayAlbum('upload.png')
+        return await server.predictAndPlayAlbum(ROOM, ROOM.uploadFileName)
 
     # CENTRE LABEL
     @app.post('/centreLabel')
@@ -238,38 +272,13 @@ def processingRoutes(server: 'Server') -> None:
         artistName = body.get('artistName')
         year = body.get('year')
 
-        # get data
-        images, metadata = server.centreLabelhandler.findReleaseData(
-            albumName, artistName, year, 'vinyl'
-        )
-
-        labelPath = os.path.join(server.ROOT_DIR, 'data', 'centreLabels', f'{albumID}.png')
-        if (not os.path.exists(labelPath)):
-            # if label not cached, attempt to find it
-
-            # attempt to find a centre label
-            foundCentreLabel = server.centreLabelhandler.serveCentreLabel(
-                albumID, images=images
-            )
-            if (foundCentreLabel is None):
-                # re-attmpt with broader search
-                foundCentreLabel = server.centreLabelhandler.serveCentreLabel(
-                    albumID, albumName, None, None, None
-                )
-
-            if (not foundCentreLabel or not os.path.exists(labelPath)):
-                # failed to find a centre label
-                labelData = None
-            else:
-                with open(labelPath, 'rb') as labelFile:
-                    labelData = base64.b64encode(labelFile.read()).decode('utf-8')
-        else:
-            # load cached label
-            with open(labelPath, 'rb') as labelFile:
-                labelData = base64.b64encode(labelFile.read()).decode('utf-8')
+        # get data (cached, or else searched for; concurrent requests for the album share one search)
+        label, metadata = await server.centreLabelhandler.getCentreLabel(albumID, albumName, artistName, year)
+        labelData = base64.b64encode(label).decode('utf-8') if label is not None else None
 
         response = {
             'imageData': labelData,
+            'imageType': LABEL_MIME_TYPE,
         }
         if (metadata):
             response['metadata'] = metadata
@@ -278,18 +287,38 @@ def processingRoutes(server: 'Server') -> None:
 
 
 def websocketRoutes(server: 'Server') -> None:
-    """Setup the FastAPI websocket routes."""
+    """Setup the FastAPI live-update routes (websocket, and Server-Sent Events)."""
     app: FastAPI = server.app
 
     @app.websocket('/ws')
-    async def connectMainWebsocket(websocket: WebSocket, sessionID: str = Cookie(None)) -> None:
-        if (not sessionID):
+    async def connectMainWebsocket(
+        websocket: WebSocket, sessionID: str = Cookie(None), roomID: str = Cookie(None)
+    ) -> None:
+        room = server.rooms.get(roomID or DEFAULT_ROOM)
+        if (not sessionID or room is None):
             await websocket.close(code=4001)
             return
-        session = server.sessionManager.getSession(sessionID)
-        if (not session):
+        # resolve session (and its permissions) once, for the lifetime of the connection
+        session = room.sessionManager.getSessionContext(sessionID)
+        if (session is None):
             await websocket.close(code=4001)
             return
-        await server.websocketHandler.handleConnection(
-            websocket, sessionID=sessionID, isMain=session.get('isHost', False)
+        await room.websocketHandler.handleConnection(websocket, session)
+
+    @app.get('/events')
+    async def events(sessionID: str = Cookie(None), roomID: str = Cookie(None)) -> StreamingResponse:
+        """
+        This endpoint streams state broadcasts as Server-Sent Events.
+        This is a lightweight, read-only alternative to the websocket, for passive displays.
+        """
+        ROOM: Final = server.getRoom(roomID)
+        if (not sessionID or not ROOM.sessionManager.getSession(sessionID)):
+            raise HTTPException(401, 'Invalid session.')
+        return StreamingResponse(
+            ROOM.eventStream.subscribe(),
+            media_type='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',  # disable proxy buffering
+            },
         )
@@ -1,7 +1,13 @@
 """Utility functions for the server application."""
+import asyncio
 import random
 import socket
 import string
+import time
+from typing import Final
+
+LOCAL_IP_REFRESH_INTERVAL: Final = 300  # seconds between full refreshes of the local IP addresses
+INTERFACE_POLL_INTERVAL: Final = 5  # seconds between checks for network interface changes
 
 
 def getLocalIPs() -> list[str]:
@@ -41,11 +47,65 @@ def getLocalIPs() -> list[str]:
 
     return list(ips)
 
+
+def getInterfaces() -> frozenset[str]:
+    """Retrieve the names of the network interfaces (cheap; no network access)."""
+    try:
+        return frozenset(name for (_, name) in socket.if_nameindex())
+    except OSError:
+        return frozenset()
+
+
+class LocalIPCache:
+    """
+    Cache of the local IP addresses, so that host checks are a set lookup.
+    Refreshed in the background periodically, and whenever the network interfaces change.
+    """
+
+    def __init__(self) -> None:
+        """Initialise the (empty) cache."""
+        self.ips: frozenset[str] | None = None
+        self.interfaces: frozenset[str] = frozenset()
+        self.updated = 0.0
+        self.refreshes = 0
+
+    def get(self) -> frozenset[str]:
+        """Return the local IP addresses (computed on first use)."""
+        if (self.ips is None):
+            self.refresh()
+        return self.ips or frozenset()
+
+    def refresh(self) -> bool:
+        """Recompute the local IP addresses. Returns whether they have changed."""
+        self.interfaces = getInterfaces()
+        ips = frozenset(getLocalIPs())
+        changed = (ips != self.ips)
+        self.ips = ips
+        self.updated = time.monotonic()
+        self.refreshes += 1
+        return changed
+
+    async def refreshPeriodically(self) -> None:
+        """Refresh the cache (off the event loop) when the interfaces change, or the interval elapses."""
+        while (True):
+            if (
+                self.ips is None
+                or time.monotonic() - self.updated >= LOCAL_IP_REFRESH_INTERVAL
+                or getInterfaces() != self.interfaces
+            ):
+                if (await asyncio.to_thread(self.refresh)):
+                    print(f'Local IP addresses: {sorted(self.ips or [])}')
+            await asyncio.sleep(INTERFACE_POLL_INTERVAL)
+
+
+localIPCache = LocalIPCache()
+
+
 def isHostIP(ip: str | None) -> bool:
     """Check if the given IP is a local IP address."""
     if (ip == '127.0.0.1'):
         return True
-    return (ip is not None and ip in getLocalIPs())
+    return (ip is not None and ip in localIPCache.get())
 
 
 def generateRandomString(length: int) -> str:
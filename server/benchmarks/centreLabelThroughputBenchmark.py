@@ -0,0 +1,115 @@
+"""
+Benchmark of concurrent centre label requests: label detection on the event loop, in a thread, and in the process
+pool, for throughput and for how long the event loop (i.e. websockets and GPIO) is stalled.
+
+Each request searches the candidates of an album (as /centreLabel does), served by a stub Discogs API from a generated
+corpus (see labelDetectionBenchmark): a few label-less sleeves, then the label.
+
+Usage (from ./server):
+    python -m benchmarks.centreLabelThroughputBenchmark [--requests N] [--size PX]
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Final
+
+import cv2
+import numpy as np
+
+from app.modules.centreLabelHandler import DETECTION_WORKERS, CentreLabelHandler
+from benchmarks.labelDetectionBenchmark import labelImage, sleeveImage
+
+SLEEVES_PER_ALBUM: Final = 2  # label-less candidates checked before the label
+FETCH_LATENCY: Final = 0.05  # seconds per candidate download
+TICK: Final = 0.005  # seconds; the interval at which the event loop's responsiveness is sampled
+
+
+class InlineExecutor(Executor):
+    """Run each call immediately, on the calling (event loop) thread."""
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future[Any]:
+        future: Future[Any] = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class StubDiscogsAPI:
+    """Serve the candidate images from memory, after a fixed latency."""
+
+    def __init__(self, images: dict[str, bytes]) -> None:
+        self.images = images
+
+    async def fetchImage(self, url: str) -> bytes:
+        await asyncio.sleep(FETCH_LATENCY)
+        return self.images[url]
+
+
+def encode(image: np.ndarray[Any, Any]) -> bytes:
+    """Encode an image, as Discogs serves it."""
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+async def measureLag(stop: asyncio.Event, lags: list[float]) -> None:
+    """Record how late each tick of the event loop is."""
+    while (not stop.is_set()):
+        startTime = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - startTime - TICK)
+
+
+async def benchmark(name: str, executor: Executor | None, requests: int, size: int) -> None:
+    """Serve concurrent requests, detecting labels with the given executor (None, for the process pool)."""
+    rng = np.random.default_rng(0)
+    images: dict[str, bytes] = {}
+    albums: list[list[dict[str, str]]] = []
+    for album in range(requests):
+        candidates = [encode(sleeveImage(size, rng)) for _ in range(SLEEVES_PER_ALBUM)]
+        candidates.append(encode(labelImage(size, rng)[0]))
+        albums.append([])
+        for (i, data) in enumerate(candidates):
+            url = f'https://discogs.test/{album}/{i}.jpg'
+            images[url] = data
+            albums[-1].append({'uri': url})
+
+    with tempfile.TemporaryDirectory() as dataPath:
+        handler = CentreLabelHandler(dataPath, StubDiscogsAPI(images), executor=executor)  # type: ignore[arg-type]
+        try:
+            await handler.findCentreLabel(albums[0])  # (warm up, e.g. starting the workers)
+
+            lags: list[float] = []
+            stop = asyncio.Event()
+            ticker = asyncio.create_task(measureLag(stop, lags))
+            startTime = time.perf_counter()
+            labels = await asyncio.gather(*(handler.findCentreLabel(album) for album in albums))
+            elapsed = time.perf_counter() - startTime
+            stop.set()
+            await ticker
+        finally:
+            handler.close()
+
+    found = sum(label is not None for label in labels)
+    print(
+        f'{name:>8} {found:>3}/{requests:<3} {elapsed:>7.2f} {requests / elapsed:>6.1f} '
+        f'{statistics.mean(lags) * 1000:>8.1f} {max(lags) * 1000:>7.1f}'
+    )
+
+
+async def main(requests: int, size: int) -> None:
+    """Compare where detection runs."""
+    print(f'{requests} concurrent requests, {size}px candidates, {DETECTION_WORKERS} detection worker(s)')
+    print(f"{'detector':>8} {'found':>7} {'seconds':>7} {'req/s':>6} {'meanLag':>8} {'maxLag':>7}")
+    await benchmark('loop', InlineExecutor(), requests, size)
+    await benchmark('thread', ThreadPoolExecutor(max_workers=1), requests, size)
+    await benchmark('process', None, requests, size)
+
+
+if (__name__ == '__main__'):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=16, help='concurrent /centreLabel requests')
+    parser.add_argument('--size', type=int, default=1000, help='candidate image size (px)')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.size))
@@ -0,0 +1,73 @@
+"""
+Benchmark of the host check (/isHost), with and without the cached local IP addresses.
+
+Usage (from ./server):
+    python -m benchmarks.hostCheckBenchmark
+"""
+import socket
+import statistics
+import time
+from typing import Any, Callable, Final
+from unittest.mock import patch
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.utils import getLocalIPs, isHostIP, localIPCache
+
+REQUESTS: Final = 200
+SLOW_DNS: Final = 0.05  # seconds added to each hostname resolution, to emulate a flaky network
+
+
+def uncachedIsHostIP(ip: str | None) -> bool:
+    """The previous host check: the local IP addresses are retrieved on every request."""
+    if (ip == '127.0.0.1'):
+        return True
+    return (ip is not None and ip in getLocalIPs())
+
+
+def createApp(check: Callable[[str | None], bool]) -> FastAPI:
+    """Create an app serving the /isHost endpoint, using the given host check."""
+    app = FastAPI()
+
+    @app.get('/isHost')
+    async def clientIPGet(request: Request) -> JSONResponse:
+        proxiedIP = request.headers.get('x-forwarded-for')
+        return JSONResponse(content={'clientIP': proxiedIP, 'isHost': check(proxiedIP)})
+
+    return app
+
+
+def measure(check: Callable[[str | None], bool], requests: int) -> tuple[float, float]:
+    """Return the p50 and p99 request latency (milliseconds)."""
+    client = TestClient(createApp(check))
+    client.get('/isHost', headers={'x-forwarded-for': '192.0.2.1'})  # warm up (and fill the cache)
+    latencies = []
+    for _ in range(requests):
+        startTime = time.perf_counter()
+        client.get('/isHost', headers={'x-forwarded-for': '192.0.2.1'})
+        latencies.append((time.perf_counter() - startTime) * 1000)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return (percentiles[49], percentiles[98])
+
+
+def main() -> None:
+    """Run the benchmark, and print a results table."""
+    resolve = socket.gethostbyname_ex
+
+    def slowResolve(*args: Any) -> Any:
+        time.sleep(SLOW_DNS)
+        return resolve(*args)
+
+    print(f'{"network":<10}{"host check":<12}{"p50 ms":>9}{"p99 ms":>9}')
+    for (network, requests) in [('normal', REQUESTS), ('slow DNS', REQUESTS // 10)]:
+        with patch('socket.gethostbyname_ex', slowResolve if network == 'slow DNS' else resolve):
+            for (name, check) in [('uncached', uncachedIsHostIP), ('cached', isHostIP)]:
+                localIPCache.ips = None
+                (p50, p99) = measure(check, requests)
+                print(f'{network:<10}{name:<12}{p50:>9.2f}{p99:>9.2f}')
+
+
+if (__name__ == '__main__'):
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark of centre label detection: the previous full-resolution detectCircle against the current
+(downscaled, then locally refined) one, for accuracy and time per image.
+
+The fixture corpus is generated (seeded, so repeatable): photographs of labels at Discogs image sizes, with known
+circles, and label-less images (sleeve art), on which nothing should be detected. A directory of real images may be
+given too; as it has no ground truth, the detectors are compared for agreement.
+
+Usage (from ./server):
+    python -m benchmarks.labelDetectionBenchmark [--images DIR]
+"""
+import argparse
+import os
+import statistics
+import time
+from typing import Any, Callable, Final
+
+import cv2
+import numpy as np
+
+from app.modules.centreLabelHandler import detectCircle
+
+SIZES: Final = [600, 1000, 1400]  # px (Discogs images are commonly 600px, and up to ~1400px)
+IMAGES_PER_SIZE: Final = 20
+TOLERANCE: Final = 0.05  # of the radius; the error within which a detection counts as correct
+
+Circle = tuple[float, float, float]
+
+
+def previousDetectCircle(image: np.ndarray[Any, Any]) -> np.ndarray[Any, Any] | None:
+    """The previous detector: a 15x15 blur and Hough transform, at full resolution."""
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(grey, (15, 15), 0)
+    return cv2.HoughCircles(
+        blurred, cv2.HOUGH_GRADIENT,
+        dp=1.5, minDist=100,
+        param1=80, param2=80,
+        minRadius=200, maxRadius=0
+    )
+
+
+def jpeg(image: np.ndarray[Any, Any], rng: np.random.Generator) -> np.ndarray[Any, Any]:
+    """Add sensor noise and JPEG compression, as in a photograph."""
+    noisy = np.clip(image.astype(np.int16) + rng.normal(0, 6, image.shape), 0, 255).astype(np.uint8)
+    (_, encoded) = cv2.imencode('.jpg', noisy, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    decoded = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    if (decoded is None):
+        raise ValueError('Could not decode the compressed image.')
+    return decoded
+
+
+def labelImage(size: int, rng: np.random.Generator) -> tuple[np.ndarray[Any, Any], Circle]:
+    """Generate a close-up of a centre label (on grooved vinyl), returning it with the label's circle."""
+    image = np.full((size, size, 3), int(rng.integers(10, 30)), np.uint8)
+    (x, y) = size / 2 + rng.uniform(-0.05, 0.05, 2) * size
+    centre = (int(round(x)), int(round(y)))
+    for grooveR in range(int(size * 0.5), int(size * 0.9), 3):
+        cv2.circle(image, centre, grooveR, (int(rng.integers(20, 45)),) * 3, 1)
+
+    r = size * rng.uniform(0.40, 0.48)
+    colour = tuple(int(value) for value in rng.integers(60, 255, 3))
+    cv2.circle(image, centre, int(round(r)), colour, -1, lineType=cv2.LINE_AA)
+    for _ in range(12):
+        position = (int(x + rng.uniform(-0.6, 0.6) * r), int(y + rng.uniform(-0.6, 0.6) * r))
+        shade = (int(rng.integers(0, 255)),) * 3
+        cv2.putText(image, 'RECORDS', position, cv2.FONT_HERSHEY_SIMPLEX, size / 900, shade, max(1, size // 400))
+    cv2.circle(image, centre, max(3, int(size * 0.012)), (0, 0, 0), -1)  # spindle hole
+    return (jpeg(cv2.GaussianBlur(image, (3, 3), 0), rng), (centre[0], centre[1], round(r)))
+
+
+def sleeveImage(size: int, rng: np.random.Generator) -> np.ndarray[Any, Any]:
+    """Generate label-less sleeve art (rectangles, lines and text)."""
+    image = np.full((size, size, 3), tuple(int(value) for value in rng.integers(0, 255, 3)), np.uint8)
+    for _ in range(15):
+        (x1, y1, x2, y2) = (int(value) for value in rng.integers(0, size, 4))
+        colour = tuple(int(value) for value in rng.integers(0, 255, 3))
+        if (rng.random() < 0.5):
+            cv2.rectangle(image, (x1, y1), (x2, y2), colour, -1)
+        else:
+            cv2.line(image, (x1, y1), (x2, y2), colour, max(1, size // 100))
+    for _ in range(6):
+        position = (int(rng.integers(0, size)), int(rng.integers(0, size)))
+        cv2.putText(image, 'ALBUM', position, cv2.FONT_HERSHEY_SIMPLEX, size / 300, (255, 255, 255), size // 150)
+    return jpeg(image, rng)
+
+
+def firstCircle(circles: np.ndarray[Any, Any] | None) -> Circle | None:
+    """Return the circle cropLabel would use (the first)."""
+    return None if circles is None else tuple(float(value) for value in circles[0, 0])  # type: ignore[return-value]
+
+
+def error(circle: Circle, truth: Circle) -> float:
+    """Return the error of a detected circle, relative to the true radius."""
+    return max(abs(circle[0] - truth[0]), abs(circle[1] - truth[1]), abs(circle[2] - truth[2])) / truth[2]
+
+
+def timed(detect: Callable[[np.ndarray[Any, Any]], Any], image: np.ndarray[Any, Any]) -> tuple[Circle | None, float]:
+    """Detect the circle in an image, returning it with the time taken (ms)."""
+    startTime = time.perf_counter()
+    circle = firstCircle(detect(image))
+    return (circle, (time.perf_counter() - startTime) * 1000)
+
+
+DETECTORS: Final = {'previous': previousDetectCircle, 'current': detectCircle}
+
+
+def benchmarkFixtures() -> None:
+    """Compare the detectors on the generated corpus."""
+    rng = np.random.default_rng(0)
+    print(f"{'size':>5} {'detector':>9} {'found':>6} {'meanErr':>8} {'maxErr':>7} {'falsePos':>9} {'meanMs':>7}")
+    for size in SIZES:
+        labels = [labelImage(size, rng) for _ in range(IMAGES_PER_SIZE)]
+        sleeves = [sleeveImage(size, rng) for _ in range(IMAGES_PER_SIZE)]
+        for (name, detect) in DETECTORS.items():
+            detect(labels[0][0])  # (warm up)
+            errors: list[float] = []
+            times: list[float] = []
+            for (image, truth) in labels:
+                (circle, ms) = timed(detect, image)
+                times.append(ms)
+                if (circle is not None):
+                    errors.append(error(circle, truth))
+            falsePositives = sum(timed(detect, image)[0] is not None for image in sleeves)
+
+            found = sum(e <= TOLERANCE for e in errors)
+            print(
+                f'{size:>5} {name:>9} {found:>3}/{len(labels):<2} '
+                f'{statistics.mean(errors) if errors else 0:>8.4f} {max(errors, default=0):>7.4f} '
+                f'{falsePositives:>6}/{len(sleeves):<2} {statistics.mean(times):>7.1f}'
+            )
+
+
+def benchmarkDirectory(directory: str) -> None:
+    """Compare the detectors on real images (for agreement, as there is no ground truth)."""
+    times: dict[str, list[float]] = {name: [] for name in DETECTORS}
+    (agreed, total) = (0, 0)
+    for fileName in sorted(os.listdir(directory)):
+        image = cv2.imread(os.path.join(directory, fileName))
+        if (image is None):
+            continue
+        circles = {}
+        for (name, detect) in DETECTORS.items():
+            (circles[name], ms) = timed(detect, image)
+            times[name].append(ms)
+        (previous, current) = (circles['previous'], circles['current'])
+        total += 1
+        agreed += (
+            (previous is None and current is None)
+            or (previous is not None and current is not None and error(current, previous) <= TOLERANCE)
+        )
+    print(f'{directory}: {agreed}/{total} images agree')
+    for (name, values) in times.items():
+        if (values):
+            print(f'  {name:>9}: {statistics.mean(values):.1f}ms mean, {max(values):.1f}ms max')
+
+
+if (__name__ == '__main__'):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', help='directory of real label images, compared for agreement')
+    args = parser.parse_args()
+
+    benchmarkFixtures()
+    if (args.images):
+        benchmarkDirectory(args.images)
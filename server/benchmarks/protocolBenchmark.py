@@ -0,0 +1,63 @@
+"""
+Benchmark of the websocket wire formats: payload sizes, and encode/decode throughput.
+
+Usage (from ./server):
+    python -m benchmarks.protocolBenchmark
+"""
+import timeit
+from typing import Any, Final
+
+from app.modules.messageCodec import CODECS
+
+ITERATIONS: Final = 20_000
+
+# representative traffic; currentTrack mirrors the Spotify Web Playback SDK track object
+MESSAGES: Final[dict[str, dict[str, Any]]] = {
+    'playState': {'command': 'playState', 'value': True, 'provider': 'Spotify'},
+    'playNext': {'command': 'playNext', 'value': None},
+    'settings': {
+        'command': 'settings',
+        'value': {'enableMotor': True, 'enableRemote': True, 'enforceSignature': True, 'volume': 55},
+        'provider': 'Spotify',
+    },
+    'currentTrack': {
+        'command': 'currentTrack',
+        'value': {
+            'uri': 'spotify:track:6mFkJmJqdDVQ1REhVfGgd1',
+            'id': '6mFkJmJqdDVQ1REhVfGgd1',
+            'type': 'track',
+            'media_type': 'audio',
+            'name': 'Wish You Were Here',
+            'is_playable': True,
+            'duration_ms': 334743,
+            'album': {
+                'uri': 'spotify:album:0bCAjiUamIFqKJsekOYuRw',
+                'name': 'Wish You Were Here',
+                'images': [
+                    {'url': f'https://i.scdn.co/image/ab67616d0000{size}', 'height': size, 'width': size}
+                    for size in (64, 300, 640)
+                ],
+            },
+            'artists': [{'uri': 'spotify:artist:0k17h0D3J5VfsdmQ1iZtE9', 'name': 'Pink Floyd'}],
+        },
+        'provider': 'Spotify',
+    },
+}
+
+
+def main() -> None:
+    """Run the benchmark, and print a results table."""
+    print(f'{"message":<14}{"format":<10}{"bytes":>8}{"encode/s":>14}{"decode/s":>14}')
+    for (name, message) in MESSAGES.items():
+        for codec in CODECS.values():
+            frame = codec.encode(message)
+            encodeTime = timeit.timeit(lambda: codec.encode(message), number=ITERATIONS)
+            decodeTime = timeit.timeit(lambda: codec.decode(frame), number=ITERATIONS)
+            print(
+                f'{name:<14}{codec.NAME:<10}{len(frame):>8}'
+                f'{ITERATIONS / encodeTime:>14,.0f}{ITERATIONS / decodeTime:>14,.0f}'
+            )
+
+
+if (__name__ == '__main__'):
+    main()
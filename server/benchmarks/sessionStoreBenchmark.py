@@ -0,0 +1,111 @@
+"""
+Benchmark of the session store: memory, and lookup/eviction cost, with tens of thousands of sessions.
+
+Usage (from ./server):
+    python -m benchmarks.sessionStoreBenchmark --sessions 10000 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+import timeit
+import tracemalloc
+from typing import Any, Callable, Final
+from unittest.mock import patch
+
+from app.modules.sessionManager import SessionManager
+from app.modules.StateBus.IStateBus import IStateBus
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.StateBus.sqliteStateBus import SQLiteStateBus
+
+LOOKUPS: Final = 2_000
+OVERFLOW: Final = 1_000  # sessions created beyond the cap
+
+
+def legacyGetHostToken(sessionManager: SessionManager) -> str | None:
+    """The previous host lookup: a linear scan of all sessions."""
+    for session in sessionManager.sessions.values():
+        if (session and session.get('isHost')):
+            return str(session.get('accessToken'))
+    return None
+
+
+def perCall(function: Callable[[], Any], number: int) -> float:
+    """Return the mean time of a call (microseconds)."""
+    return timeit.timeit(function, number=number) / number * 1e6
+
+
+def benchmark(stateBus: IStateBus, backend: str, sessions: int) -> dict[str, Any]:
+    """Fill a session store, then measure lookups, sweeps and capacity eviction."""
+    clock = [time.time()]
+    with patch('app.modules.sessionManager.time.time', lambda: clock[0]):
+        sessionManager = SessionManager(stateBus, idleTTL=3600, maxSessions=sessions)
+
+        tracemalloc.start()
+        startTime = time.perf_counter()
+        for i in range(sessions):
+            sessionManager.createSession(f'side{i:06d}', False)
+            sessionManager.updateSession(f'side{i:06d}', {'accessToken': 'x' * 200, 'userID': f'user{i}'})
+            clock[0] += 0.01
+        # (the host logs in last; the worst case for a linear scan)
+        sessionManager.createSession('host', True)
+        sessionManager.updateSession('host', {'accessToken': 'hostToken', 'userID': 'hostUser'})
+        createUs = (time.perf_counter() - startTime) / sessions * 1e6
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        hostUs = perCall(sessionManager.getHostToken, LOOKUPS)
+        legacyHostUs = perCall(lambda: legacyGetHostToken(sessionManager), max(1, LOOKUPS // 100))
+        contextUs = perCall(lambda: sessionManager.getSessionContext(f'side{sessions // 2:06d}'), LOOKUPS)
+
+        # capacity eviction (the store is full)
+        startTime = time.perf_counter()
+        for i in range(OVERFLOW):
+            sessionManager.createSession(f'extra{i:06d}', False)
+        overflowUs = (time.perf_counter() - startTime) / OVERFLOW * 1e6
+
+        # expire the oldest half, and sweep
+        clock[0] += 3600 - sessions * 0.01 / 2
+        startTime = time.perf_counter()
+        swept = sessionManager.evictExpired()
+        sweepMs = (time.perf_counter() - startTime) * 1000
+
+    return {
+        'backend': backend,
+        'sessions': sessions,
+        'memory': f'{memory / sessions:.0f} B' if backend == 'local' else '-',
+        'createUs': createUs,
+        'hostUs': hostUs,
+        'legacyHostUs': legacyHostUs,
+        'contextUs': contextUs,
+        'overflowUs': overflowUs,
+        'swept': swept,
+        'sweepMs': sweepMs,
+    }
+
+
+def main(sessionCounts: list[int]) -> None:
+    """Run the benchmark for each backend and number of sessions."""
+    print(
+        f'{"backend":<8}{"sessions":>9}{"mem/session":>12}{"create us":>10}{"host us":>9}{"(scan) us":>11}'
+        f'{"context us":>11}{"evict us":>9}{"swept":>7}{"sweep ms":>9}'
+    )
+    for sessions in sessionCounts:
+        with tempfile.TemporaryDirectory() as directory:
+            for (backend, stateBus) in [
+                ('local', LocalStateBus()),
+                ('sqlite', SQLiteStateBus(os.path.join(directory, 'stateBus.sqlite3'))),
+            ]:
+                result = benchmark(stateBus, backend, sessions)
+                print(
+                    f'{result["backend"]:<8}{result["sessions"]:>9}{result["memory"]:>12}{result["createUs"]:>10.1f}'
+                    f'{result["hostUs"]:>9.1f}{result["legacyHostUs"]:>11.0f}{result["contextUs"]:>11.1f}'
+                    f'{result["overflowUs"]:>9.1f}{result["swept"]:>7}{result["sweepMs"]:>9.1f}'
+                )
+
+
+if (__name__ == '__main__'):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10_000, 50_000])
+    args = parser.parse_args()
+    main(args.sessions)
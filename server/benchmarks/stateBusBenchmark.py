@@ -0,0 +1,140 @@
+"""
+Benchmark of the state bus backends: state update throughput, and cross-worker delivery, at 1, 2 and 4 workers.
+
+Each worker process repeatedly applies a state update as StateManager does (store the value, and publish it),
+whilst receiving the updates published by the other workers. The longest stall of each worker's event loop (during
+which none of its websockets would be served) is reported too.
+
+This measures the bus alone, not the whole server: the application cannot be started under several workers here
+(each worker would load the model), so end-to-end runs through runner.py (WORKERS=N) are left to the deployment.
+
+Usage (from ./server):
+    python -m benchmarks.stateBusBenchmark --updates 5000
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from multiprocessing.synchronize import Barrier
+from typing import Any, Final
+
+from app.modules.StateBus.IStateBus import IStateBus
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.StateBus.sqliteStateBus import SQLiteStateBus
+
+DELIVERY_TIMEOUT: Final = 30  # seconds
+TICK: Final = 0.001  # seconds; the interval at which the event loop's responsiveness is sampled
+
+
+async def measureStalls(stalls: list[float]) -> None:
+    """Record how late each tick of the event loop is."""
+    while (True):
+        startTime = time.perf_counter()
+        await asyncio.sleep(TICK)
+        stalls.append(time.perf_counter() - startTime - TICK)
+
+
+async def runWorker(bus: IStateBus, workers: int, updates: int) -> dict[str, Any]:
+    """Apply the updates, and wait for those of the other workers to be delivered."""
+    latencies: list[float] = []
+
+    async def receive(message: dict[str, Any]) -> None:
+        latencies.append(time.time() - message['sentAt'])
+
+    bus.subscribe('broadcast', receive)
+    await bus.start()
+    stalls: list[float] = []
+    ticker = asyncio.create_task(measureStalls(stalls))
+
+    startTime = time.perf_counter()
+    for i in range(updates):
+        bus.set('state', 'settings', {'volume': i % 100})
+        bus.publish('broadcast', {'command': 'settings', 'value': {'volume': i % 100}, 'sentAt': time.time()})
+        if (i % 50 == 0):
+            await asyncio.sleep(0)  # let deliveries interleave, as in the server
+    elapsed = time.perf_counter() - startTime
+
+    expected = (workers - 1) * updates
+    deadline = time.monotonic() + DELIVERY_TIMEOUT
+    while (len(latencies) < expected and time.monotonic() < deadline):
+        await asyncio.sleep(0.01)
+    ticker.cancel()
+    await bus.stop()
+
+    return {
+        'elapsed': elapsed, 'delivered': len(latencies), 'expected': expected, 'latencies': latencies,
+        'maxStall': max(stalls, default=0),
+    }
+
+
+def workerProcess(path: str, workers: int, updates: int, barrier: Barrier, results: Any) -> None:
+    """Run a single worker (in a child process)."""
+    bus = SQLiteStateBus(path)
+    barrier.wait()
+    results.put(asyncio.run(runWorker(bus, workers, updates)))
+
+
+def benchmarkSQLite(workers: int, updates: int) -> dict[str, Any]:
+    """Run the workers concurrently, on a shared database."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stateBus.sqlite3')
+        SQLiteStateBus(path).connection.close()  # create the schema up front
+
+        barrier = multiprocessing.Barrier(workers)
+        results: Any = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=workerProcess, args=(path, workers, updates, barrier, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    latencies = sorted(latency for outcome in outcomes for latency in outcome['latencies'])
+    return {
+        'backend': 'sqlite',
+        'workers': workers,
+        'updatesPerSecond': workers * updates / max(outcome['elapsed'] for outcome in outcomes),
+        'delivered': f'{sum(o["delivered"] for o in outcomes)}/{sum(o["expected"] for o in outcomes)}',
+        'p50Ms': statistics.median(latencies) * 1000 if latencies else float('nan'),
+        'p99Ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else float('nan'),
+        'maxStallMs': max(outcome['maxStall'] for outcome in outcomes) * 1000,
+    }
+
+
+def benchmarkLocal(updates: int) -> dict[str, Any]:
+    """Run a single worker, on the in-process bus."""
+    outcome = asyncio.run(runWorker(LocalStateBus(), 1, updates))
+    return {
+        'backend': 'local',
+        'workers': 1,
+        'updatesPerSecond': updates / outcome['elapsed'],
+        'delivered': '-',
+        'p50Ms': float('nan'),
+        'p99Ms': float('nan'),
+        'maxStallMs': outcome['maxStall'] * 1000,
+    }
+
+
+def main(updates: int) -> None:
+    """Run the benchmark for each backend and number of workers."""
+    print(
+        f'{"backend":<9}{"workers":>8}{"updates/s":>12}{"delivered":>14}{"p50 ms":>9}{"p99 ms":>9}{"stall ms":>10}'
+    )
+    for result in [benchmarkLocal(updates), *(benchmarkSQLite(workers, updates) for workers in [1, 2, 4])]:
+        print(
+            f'{result["backend"]:<9}{result["workers"]:>8}{result["updatesPerSecond"]:>12.0f}'
+            f'{result["delivered"]:>14}{result["p50Ms"]:>9.1f}{result["p99Ms"]:>9.1f}{result["maxStallMs"]:>10.1f}'
+        )
+
+
+if (__name__ == '__main__'):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=5000, help='state updates per worker')
+    args = parser.parse_args()
+    main(args.updates)
@@ -0,0 +1,197 @@
+"""
+Load test of read-only viewers: Server-Sent Events (/events) against websockets (/ws).
+
+A stripped-down server (state, websocket and event stream modules only; no model, hardware or
+music provider) is started in a separate process, N passive viewers connect over each transport,
+and a series of state broadcasts is fanned out to them. Server CPU time and memory growth are
+measured per viewer, alongside delivery latency.
+
+Usage (from ./server):
+    python -m benchmarks.viewerLoad --viewers 50 200 500 --broadcasts 50
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from typing import Any, Final
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
+from websockets.asyncio.client import connect
+
+from app.enums.StateKeys import StateKeys
+from app.modules.eventStream import EventStream
+from app.modules.sessionManager import SessionContext
+from app.modules.stateManager import StateManager
+from app.modules.websocketHandler import WebsocketHandler
+
+HOST: Final = '127.0.0.1'
+PORT: Final = 8592
+BASE_URL: Final = f'http://{HOST}:{PORT}'
+
+
+def createApp() -> FastAPI:
+    """Create the stripped-down server application."""
+    app = FastAPI()
+
+    async def ignoreCommand(*_args: Any) -> None:
+        return
+
+    stateManager: StateManager
+    eventStream = EventStream(lambda: stateManager.getSnapshot())
+    websocketHandler = WebsocketHandler(
+        lambda codec: stateManager.getSnapshot(codec), ignoreCommand,
+        eventStream=eventStream, heartbeatInterval=3600,
+    )
+    stateManager = StateManager(websocketHandler, None, 'Benchmark')
+
+    @app.websocket('/ws')
+    async def websocketViewer(websocket: WebSocket) -> None:
+        session = SessionContext(sessionID=str(id(websocket)), userID=None, isHost=False)
+        await websocketHandler.handleConnection(websocket, session)
+
+    @app.get('/events')
+    async def eventViewer() -> StreamingResponse:
+        return StreamingResponse(eventStream.subscribe(), media_type='text/event-stream')
+
+    @app.post('/bench/broadcast')
+    async def broadcast() -> JSONResponse:
+        # a realistically-sized message; the value carries the send time, to measure latency
+        await stateManager.updateState(StateKeys.CURRENT_TRACK, {
+            'sentAt': time.time(),
+            'name': 'Wish You Were Here',
+            'uri': 'spotify:track:6mFkJmJqdDVQ1REhVfGgd1',
+            'album': {'name': 'Wish You Were Here', 'images': [{'url': 'https://i.scdn.co/image/x' * 3}] * 3},
+            'artists': [{'name': 'Pink Floyd'}],
+        })
+        return JSONResponse({})
+
+    @app.get('/bench/stats')
+    async def stats() -> JSONResponse:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        with open('/proc/self/status', 'r', encoding='utf-8') as status:
+            rss = next(int(line.split()[1]) for line in status if line.startswith('VmRSS'))
+        return JSONResponse({
+            'cpuSeconds': usage.ru_utime + usage.ru_stime,
+            'rssKiB': rss,
+            'viewers': len(websocketHandler.activeSideSockets) + eventStream.subscribers,
+        })
+
+    return app
+
+
+def runServer() -> None:
+    """Run the stripped-down server (in a child process)."""
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')  # silence per-connection logging
+    uvicorn.run(createApp(), host=HOST, port=PORT, log_level='error', ws_ping_interval=None)
+
+
+async def websocketViewer(latencies: list[float], ready: asyncio.Event, stop: asyncio.Event) -> None:
+    """A passive websocket viewer."""
+    async with connect(f'ws://{HOST}:{PORT}/ws', max_queue=None) as websocket:
+        await websocket.recv()  # snapshot
+        ready.set()
+        while (not stop.is_set()):
+            message = json.loads(await websocket.recv())
+            if (message.get('command') == StateKeys.CURRENT_TRACK.value):
+                latencies.append(time.time() - message['value']['sentAt'])
+
+
+async def eventViewer(client: httpx.AsyncClient, latencies: list[float], ready: asyncio.Event, stop: asyncio.Event) -> None:
+    """A passive Server-Sent Events viewer."""
+    async with client.stream('GET', f'{BASE_URL}/events') as response:
+        async for line in response.aiter_lines():
+            if (not line.startswith('data: ')):
+                continue
+            message = json.loads(line[len('data: '):])
+            if (message.get('command') == 'snapshot'):
+                ready.set()
+            elif (message.get('command') == StateKeys.CURRENT_TRACK.value):
+                latencies.append(time.time() - message['value']['sentAt'])
+            if (stop.is_set()):
+                return
+
+
+async def measure(transport: str, viewers: int, broadcasts: int) -> dict[str, Any]:
+    """Connect the viewers over the given transport, and fan out the broadcasts to them."""
+    latencies: list[float] = []
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        before = (await client.get(f'{BASE_URL}/bench/stats')).json()
+
+        readyEvents = [asyncio.Event() for _ in range(viewers)]
+        tasks = [
+            asyncio.create_task(
+                websocketViewer(latencies, ready, stop) if transport == 'websocket'
+                else eventViewer(client, latencies, ready, stop)
+            )
+            for ready in readyEvents
+        ]
+        await asyncio.gather(*(ready.wait() for ready in readyEvents))
+        connected = (await client.get(f'{BASE_URL}/bench/stats')).json()
+
+        for _ in range(broadcasts):
+            await client.post(f'{BASE_URL}/bench/broadcast')
+            await asyncio.sleep(0.02)
+        await asyncio.sleep(0.5)  # drain
+        after = (await client.get(f'{BASE_URL}/bench/stats')).json()
+
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies.sort()
+    expected = viewers * broadcasts
+    return {
+        'transport': transport,
+        'viewers': viewers,
+        'delivered': f'{len(latencies)}/{expected}',
+        'rssKiBPerViewer': (connected['rssKiB'] - before['rssKiB']) / viewers,
+        'cpuMsPerDelivery': (after['cpuSeconds'] - connected['cpuSeconds']) * 1000 / max(1, len(latencies)),
+        'p50Ms': statistics.median(latencies) * 1000 if latencies else float('nan'),
+        'p99Ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else float('nan'),
+    }
+
+
+async def main(viewerCounts: list[int], broadcasts: int) -> None:
+    """Run the load test for each transport and number of viewers."""
+    print(f'{"transport":<11}{"viewers":>8}{"delivered":>14}{"KiB/viewer":>12}{"CPU ms/msg":>12}{"p50 ms":>9}{"p99 ms":>9}')
+    for viewers in viewerCounts:
+        for transport in ['events', 'websocket']:
+            # fresh server per run, so memory measurements are independent
+            server = multiprocessing.Process(target=runServer, daemon=True)
+            server.start()
+            try:
+                async with httpx.AsyncClient() as client:
+                    for _ in range(50):
+                        try:
+                            await client.get(f'{BASE_URL}/bench/stats')
+                            break
+                        except httpx.TransportError:
+                            await asyncio.sleep(0.1)
+                result = await measure(transport, viewers, broadcasts)
+            finally:
+                server.terminate()
+                server.join()
+            print(
+                f'{result["transport"]:<11}{result["viewers"]:>8}{result["delivered"]:>14}'
+                f'{result["rssKiBPerViewer"]:>12.1f}{result["cpuMsPerDelivery"]:>12.3f}'
+                f'{result["p50Ms"]:>9.1f}{result["p99Ms"]:>9.1f}'
+            )
+
+
+if (__name__ == '__main__'):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--viewers', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--broadcasts', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.viewers, args.broadcasts))
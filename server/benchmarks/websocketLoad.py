@@ -0,0 +1,332 @@
+"""
+Load test of the websocket server: simulated hosts and remotes, replaying realistic command mixes.
+
+The full application is started in a separate process, with the model, music provider and hardware stubbed.
+Each simulated turntable is a room, with one host and N remotes (sides); sessions are created through the
+room's SessionManager. Within each room:
+  - the host toggles play/pause,
+  - one remote spins the volume (in bursts),
+  - the other remotes occasionally request an album (relayed to the host).
+Broadcast fan-out latency, message loss and server CPU/memory are reported.
+
+Usage (from ./server):
+    python -m benchmarks.websocketLoad --rooms 4 --sides 10 --duration 30 [--msgpack]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Final
+
+import httpx
+from websockets.asyncio.client import ClientConnection, connect
+
+from app.enums.StateKeys import Commands, StateKeys
+from app.modules.messageCodec import CODECS, DEFAULT_CODEC, MessageCodec
+
+HOST: Final = '127.0.0.1'
+PORT: Final = 8593
+BASE_URL: Final = f'http://{HOST}:{PORT}'
+USER_ID: Final = 'loadTestUser'  # remotes act on behalf of the host user (so pass signature checks)
+
+# command pacing (seconds), within the default rate limit budgets
+PLAY_STATE_INTERVAL: Final = 0.5
+SPIN_INTERVAL: Final = 3.0
+SPIN_STEPS: Final = 10
+SPIN_STEP_INTERVAL: Final = 0.05
+PLAY_ALBUM_INTERVAL: Final = 8.0
+
+
+def roomName(index: int) -> str:
+    """Return the ID of the nth room."""
+    return 'default' if index == 0 else f'room{index}'
+
+
+def runServer(rooms: int, sides: int) -> None:
+    """Run the application, with its external dependencies stubbed (in a child process)."""
+    os.environ['GPIO_ACCESS'] = 'off'
+    os.environ['STATE_BUS'] = 'local'
+    os.environ['ROOMS'] = ','.join(roomName(i) for i in range(rooms))
+
+    import uvicorn
+    from app.APIs.MusicAPI import SpotifyAPI
+    from app.modules.modelHandler import ModelHandler
+
+    class StubMusicAPI(SpotifyAPI.SpotifyAPI):
+        """Music API stub, which makes no network requests."""
+
+        async def getUserID(self, sessionID: str) -> str:
+            return USER_ID
+
+        async def getPlaylistByName(self, sessionID: str, playlistName: str) -> str | None:
+            return 'loadTestPlaylist'
+
+        async def addToPlaylist(self, albumID: str, playlistID: str, isAlbum: bool = True) -> None:
+            return
+
+        async def playPlaylist(self, playlistID: str) -> None:
+            return
+
+        async def searchForAlbum(
+            self, album: dict[str, str], token: str | None = None, strict: bool = False
+        ) -> dict[str, str] | None:
+            return {'medium': 'album', 'id': 'loadTestAlbum'}
+
+    SpotifyAPI.SpotifyAPI = StubMusicAPI  # type: ignore[misc]
+    ModelHandler.loadModel = lambda *_args, **_kwargs: None  # type: ignore[method-assign]
+
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')  # silence per-message logging
+    from app.main import serverInstance
+
+    for i in range(rooms):
+        sessionManager = serverInstance.rooms[roomName(i)].sessionManager
+        sessionManager.createSession(f'{roomName(i)}-host', True)
+        sessionManager.updateSession(f'{roomName(i)}-host', {'userID': USER_ID, 'accessToken': 'stub'})
+        for j in range(sides):
+            sessionManager.createSession(f'{roomName(i)}-side{j}', False)
+            sessionManager.updateSession(f'{roomName(i)}-side{j}', {'userID': USER_ID, 'accessToken': 'stub'})
+
+    uvicorn.run(serverInstance.app, host=HOST, port=PORT, log_level='error', ws_ping_interval=None)
+
+
+def readProcessUsage(pid: int) -> tuple[float, int]:
+    """Return the CPU time (seconds) and resident memory (KiB) of a process."""
+    with open(f'/proc/{pid}/stat', 'r', encoding='utf-8') as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    cpuSeconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    with open(f'/proc/{pid}/status', 'r', encoding='utf-8') as status:
+        rss = next(int(line.split()[1]) for line in status if line.startswith('VmRSS'))
+    return cpuSeconds, rss
+
+
+def messageKey(command: str, value: Any) -> tuple[str, str]:
+    """Return the key identifying a command, and its value."""
+    return (command, json.dumps(value, sort_keys=True))
+
+
+@dataclass
+class RoomLog:
+    """Commands sent within a room, for matching against the messages received by its clients."""
+    sent: dict[tuple[str, str], list[float]] = field(default_factory=dict)  # (command, value) -> send times
+    expected: int = 0  # total deliveries expected
+
+    def record(self, command: str, value: Any, recipients: int) -> None:
+        """Record a sent command."""
+        self.sent.setdefault(messageKey(command, value), []).append(time.perf_counter())
+        self.expected += recipients
+
+
+@dataclass
+class Results:
+    """Measurements, across all clients."""
+    latencies: list[float] = field(default_factory=list)
+    delivered: int = 0
+    throttled: int = 0
+    errors: int = 0
+
+
+class Client:
+    """A simulated host or remote."""
+
+    def __init__(self, roomID: str, sessionID: str, codec: MessageCodec, log: RoomLog, results: Results) -> None:
+        """Initialise the client."""
+        self.roomID = roomID
+        self.sessionID = sessionID
+        self.codec = codec
+        self.log = log
+        self.results = results
+        self.cursors: dict[tuple[str, str], int] = {}  # next unmatched send, per (command, value)
+        self.websocket: ClientConnection | None = None
+        self.ready = asyncio.Event()
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Connect, and handle incoming messages until stopped."""
+        subprotocols = [self.codec.SUBPROTOCOL] if self.codec is not DEFAULT_CODEC else None
+        async with connect(
+            f'ws://{HOST}:{PORT}/ws',
+            additional_headers={'Cookie': f'sessionID={self.sessionID}; roomID={self.roomID}'},
+            subprotocols=subprotocols,  # type: ignore[arg-type]
+            max_queue=None,
+            ping_interval=None,
+        ) as websocket:
+            self.websocket = websocket
+            async for frame in websocket:
+                self.handle(self.codec.decode(frame))
+                if (stop.is_set()):
+                    return
+
+    def handle(self, message: dict[str, Any]) -> None:
+        """Match a received message against the sent commands."""
+        command = message.get('command')
+        if (command == Commands.SNAPSHOT.value):
+            self.ready.set()
+            return
+        if (command == Commands.PING.value):
+            asyncio.ensure_future(self.send({'command': Commands.PONG.value, 'value': message.get('value')}))
+            return
+        if (command == Commands.THROTTLED.value):
+            self.results.throttled += 1
+            return
+
+        key = messageKey(str(command), message.get('value'))
+        sendTimes = self.log.sent.get(key, [])
+        cursor = self.cursors.get(key, 0)
+        if (cursor < len(sendTimes)):
+            self.results.latencies.append(time.perf_counter() - sendTimes[cursor])
+            self.results.delivered += 1
+            self.cursors[key] = cursor + 1
+
+    async def send(self, data: dict[str, Any]) -> None:
+        """Send a command."""
+        if (self.websocket is None):
+            return
+        try:
+            await self.websocket.send(self.codec.encode(data))
+        except Exception:
+            self.results.errors += 1
+
+
+async def runHost(host: Client, log: RoomLog, recipients: int, stop: asyncio.Event) -> None:
+    """Toggle play/pause."""
+    playState = False
+    while (not stop.is_set()):
+        playState = not playState
+        log.record(StateKeys.PLAY_STATE.value, playState, recipients)
+        await host.send({'command': StateKeys.PLAY_STATE.value, 'value': playState})
+        await asyncio.sleep(PLAY_STATE_INTERVAL)
+
+
+async def runSpinner(side: Client, log: RoomLog, recipients: int, stop: asyncio.Event) -> None:
+    """Spin the volume up and down, in bursts."""
+    volume = 50
+    direction = 1
+    while (not stop.is_set()):
+        for _ in range(SPIN_STEPS):
+            volume += 5 * direction
+            settings = {'enableMotor': True, 'enableRemote': True, 'enforceSignature': True, 'volume': volume}
+            log.record(StateKeys.SETTINGS.value, settings, recipients)
+            await side.send({'command': StateKeys.SETTINGS.value, 'value': settings})
+            await asyncio.sleep(SPIN_STEP_INTERVAL)
+        direction = -direction
+        await asyncio.sleep(SPIN_INTERVAL)
+
+
+async def runRequester(side: Client, log: RoomLog, stop: asyncio.Event, offset: float) -> None:
+    """Occasionally request an album (relayed to the host only)."""
+    await asyncio.sleep(offset)
+    count = 0
+    while (not stop.is_set()):
+        albumID = f'{side.sessionID}-album{count}'
+        count += 1
+        log.record(Commands.PLAY_ALBUM.value, albumID, 1)
+        await side.send({'command': Commands.PLAY_ALBUM.value, 'value': albumID})
+        await asyncio.sleep(PLAY_ALBUM_INTERVAL)
+
+
+async def runLoad(rooms: int, sides: int, duration: float, codec: MessageCodec, serverPID: int) -> None:
+    """Connect the clients, replay the command mixes, and report."""
+    results = Results()
+    stop = asyncio.Event()
+    clients: list[Client] = []
+    logs: list[RoomLog] = []
+    actors: list[Any] = []
+
+    for i in range(rooms):
+        roomID = roomName(i)
+        log = RoomLog()
+        logs.append(log)
+        host = Client(roomID, f'{roomID}-host', DEFAULT_CODEC, log, results)
+        roomSides = [Client(roomID, f'{roomID}-side{j}', codec, log, results) for j in range(sides)]
+        clients += [host, *roomSides]
+
+        recipients = 1 + sides  # state changes are broadcast to the whole room
+        actors.append(lambda host=host, log=log, recipients=recipients: runHost(host, log, recipients, stop))
+        if (roomSides):
+            actors.append(
+                lambda side=roomSides[0], log=log, recipients=recipients: runSpinner(side, log, recipients, stop)
+            )
+        for (j, side) in enumerate(roomSides[1:]):
+            actors.append(
+                lambda side=side, log=log, j=j: runRequester(side, log, stop, (j * 0.37) % PLAY_ALBUM_INTERVAL)
+            )
+
+    # connect
+    connections = [asyncio.create_task(client.run(stop)) for client in clients]
+    await asyncio.wait_for(asyncio.gather(*(client.ready.wait() for client in clients)), 30)
+    cpuBefore, rssBefore = readProcessUsage(serverPID)
+    print(f'Connected {len(clients)} clients ({rooms} rooms); server RSS {rssBefore / 1024:.1f} MiB')
+
+    # replay
+    startTime = time.perf_counter()
+    tasks = [asyncio.create_task(actor()) for actor in actors]
+    await asyncio.sleep(duration)
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.sleep(1)  # drain
+    elapsed = time.perf_counter() - startTime
+    cpuAfter, rssAfter = readProcessUsage(serverPID)
+
+    async with httpx.AsyncClient() as httpClient:
+        metrics = (await httpClient.get(f'{BASE_URL}/metrics')).json()
+    for connection in connections:
+        connection.cancel()
+    await asyncio.gather(*connections, return_exceptions=True)
+
+    # report
+    expected = sum(log.expected for log in logs)
+    latencies = sorted(results.latencies)
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float('nan')
+
+    print(f'Commands handled: {sum(stats["count"] for stats in metrics["commands"].values())} '
+          f'(throttle notices: {results.throttled}, send errors: {results.errors})')
+    print(f'Delivered: {results.delivered}/{expected} '
+          f'(loss {100 * (1 - results.delivered / expected) if expected else 0:.2f}%)')
+    print(f'Fan-out latency (ms): p50 {percentile(0.5):.1f}  p90 {percentile(0.9):.1f}  '
+          f'p99 {percentile(0.99):.1f}  max {percentile(1):.1f}'
+          f'  (mean {statistics.mean(latencies) * 1000 if latencies else float("nan"):.1f})')
+    print(f'Server CPU: {100 * (cpuAfter - cpuBefore) / elapsed:.1f}% of a core; '
+          f'RSS {rssAfter / 1024:.1f} MiB ({(rssAfter - rssBefore) / 1024:+.1f} MiB during run)')
+
+
+async def waitForServer() -> None:
+    """Wait for the server to start accepting requests."""
+    async with httpx.AsyncClient() as client:
+        for _ in range(600):
+            try:
+                await client.get(f'{BASE_URL}/test')
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise TimeoutError('Server did not start.')
+
+
+def main(rooms: int, sides: int, duration: float, useMsgpack: bool) -> None:
+    """Start the server, and run the load test against it."""
+    codec = CODECS['vtt.msgpack'] if useMsgpack else DEFAULT_CODEC
+    server = multiprocessing.Process(target=runServer, args=(rooms, sides), daemon=True)
+    server.start()
+    try:
+        asyncio.run(waitForServer())
+        asyncio.run(runLoad(rooms, sides, duration, codec, server.pid or 0))
+    finally:
+        server.terminate()
+        server.join()
+
+
+if (__name__ == '__main__'):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=1, help='simulated turntables (each with one host)')
+    parser.add_argument('--sides', type=int, default=10, help='remotes per turntable')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--msgpack', action='store_true', help='remotes use the MessagePack wire format')
+    args = parser.parse_args()
+    main(args.rooms, args.sides, args.duration, args.msgpack)
@@ -0,0 +1,108 @@
+"""
+Resolve every album in the class manifest to its music provider ID, so that scans need no search.
+The results are stored alongside the manifest (data/providerIDs.json); only new or changed entries are resolved.
+
+Usage (from ./server):
+    python -m modelling.resolveProviderIDs [--concurrency 4] [--full]
+"""
+import argparse
+import asyncio
+import json
+import os
+from typing import Any, Final
+
+import httpx
+from dotenv import load_dotenv
+
+from app.APIs.httpClient import HTTPClient
+from app.APIs.MusicAPI.IMusicAPI import IMusicAPI
+from app.APIs.MusicAPI.SpotifyAPI import SpotifyAPI
+from app.modules.modelHandler import PROVIDER_IDS_FILE
+from app.modules.sessionManager import SessionManager
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.ttlCache import cacheKey
+
+DATA_DIR: Final = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+RETRIES: Final = 5
+
+
+async def resolve(musicAPI: IMusicAPI, token: str, album: dict[str, Any]) -> dict[str, str] | None:
+    """Resolve a single album, waiting out the provider's rate limit (429) when necessary."""
+    for attempt in range(RETRIES):
+        try:
+            # (strict, so that a rate limited search is raised, rather than returning a lower-priority match)
+            return await musicAPI.searchForAlbum(album, token, strict=True)
+        except httpx.HTTPStatusError as e:
+            if (e.response.status_code != 429 or attempt == RETRIES - 1):
+                raise
+            delay = float(e.response.headers.get('Retry-After', 2 ** attempt))
+            print(f'Rate limited; retrying in {delay}s')
+            await asyncio.sleep(delay)
+    return None
+
+
+def save(path: str, providerIDs: dict[str, Any]) -> None:
+    """Write the resolved IDs (atomically, so an interrupted run leaves a valid file)."""
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+        json.dump(providerIDs, file, indent=4, sort_keys=True)
+    os.replace(f'{path}.tmp', path)
+
+
+async def main(concurrency: int, full: bool) -> None:
+    """Resolve the new or changed manifest entries."""
+    with open(os.path.join(DATA_DIR, 'manifest.json'), 'r', encoding='utf-8') as file:
+        MANIFEST: Final[dict[str, dict[str, Any]]] = json.load(file)
+    OUT_PATH: Final = os.path.join(DATA_DIR, PROVIDER_IDS_FILE)
+    providerIDs: dict[str, dict[str, dict[str, str | None]]] = {}
+    if (os.path.exists(OUT_PATH)):
+        with open(OUT_PATH, 'r', encoding='utf-8') as file:
+            providerIDs = json.load(file)
+
+    # (searches are issued concurrently by each resolution, so the pool is limited per host too)
+    httpClient = HTTPClient(hostLimits={'api.spotify.com': concurrency * 2})
+    musicAPI: IMusicAPI = SpotifyAPI(SessionManager(LocalStateBus()), 'localhost', None, None, httpClient)
+    resolved = providerIDs.setdefault(musicAPI.getProviderName(), {})
+
+    # prune removed classes, and find new (or changed) ones
+    for albumClass in set(resolved) - set(MANIFEST):
+        del resolved[albumClass]
+    PENDING: Final = [
+        albumClass for (albumClass, album) in MANIFEST.items()
+        if full or resolved.get(albumClass, {}).get('key') != cacheKey(album)
+    ]
+    print(f'{len(PENDING)} of {len(MANIFEST)} albums to resolve.')
+
+    token = await musicAPI.getClientToken()
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {'resolved': 0, 'notFound': 0, 'failed': 0}
+
+    async def resolveClass(albumClass: str) -> None:
+        async with semaphore:
+            album = MANIFEST[albumClass]
+            try:
+                result = await resolve(musicAPI, token, album)
+            except httpx.HTTPError as e:
+                # (not recorded, so the next run retries it)
+                print(f'Failed to resolve {albumClass}: {e}')
+                counts['failed'] += 1
+                return
+            # (misses, i.e. every search completed without a match, are recorded too,
+            # so they are not searched again until the entry changes)
+            resolved[albumClass] = {'key': cacheKey(album), **(result or {'medium': None, 'id': None})}
+            counts['resolved' if result else 'notFound'] += 1
+
+    try:
+        await asyncio.gather(*(resolveClass(albumClass) for albumClass in PENDING))
+    finally:
+        save(OUT_PATH, providerIDs)
+        await httpClient.close()
+    print(f'Done: {counts}')
+
+
+if (__name__ == '__main__'):
+    load_dotenv('.env')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=4, help='albums resolved at once')
+    parser.add_argument('--full', action='store_true', help='resolve every album, not only new or changed ones')
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.full))
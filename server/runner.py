@@ -1,12 +1,20 @@
 """Server runner for the FastAPI application."""
 
+import os
+
 import uvicorn
 
 if (__name__ == '__main__'):
+    WORKERS = int(os.getenv('WORKERS', '1'))
+    if (WORKERS > 1):
+        # workers must share their state
+        os.environ.setdefault('STATE_BUS', 'sqlite')
+
     uvicorn.run(
         'app.main:serverInstance.app',
         host='0.0.0.0',
         port=8491,
+        workers=WORKERS,
         # ssl_certfile='../certs/cert.pem',
         # ssl_keyfile='../certs/cert-key.pem',
         # reload=True,
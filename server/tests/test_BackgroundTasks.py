@@ -0,0 +1,51 @@
+"""Test suite for the BackgroundTasks class."""
+import asyncio
+import unittest
+
+from app.modules.backgroundTasks import BackgroundTasks
+
+
+class TestBackgroundTasks(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the BackgroundTasks class."""
+
+    def setUp(self) -> None:
+        """Set up a tracker with a short backoff."""
+        self.backgroundTasks: BackgroundTasks = BackgroundTasks(retries=2, backoff=0.001)
+
+    async def testRetries(self) -> None:
+        """Test that failed work is retried until it succeeds."""
+        attempts = []
+
+        async def work() -> str:
+            attempts.append(1)
+            if (len(attempts) < 3):
+                raise RuntimeError('Transient failure.')
+            return 'done'
+
+        self.assertEqual(await self.backgroundTasks.run('work', work), 'done')
+        self.assertEqual(
+            self.backgroundTasks.summary(),
+            {'running': 0, 'succeeded': {'work': 1}, 'retried': {'work': 2}, 'failed': {}},
+        )
+
+    async def testFailure(self) -> None:
+        """Test that work is abandoned once the retries are exhausted."""
+        async def work() -> None:
+            raise RuntimeError('Permanent failure.')
+
+        self.assertIsNone(await self.backgroundTasks.run('work', work))
+        self.assertEqual(self.backgroundTasks.summary()['failed'], {'work': 1})
+
+    async def testClose(self) -> None:
+        """Test that outstanding work is cancelled on close."""
+        task = self.backgroundTasks.run('work', lambda: asyncio.sleep(10))
+        await asyncio.sleep(0)
+        self.assertEqual(self.backgroundTasks.summary()['running'], 1)
+
+        await self.backgroundTasks.close()
+        self.assertTrue(task.cancelled())
+        self.assertEqual(self.backgroundTasks.summary()['running'], 0)
+
+
+if (__name__ == '__main__'):
+    unittest.main()
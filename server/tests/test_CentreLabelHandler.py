@@ -1,19 +1,26 @@
 """Test suite for the CentreLabelHandler class and its utility functions."""
+import asyncio
 import os
 import tempfile
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 
+import cv2
 import numpy as np
 from fastapi import HTTPException
 from unittest.mock import MagicMock, patch
 
 from app.modules.centreLabelHandler import (
+    decodeImage,
     detectCircle,
     cropLabel,
-    processImages,
+    findLabel,
     CentreLabelHandler,
 )
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.ttlCache import TTLCache
 from app.APIs.DiscogsAPI import DiscogsAPI  # Dummy discogs API for testing
 
 
@@ -25,26 +32,37 @@ class TestImageProcessingUtils(unittest.TestCase):
     @patch("app.modules.centreLabelHandler.cv2.HoughCircles")
     @patch("app.modules.centreLabelHandler.cv2.GaussianBlur")
     @patch("app.modules.centreLabelHandler.cv2.cvtColor")
-    @patch("app.modules.centreLabelHandler.cv2.imread")
-    def test_detectCircle(self, mockImread: Any, mockCvtColor: Any, mockBlur: Any, mockHough: Any) -> None:
+    def test_detectCircle(self, mockCvtColor: Any, mockBlur: Any, mockHough: Any) -> None:
         """Test detectCircle returns detected circles."""
-        # Create dummy image (e.g. 500x500 with 3 channels)
-        dummyImage: np.ndarray = np.zeros((500, 500, 3), dtype=np.uint8)
-        mockImread.return_value = dummyImage
-        dummyGrey: np.ndarray = np.zeros((500, 500), dtype=np.uint8)
+        # Create dummy image (e.g. 300x300 with 3 channels; too small to be downscaled)
+        dummyImage: np.ndarray = np.zeros((300, 300, 3), dtype=np.uint8)
+        dummyGrey: np.ndarray = np.zeros((300, 300), dtype=np.uint8)
         mockCvtColor.return_value = dummyGrey
-        dummyBlurred: np.ndarray = np.zeros((500, 500), dtype=np.uint8)
+        dummyBlurred: np.ndarray = np.zeros((300, 300), dtype=np.uint8)
         mockBlur.return_value = dummyBlurred
         dummyCircles: np.ndarray = np.array([[[250, 250, 100]]])
         mockHough.return_value = dummyCircles
 
-        circles: Optional[np.ndarray] = detectCircle("dummy.jpg")
+        circles: Optional[np.ndarray] = detectCircle(dummyImage)
         self.assertIsNotNone(circles)
         self.assertTrue((circles == dummyCircles).all())
 
+    def test_detectCircle_downscaled(self) -> None:
+        """Test detectCircle finds a label in a large image (detected downscaled), to within a few pixels."""
+        dummyImage: np.ndarray = np.full((1200, 1200, 3), 20, dtype=np.uint8)
+        cv2.circle(dummyImage, (590, 610), 510, (40, 40, 40), 2)  # (the edge of the record)
+        cv2.circle(dummyImage, (590, 610), 450, (200, 120, 40), -1)
+
+        circles: Optional[np.ndarray] = detectCircle(dummyImage)
+        self.assertIsNotNone(circles)
+        (x, y, r) = circles[0, 0]
+        self.assertLess(max(abs(x - 590), abs(y - 610), abs(r - 450)), 3)
+
+        # (no circle, no label)
+        self.assertIsNone(detectCircle(np.full((1200, 1200, 3), 20, dtype=np.uint8)))
+
     @patch("app.modules.centreLabelHandler.detectCircle")
-    @patch("app.modules.centreLabelHandler.cv2.imread")
-    def test_cropLabel(self, mockImread: Any, mockDetect: Any) -> None:
+    def test_cropLabel(self, mockDetect: Any) -> None:
         """Test cropLabel returns a cropped image when a circle is detected."""
         # Prepare a dummy circle: one circle at (100, 100) with radius 50.
         dummyCircles: np.ndarray = np.array([[[100, 100, 50]]])
@@ -52,35 +70,37 @@ class TestImageProcessingUtils(unittest.TestCase):
 
         # Create a dummy image: 200x200 pixels with three channels.
         dummyImage: np.ndarray = np.random.randint(0, 256, (200, 200, 3), dtype=np.uint8)
-        mockImread.return_value = dummyImage
 
-        cropped: Optional[np.ndarray] = cropLabel("dummy.jpg")
+        cropped: Optional[np.ndarray] = cropLabel(dummyImage)
         self.assertIsNotNone(cropped)
         # The cropped region should be from (50,50) to (150,150)
         expected: np.ndarray = dummyImage[50:150, 50:150]
         self.assertTrue(np.array_equal(cropped, expected))
 
-    def test_processImages(self) -> None:
-        """Test processImages returns the first candidate crop in a directory."""
-        with tempfile.TemporaryDirectory() as tmpDir:
-            # Create two dummy image files.
-            fileNames: List[str] = ["a.jpg", "b.png"]
-            for fileName in fileNames:
-                filePath: str = os.path.join(tmpDir, fileName)
-                with open(filePath, "wb") as f:
-                    f.write(b"dummy data")
-            # Patch cropLabel to return a dummy crop when called.
-            with patch("app.modules.centreLabelHandler.cropLabel", return_value=np.array([[1, 2], [3, 4]])) as mockCrop:
-                result: Optional[np.ndarray] = processImages(tmpDir)
-                self.assertIsNotNone(result)
-                self.assertTrue((result == np.array([[1, 2], [3, 4]])).all())
-                # Ensure cropLabel was called for at least one file.
-                self.assertGreaterEqual(mockCrop.call_count, 1)
+    def test_decodeImage(self) -> None:
+        """Test decodeImage decodes encoded images in memory, and rejects invalid data."""
+        dummyImage: np.ndarray = np.random.randint(0, 256, (20, 30, 3), dtype=np.uint8)
+        (_, encoded) = cv2.imencode(".png", dummyImage)
+
+        decoded: Optional[np.ndarray] = decodeImage(encoded.tobytes())
+        self.assertTrue(np.array_equal(decoded, dummyImage))
+        self.assertIsNone(decodeImage(b"dummy data"))
+
+    def test_findLabel(self) -> None:
+        """Test findLabel decodes a candidate and crops it to its label."""
+        dummyImage: np.ndarray = np.full((300, 300, 3), 20, dtype=np.uint8)
+        with patch("app.modules.centreLabelHandler.cropLabel", return_value=np.array([[1, 2], [3, 4]])) as mockCrop:
+            result: Optional[np.ndarray] = findLabel(cv2.imencode(".png", dummyImage)[1].tobytes())
+            self.assertTrue((result == np.array([[1, 2], [3, 4]])).all())
+            self.assertTrue(np.array_equal(mockCrop.call_args[0][0], dummyImage))
+
+            self.assertIsNone(findLabel(b"dummy data"))
+            self.assertEqual(mockCrop.call_count, 1)
 
 
 # --- Tests for CentreLabelHandler class ---
 
-class TestCentreLabelHandler(unittest.TestCase):
+class TestCentreLabelHandler(unittest.IsolatedAsyncioTestCase):
     """Test suite for the CentreLabelHandler class."""
 
     def setUp(self) -> None:
@@ -89,83 +109,211 @@ class TestCentreLabelHandler(unittest.TestCase):
         # Create a dummy DiscogsAPI using MagicMock.
         self.dummyDiscogs: DiscogsAPI = MagicMock(spec=DiscogsAPI)
         # Instantiate CentreLabelHandler; its __init__ creates required subdirectories.
-        self.handler: CentreLabelHandler = CentreLabelHandler(self.tempDir, self.dummyDiscogs)
+        # (detecting in a thread, rather than the process pool, so that detection may be patched)
+        self.handler: CentreLabelHandler = CentreLabelHandler(
+            self.tempDir, self.dummyDiscogs, executor=ThreadPoolExecutor(max_workers=1)
+        )
 
     def tearDown(self) -> None:
         """Remove temporary directories after tests."""
         import shutil
 
+        self.handler.close()
         shutil.rmtree(self.tempDir, ignore_errors=True)
 
     def test_directoriesCreated(self) -> None:
         """Test that required subdirectories are created on initialisation."""
         centreLabelsDir: str = os.path.join(self.tempDir, "centreLabels")
-        candidatesDir: str = os.path.join(self.tempDir, "centreLabelCandidates")
         self.assertTrue(os.path.exists(centreLabelsDir))
-        self.assertTrue(os.path.exists(candidatesDir))
 
-    def test_findReleaseData_success(self) -> None:
+    async def test_findReleaseData_success(self) -> None:
         """Test findReleaseData returns release data when DiscogsAPI returns album data."""
         # Dummy album returned from searchRelease.
         dummyAlbum: Dict[str, str] = {"id": "12345"}
         self.dummyDiscogs.searchRelease.return_value = dummyAlbum
         # Dummy release data from getDataForRelease.
-        dummyData: Any = {"images": [{"uri": "http://example.com/img.jpg"}], "metadata": {}}
+        dummyData: Any = ([{"uri": "http://example.com/img.jpg", "type": "primary"}], {"rpm": 33})
         self.dummyDiscogs.getDataForRelease.return_value = dummyData
 
-        result: Any = self.handler.findReleaseData("Album", "Artist", "2020", "Vinyl")
-        self.assertEqual(result, dummyData)
+        result: Any = await self.handler.findReleaseData("Album", "Artist", "2020", "Vinyl")
+        self.assertEqual(result, ([{"uri": "http://example.com/img.jpg"}], {"rpm": 33}))
         self.dummyDiscogs.searchRelease.assert_called_once()
-        self.dummyDiscogs.getDataForRelease.assert_called_once_with(dummyAlbum["id"])
+        self.dummyDiscogs.getDataForRelease.assert_awaited_once_with(dummyAlbum["id"])
+
+    async def test_findReleaseData_cached(self) -> None:
+        """Test findReleaseData reuses cached release data (until it expires), without calling Discogs."""
+        self.handler.releaseCache = TTLCache(LocalStateBus(), "discogsReleases", ttl=60)
+        self.dummyDiscogs.searchRelease.return_value = {"id": "12345"}
+        self.dummyDiscogs.getDataForRelease.return_value = ([{"uri": "http://example.com/img.jpg"}], {"rpm": 33})
 
-    def test_findReleaseData_failure(self) -> None:
+        first: Any = await self.handler.findReleaseData("Album", "Artist", "2020", "Vinyl")
+        second: Any = await self.handler.findReleaseData("Album", "Artist", "2020", "Vinyl")
+        self.assertEqual(first, second)
+        self.assertEqual(self.dummyDiscogs.searchRelease.await_count, 1)
+        self.assertEqual(self.dummyDiscogs.getDataForRelease.await_count, 1)
+        self.assertEqual(self.handler.releaseCache.summary()["hits"], 1)
+
+        # (a different search is not served from the cache)
+        await self.handler.findReleaseData("Album", None, None, "Vinyl")
+        self.assertEqual(self.dummyDiscogs.searchRelease.await_count, 2)
+
+        # (nor are expired entries)
+        with patch("app.modules.ttlCache.time.time", return_value=time.time() + 120):
+            await self.handler.findReleaseData("Album", "Artist", "2020", "Vinyl")
+        self.assertEqual(self.dummyDiscogs.searchRelease.await_count, 3)
+
+    async def test_findReleaseData_failure(self) -> None:
         """Test findReleaseData raises HTTPException when no album is found."""
         self.dummyDiscogs.searchRelease.return_value = None
         with self.assertRaises(HTTPException) as context:
-            self.handler.findReleaseData("Album", "Artist", "2020", "Vinyl")
+            await self.handler.findReleaseData("Album", "Artist", "2020", "Vinyl")
         self.assertEqual(context.exception.status_code, 404)
 
-    @patch("os.remove")
-    @patch("os.listdir")
-    def test_downloadCandidates(self, mockListdir: Any, mockRemove: Any) -> None:
-        """Test downloadCandidates clears old files and downloads new candidate images."""
-        # Set up a dummy list of files in the candidates directory.
-        candidatesDir: str = os.path.join(self.tempDir, "centreLabelCandidates")
-        mockListdir.return_value = ["old1.png", "old2.png"]
-        albumID: str = "12345"
-        dummyImages: List[Dict[str, Any]] = [
-            {"uri": "http://example.com/img1.jpg"},
-            {"uri": "http://example.com/img2.jpg"}
-        ]
-        self.handler.downloadCandidates(albumID, dummyImages)
-        # Expect os.remove to be called for each old file.
-        self.assertEqual(mockRemove.call_count, 2)
-        # Verify DiscogsAPI.downloadImage called for each candidate.
-        calls = [((dummyImages[i]["uri"], os.path.join(candidatesDir, f'{albumID}({i}).png')),) for i in range(len(dummyImages))]
-        self.dummyDiscogs.downloadImage.assert_has_calls(calls, any_order=True)
-
-    @patch.object(CentreLabelHandler, "downloadCandidates")
+    async def test_findCentreLabel(self) -> None:
+        """Test findCentreLabel stops at the first label found, cancelling the remaining downloads."""
+        (_, encoded) = cv2.imencode(".png", np.zeros((10, 10, 3), dtype=np.uint8))
+        fetched: List[str] = []
+
+        async def fetchImage(url: str) -> bytes:
+            fetched.append(url)
+            await asyncio.sleep(0.01)
+            return encoded.tobytes()
+        self.dummyDiscogs.fetchImage.side_effect = fetchImage
+
+        dummyImages: List[Dict[str, Any]] = [{"uri": f"http://example.com/img{i}.jpg"} for i in range(6)]
+        crops = iter([None, np.array([[1, 2], [3, 4]])])
+        with patch("app.modules.centreLabelHandler.cropLabel", side_effect=lambda _: next(crops)):
+            result: Optional[np.ndarray] = await self.handler.findCentreLabel(dummyImages)
+
+        self.assertTrue((result == np.array([[1, 2], [3, 4]])).all())
+        # (only the candidates downloaded ahead of detection are fetched)
+        self.assertLess(len(fetched), len(dummyImages))
+        self.assertEqual(self.handler.summary()["candidatesFetched"], 2)
+
+    async def test_findCentreLabel_none(self) -> None:
+        """Test findCentreLabel checks every candidate, when no label is found."""
+        self.dummyDiscogs.fetchImage.return_value = b"dummy data"  # (not an image)
+
+        dummyImages: List[Dict[str, Any]] = [{"uri": f"http://example.com/img{i}.jpg"} for i in range(3)]
+        self.assertIsNone(await self.handler.findCentreLabel(dummyImages))
+        self.assertEqual(self.dummyDiscogs.fetchImage.await_count, 3)
+
+    async def test_findCentreLabel_processPool(self) -> None:
+        """Test findCentreLabel detects labels in the (default) process pool, for concurrent searches."""
+        dummyImage: np.ndarray = np.full((1000, 1000, 3), 20, dtype=np.uint8)
+        cv2.circle(dummyImage, (500, 500), 400, (200, 120, 40), -1)
+        (_, encoded) = cv2.imencode(".png", dummyImage)
+        self.dummyDiscogs.fetchImage.return_value = encoded.tobytes()
+
+        handler = CentreLabelHandler(self.tempDir, self.dummyDiscogs)
+        try:
+            results = await asyncio.gather(
+                *(handler.findCentreLabel([{"uri": f"http://example.com/img{i}.jpg"}]) for i in range(3))
+            )
+        finally:
+            handler.close()
+        for result in results:
+            self.assertIsNotNone(result)
+            self.assertLess(abs(result.shape[0] - 800), 6)
+        self.assertEqual(handler.summary()["timings"]["detection"]["count"], 3)
+
+    @patch.object(CentreLabelHandler, "findCentreLabel")
     @patch.object(CentreLabelHandler, "getCandidates")
-    def test_serveCentreLabel_withImages(self, mockGetCandidates: Any, mockDownloadCandidates: Any) -> None:
-        """Test serveCentreLabel downloads candidates and writes the centre label image."""
-        # Simulate that processImages returns a dummy crop.
-        dummyCrop: np.ndarray = np.array([[1, 2], [3, 4]])
-        with patch("app.modules.centreLabelHandler.processImages", return_value=dummyCrop) as mockProcess:
-            with patch("app.modules.centreLabelHandler.cv2.imwrite") as mockImwrite:
-                result: bool = self.handler.serveCentreLabel("12345", images=[{"uri": "http://example.com/img.jpg"}])
-                self.assertTrue(result)
-                mockDownloadCandidates.assert_called_once_with("12345", [{"uri": "http://example.com/img.jpg"}])
-                # Verify cv2.imwrite was called with the correct file path.
-                centreLabelsDir: str = os.path.join(self.tempDir, "centreLabels")
-                expectedPath: str = os.path.join(centreLabelsDir, "12345.png")
-                mockImwrite.assert_called_once_with(expectedPath, dummyCrop)
-
-    def test_serveCentreLabel_noAlbumName(self) -> None:
+    async def test_serveCentreLabel_withImages(self, mockGetCandidates: Any, mockFindCentreLabel: Any) -> None:
+        """Test serveCentreLabel searches the candidates and writes the centre label image."""
+        # Simulate that findCentreLabel returns a dummy crop.
+        dummyCrop: np.ndarray = np.array([[1, 2], [3, 4]], dtype=np.uint8)
+        mockFindCentreLabel.return_value = dummyCrop
+        result: Optional[bytes] = await self.handler.serveCentreLabel(
+            "12345", images=[{"uri": "http://example.com/img.jpg"}]
+        )
+        self.assertIsNotNone(result)
+        mockGetCandidates.assert_not_awaited()
+        mockFindCentreLabel.assert_awaited_once_with([{"uri": "http://example.com/img.jpg"}])
+        # Verify the label was stored in the cache (encoded), and returned.
+        self.assertEqual(self.handler.labelCache.get("12345"), result)
+        written: Optional[np.ndarray] = cv2.imdecode(np.frombuffer(result, np.uint8), cv2.IMREAD_GRAYSCALE)
+        self.assertEqual(written.shape, dummyCrop.shape)
+
+    async def test_serveCentreLabel_noAlbumName(self) -> None:
         """Test serveCentreLabel raises HTTPException when no albumName is provided and images is None."""
         with self.assertRaises(HTTPException) as context:
-            self.handler.serveCentreLabel("12345")
+            await self.handler.serveCentreLabel("12345")
         self.assertEqual(context.exception.status_code, 400)
 
+    async def test_getCentreLabel_coalesced(self) -> None:
+        """Test concurrent requests for an album share one search, while other albums are searched separately."""
+        self.dummyDiscogs.searchRelease.return_value = {"id": "12345"}
+        self.dummyDiscogs.getDataForRelease.return_value = ([{"uri": "http://example.com/img.jpg"}], {"rpm": 33})
+
+        async def findCentreLabel(images: List[Any]) -> np.ndarray:
+            await asyncio.sleep(0.01)
+            return np.zeros((2, 2, 3), dtype=np.uint8)
+
+        with patch.object(self.handler, "findCentreLabel", side_effect=findCentreLabel) as mockFind:
+            results = await asyncio.gather(
+                *(self.handler.getCentreLabel("album1", "Album", "Artist", None) for _ in range(5)),
+                self.handler.getCentreLabel("album2", "Other", "Artist", None),
+            )
+        self.assertEqual(mockFind.await_count, 2)
+        self.assertEqual(self.handler.summary()["coalesced"], 4)
+        for (label, metadata) in results:
+            self.assertEqual(label[8:12], b"WEBP")
+            self.assertEqual(metadata, {"rpm": 33})
+        # (the albums' labels are identical, so are stored once)
+        labelSummary: Dict[str, Any] = self.handler.labelCache.summary()
+        self.assertEqual((labelSummary["entries"], labelSummary["references"]), (1, 2))
+
+        # (once found, the label is served from the cache)
+        with patch.object(self.handler, "findCentreLabel") as mockFind:
+            (label, _) = await self.handler.getCentreLabel("album1", "Album", "Artist", None)
+        mockFind.assert_not_called()
+        self.assertEqual(label, results[0][0])
+
+    async def test_getCentreLabel_cachedFirst(self) -> None:
+        """Test a cached label is served without searching its candidates, even if its metadata cannot be found."""
+        self.handler.labelCache.put("album1", b"label")
+        self.dummyDiscogs.searchRelease.side_effect = HTTPException(status_code=503)
+
+        with patch.object(self.handler, "findCentreLabel") as mockFind:
+            (label, metadata) = await self.handler.getCentreLabel("album1", "Album", "Artist", None)
+        mockFind.assert_not_called()
+        self.assertEqual((label, metadata), (b"label", {}))
+
+    async def test_getCentreLabel_broaderSearch(self) -> None:
+        """Test the broader search is attempted when no label is found (only if it finds other candidates)."""
+        self.dummyDiscogs.searchRelease.side_effect = lambda albumName, artistName, year, medium: (
+            {"id": "1"} if artistName is not None else {"id": "2"}
+        )
+        self.dummyDiscogs.getDataForRelease.side_effect = lambda releaseID: (
+            [{"uri": f"http://example.com/{releaseID}.jpg"}], {}
+        )
+        with patch.object(self.handler, "findCentreLabel", return_value=None) as mockFind:
+            (label, metadata) = await self.handler.getCentreLabel("12345", "Album", "Artist", None)
+        self.assertIsNone(label)
+        self.assertEqual(metadata, {})
+        self.assertEqual(
+            [call.args[0] for call in mockFind.await_args_list],
+            [[{"uri": "http://example.com/1.jpg"}], [{"uri": "http://example.com/2.jpg"}]],
+        )
+
+    async def test_getCentreLabel_migratesLegacyLabel(self) -> None:
+        """Test labels stored in the previous format (PNG) are moved into the cache when requested."""
+        self.dummyDiscogs.searchRelease.return_value = {"id": "12345"}
+        self.dummyDiscogs.getDataForRelease.return_value = ([{"uri": "http://example.com/img.jpg"}], {})
+        legacyPath: str = os.path.join(self.tempDir, "centreLabels", "album1.png")
+        cv2.imwrite(legacyPath, np.zeros((20, 20, 3), dtype=np.uint8))
+        self.handler.labelCache.rebuild()  # (as on startup, counting the label in the previous format)
+        self.assertEqual(self.handler.labelCache.summary()["sizeBytes"], os.path.getsize(legacyPath))
+
+        with patch.object(self.handler, "findCentreLabel") as mockFind:
+            (label, _) = await self.handler.getCentreLabel("album1", "Album", "Artist", None)
+        mockFind.assert_not_called()
+        self.assertEqual(label[8:12], b"WEBP")
+        self.assertFalse(os.path.exists(legacyPath))
+        self.assertEqual(self.handler.labelCache.get("album1"), label)
+        self.assertEqual(self.handler.labelCache.summary()["sizeBytes"], len(label))
+
 
 if (__name__ == "__main__"):
     unittest.main()
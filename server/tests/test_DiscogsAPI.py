@@ -1,12 +1,13 @@
 import unittest
 from typing import Any, Dict, List, Optional
 
-from unittest.mock import patch, MagicMock, mock_open
+import httpx
 
 from app.APIs.DiscogsAPI import DiscogsAPI
+from app.APIs.httpClient import HTTPClient
 
 
-class TestDiscogsAPI(unittest.TestCase):
+class TestDiscogsAPI(unittest.IsolatedAsyncioTestCase):
     """Test suite for the DiscogsAPI class."""
 
     def setUp(self) -> None:
@@ -15,120 +16,96 @@ class TestDiscogsAPI(unittest.TestCase):
         self.apiSecret: str = "testSecret"
         self.version: str = "1.0.0"
         self.contact: str = "test@example.com"
-        self.discogs: DiscogsAPI = DiscogsAPI(self.apiKey, self.apiSecret, self.version, self.contact)
 
-    @patch("app.APIs.DiscogsAPI.requests.get")
-    def test_searchRelease_success(self, mockGet: Any) -> None:
+        # Stub Discogs server: responds with the queued responses, recording each request.
+        self.responses: List[httpx.Response] = []
+        self.requests: List[httpx.Request] = []
+
+        def handle(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            return self.responses.pop(0)
+
+        self.httpClient: HTTPClient = HTTPClient(transport=httpx.MockTransport(handle))
+        self.discogs: DiscogsAPI = DiscogsAPI(self.apiKey, self.apiSecret, self.version, self.contact, self.httpClient)
+
+    async def asyncTearDown(self) -> None:
+        """Close the HTTP client."""
+        await self.httpClient.close()
+
+    async def test_searchRelease_success(self) -> None:
         """Test searchRelease returns the top result when results are present."""
-        # Prepare dummy response data.
         dummyResult: Dict[str, str] = {"id": "123", "title": "Test Release"}
-        dummyData: Dict[str, Any] = {"results": [dummyResult]}
-        dummyResponse: MagicMock = MagicMock()
-        dummyResponse.json.return_value = dummyData
-        dummyResponse.raise_for_status.return_value = None
-        mockGet.return_value = dummyResponse
+        self.responses.append(httpx.Response(200, json={"results": [dummyResult]}))
 
-        result: Optional[Dict[str, str]] = self.discogs.searchRelease("Album", "Artist", "2020", "Vinyl")
+        result: Optional[Dict[str, str]] = await self.discogs.searchRelease("Album", "Artist", "2020", "Vinyl")
         self.assertEqual(result, dummyResult)
 
         # Verify that the URL was constructed correctly.
-        args, kwargs = mockGet.call_args
-        url: str = args[0]
+        url: str = str(self.requests[0].url)
         self.assertIn("release_title=Album", url)
         self.assertIn("artist=Artist", url)
         self.assertIn("year=2020", url)
         self.assertIn("format=Vinyl", url)
+        self.assertEqual(self.requests[0].headers["User-Agent"], "Virtual Turntable/1.0.0 (test@example.com)")
 
-    @patch("app.APIs.DiscogsAPI.requests.get")
-    def test_searchRelease_fallback(self, mockGet: Any) -> None:
+    async def test_searchRelease_fallback(self) -> None:
         """Test searchRelease re-searches without extra params if no results found initially."""
-        # First call: no results.
-        dummyDataEmpty: Dict[str, Any] = {"results": []}
-        dummyResponseEmpty: MagicMock = MagicMock()
-        dummyResponseEmpty.json.return_value = dummyDataEmpty
-        dummyResponseEmpty.raise_for_status.return_value = None
-
-        # Second call: returns a result.
         dummyResult: Dict[str, str] = {"id": "456", "title": "Fallback Release"}
-        dummyDataSuccess: Dict[str, Any] = {"results": [dummyResult]}
-        dummyResponseSuccess: MagicMock = MagicMock()
-        dummyResponseSuccess.json.return_value = dummyDataSuccess
-        dummyResponseSuccess.raise_for_status.return_value = None
-
-        # Side effect: first call returns empty, second call returns valid result.
-        mockGet.side_effect = [dummyResponseEmpty, dummyResponseSuccess]
+        self.responses.extend([
+            httpx.Response(200, json={"results": []}),
+            httpx.Response(200, json={"results": [dummyResult]}),
+        ])
 
-        result: Optional[Dict[str, str]] = self.discogs.searchRelease("Album", "Artist", "2020", "Vinyl")
+        result: Optional[Dict[str, str]] = await self.discogs.searchRelease("Album", "Artist", "2020", "Vinyl")
         self.assertEqual(result, dummyResult)
-        self.assertEqual(mockGet.call_count, 2)
+        self.assertEqual(len(self.requests), 2)
+        self.assertNotIn("artist=", str(self.requests[1].url))
 
-    @patch("app.APIs.DiscogsAPI.requests.get")
-    def test_searchRelease_noResults(self, mockGet: Any) -> None:
+    async def test_searchRelease_noResults(self) -> None:
         """Test searchRelease returns None if no results are found even after fallback."""
-        dummyDataEmpty: Dict[str, Any] = {"results": []}
-        dummyResponseEmpty: MagicMock = MagicMock()
-        dummyResponseEmpty.json.return_value = dummyDataEmpty
-        dummyResponseEmpty.raise_for_status.return_value = None
-
-        # Both calls return empty results.
-        mockGet.side_effect = [dummyResponseEmpty, dummyResponseEmpty]
+        self.responses.extend([
+            httpx.Response(200, json={"results": []}),
+            httpx.Response(200, json={"results": []}),
+        ])
 
-        result: Optional[Dict[str, str]] = self.discogs.searchRelease("Album", "Artist", "2020", "Vinyl")
+        result: Optional[Dict[str, str]] = await self.discogs.searchRelease("Album", "Artist", "2020", "Vinyl")
         self.assertIsNone(result)
-        self.assertEqual(mockGet.call_count, 2)
+        self.assertEqual(len(self.requests), 2)
 
-    @patch("app.APIs.DiscogsAPI.requests.get")
-    def test_getDataForRelease(self, mockGet: Any) -> None:
+    async def test_searchRelease_error(self) -> None:
+        """Test searchRelease raises when Discogs returns an error."""
+        self.responses.append(httpx.Response(500))
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            await self.discogs.searchRelease("Album", None, None, None)
+
+    async def test_getDataForRelease(self) -> None:
         """Test that getDataForRelease returns images and formatted metadata."""
-        # Prepare dummy release data.
         dummyImages: List[Dict[str, Any]] = [{"uri": "http://example.com/image1.jpg"}]
         dummyFormats: List[Dict[str, Any]] = [{
             "name": "Vinyl",
             "text": "Red Marble Edition"
         }]
-        dummyData: Dict[str, Any] = {
-            "images": dummyImages,
-            "formats": dummyFormats
-        }
-        dummyResponse: MagicMock = MagicMock()
-        dummyResponse.json.return_value = dummyData
-        dummyResponse.raise_for_status.return_value = None
-        mockGet.return_value = dummyResponse
-
-        images, metadata = self.discogs.getDataForRelease("789")
+        self.responses.append(httpx.Response(200, json={"images": dummyImages, "formats": dummyFormats}))
+
+        images, metadata = await self.discogs.getDataForRelease("789")
         self.assertEqual(images, dummyImages)
         # The first word "red" should be used for colour and marble detected.
         self.assertEqual(metadata.get("colour"), "red")
         self.assertTrue(metadata.get("marble"))
 
         # Verify URL formation.
-        args, kwargs = mockGet.call_args
-        url: str = args[0]
-        self.assertIn("/releases/789", url)
+        self.assertIn("/releases/789", str(self.requests[0].url))
 
-    @patch("app.APIs.DiscogsAPI.requests.get")
-    def test_downloadImage(self, mockGet: Any) -> None:
-        """Test that downloadImage writes response content to a file."""
+    async def test_fetchImage(self) -> None:
+        """Test that fetchImage returns the image content, requested with the Discogs credentials."""
         dummyContent: bytes = b"image bytes"
-        dummyResponse: MagicMock = MagicMock()
-        dummyResponse.content = dummyContent
-        dummyResponse.raise_for_status.return_value = None
-        mockGet.return_value = dummyResponse
+        self.responses.append(httpx.Response(200, content=dummyContent))
 
         dummyURL: str = "http://example.com/image.jpg"
-        dummyPath: str = "dummy_image.jpg"
-
-        # Patch open so that no actual file is written.
-        m_open = mock_open()
-        with patch("builtins.open", m_open, create=True):
-            self.discogs.downloadImage(dummyURL, dummyPath)
-
-        # Ensure that requests.get was called with correct parameters.
-        mockGet.assert_called_with(dummyURL, headers=self.discogs.HEADERS, timeout=10)
-        # Verify that the file was opened in binary write mode and written to.
-        m_open.assert_called_with(dummyPath, "wb")
-        m_open().write.assert_called_once_with(dummyContent)
-
+        self.assertEqual(await self.discogs.fetchImage(dummyURL), dummyContent)
+        self.assertEqual(str(self.requests[0].url), dummyURL)
+        self.assertEqual(self.requests[0].headers["Authorization"], self.discogs.HEADERS["Authorization"])
 
 if (__name__ == "__main__"):
     unittest.main()
@@ -0,0 +1,61 @@
+"""Test suite for the EventStream class."""
+import asyncio
+import unittest
+from typing import AsyncIterator
+
+from app.modules.eventStream import EventStream, encodeEvent
+
+
+class TestEventStream(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the EventStream class."""
+
+    def setUp(self) -> None:
+        """Set up an event stream with a small buffer."""
+        self.stream: EventStream = EventStream(lambda: '{"command":"snapshot"}', bufferSize=2, keepAlive=0.05)
+
+    async def testSnapshotThenBroadcasts(self) -> None:
+        """Test that a viewer receives a snapshot, then each broadcast."""
+        viewer: AsyncIterator[bytes] = self.stream.subscribe()
+        self.assertEqual(await anext(viewer), encodeEvent('{"command":"snapshot"}', 0))
+        self.assertEqual(self.stream.subscribers, 1)
+
+        nextEvent = asyncio.ensure_future(anext(viewer))
+        await asyncio.sleep(0)
+        self.stream.publish({'command': 'playState', 'value': True})
+        self.assertEqual(await nextEvent, b'id: 1\ndata: {"command":"playState","value":true}\n\n')
+
+        await viewer.aclose()
+        self.assertEqual(self.stream.subscribers, 0)
+
+    async def testEventsSharedAcrossViewers(self) -> None:
+        """Test that each event is encoded once, and shared by all viewers."""
+        viewers: list[AsyncIterator[bytes]] = [self.stream.subscribe() for _ in range(3)]
+        for viewer in viewers:
+            await anext(viewer)
+
+        self.stream.publish({'command': 'playState', 'value': True})
+        received: list[bytes] = [await anext(viewer) for viewer in viewers]
+        self.assertTrue(all(event is received[0] for event in received))
+
+    async def testBatchedAndResynchronised(self) -> None:
+        """Test that pending events are batched, and slow viewers resynchronise from a snapshot."""
+        viewer: AsyncIterator[bytes] = self.stream.subscribe()
+        await anext(viewer)
+
+        self.stream.publish({'command': 'playState', 'value': True})
+        self.stream.publish({'command': 'playState', 'value': False})
+        self.assertEqual((await anext(viewer)).count(b'data: '), 2)
+
+        for value in range(3):  # overflows the buffer
+            self.stream.publish({'command': 'settings', 'value': value})
+        self.assertEqual(await anext(viewer), encodeEvent('{"command":"snapshot"}', 5))
+
+    async def testKeepAlive(self) -> None:
+        """Test that idle viewers receive keep-alive comments."""
+        viewer: AsyncIterator[bytes] = self.stream.subscribe()
+        await anext(viewer)
+        self.assertEqual(await anext(viewer), b': keep-alive\n\n')
+
+
+if (__name__ == '__main__'):
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Test suite for the HTTPClient class."""
+import asyncio
+import time
+import unittest
+from typing import Callable
+
+import httpx
+
+from app.APIs.httpClient import HTTPClient, parseRetryAfter
+
+
+class TestHTTPClient(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the HTTPClient class."""
+
+    def setUp(self) -> None:
+        """Set up a client, on a stub server."""
+        self.requests: list[httpx.Request] = []
+        self.respond: Callable[[httpx.Request], httpx.Response] = lambda _: httpx.Response(200, json={})
+
+        async def handle(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            await asyncio.sleep(0.01)
+            return self.respond(request)
+
+        self.httpClient: HTTPClient = HTTPClient(
+            transport=httpx.MockTransport(handle),
+            rateLimits={'limited.test': (2, 20)},
+            backoff=0.01,
+        )
+
+    async def asyncTearDown(self) -> None:
+        """Close the client."""
+        await self.httpClient.close()
+
+    async def testCoalescesGets(self) -> None:
+        """Test that identical concurrent GETs share a single upstream request."""
+        responses = await asyncio.gather(
+            *(self.httpClient.get('https://api.test/item', headers={'Authorization': 'a'}) for _ in range(5)),
+            self.httpClient.get('https://api.test/item', headers={'Authorization': 'b'}),
+            self.httpClient.post('https://api.test/item'),
+            self.httpClient.post('https://api.test/item'),
+        )
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(len(self.requests), 4)
+        self.assertEqual(self.httpClient.summary()['hosts']['api.test']['coalesced'], 4)
+
+        # (completed requests are not reused)
+        await self.httpClient.get('https://api.test/item', headers={'Authorization': 'a'})
+        self.assertEqual(len(self.requests), 5)
+
+    async def testRetryAfter(self) -> None:
+        """Test that rate-limited requests wait for the Retry-After period, then retry."""
+        self.respond = lambda _: (
+            httpx.Response(429, headers={'Retry-After': '0.05'}) if len(self.requests) == 1
+            else httpx.Response(200, json={})
+        )
+        startTime = time.perf_counter()
+        response = await self.httpClient.post('https://api.test/item')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(time.perf_counter() - startTime, 0.05)
+        stats = self.httpClient.summary()['hosts']['api.test']
+        self.assertEqual((stats['rateLimited'], stats['retries']), (1, 1))
+
+    async def testLongRetryAfter(self) -> None:
+        """Test that waits longer than the client will hold a request are returned to the caller."""
+        self.respond = lambda _: httpx.Response(429, headers={'Retry-After': '3600'})
+        response = await self.httpClient.get('https://api.test/item')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(self.requests), 1)
+
+    async def testRetriesIdempotentOnly(self) -> None:
+        """Test that transient server errors are retried for GETs, but not for other methods."""
+        self.respond = lambda _: httpx.Response(503)
+        self.assertEqual((await self.httpClient.get('https://api.test/item')).status_code, 503)
+        self.assertEqual(len(self.requests), 4)
+
+        self.assertEqual((await self.httpClient.post('https://api.test/item')).status_code, 503)
+        self.assertEqual(len(self.requests), 5)
+
+    async def testTokenBucket(self) -> None:
+        """Test that requests beyond a host's burst are spaced at its rate."""
+        startTime = time.perf_counter()
+        await asyncio.gather(*(self.httpClient.post('https://limited.test/item') for _ in range(4)))
+        # (2 immediately, then 1 every 0.05s)
+        self.assertGreaterEqual(time.perf_counter() - startTime, 0.09)
+        self.assertEqual(self.httpClient.summary()['hosts']['limited.test']['throttled'], 2)
+
+    def testParseRetryAfter(self) -> None:
+        """Test parsing of the Retry-After header."""
+        self.assertEqual(parseRetryAfter('2'), 2)
+        self.assertEqual(parseRetryAfter('-1'), 0)
+        self.assertIsNone(parseRetryAfter(None))
+        self.assertIsNone(parseRetryAfter('Wed, 21 Oct 2015 07:28:00 GMT'))
+
+
+if (__name__ == '__main__'):
+    unittest.main()
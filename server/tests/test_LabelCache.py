@@ -0,0 +1,158 @@
+"""Test suite for the LabelCache class."""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+from app.modules.labelCache import LABEL_FORMAT, LEGACY_FORMAT, LabelCache, encodeLabel
+
+
+class TestLabelCache(unittest.TestCase):
+    """Test suite for the LabelCache class."""
+
+    def setUp(self) -> None:
+        """Set up a cache (of 250 bytes) in a temporary directory."""
+        self.directory: str = tempfile.mkdtemp(prefix='labels_')
+        self.cache: LabelCache = LabelCache(self.directory, maxBytes=250)
+
+    def tearDown(self) -> None:
+        """Remove the temporary directory."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def testGetAndPut(self) -> None:
+        """Test that stored labels are returned (under safe file names), and misses return None."""
+        self.assertIsNone(self.cache.get('../album'))
+        self.cache.put('../album', b'label')
+        self.assertEqual(self.cache.get('../album'), b'label')
+
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted([LabelCache.labelName(b'label'), LabelCache.referenceName('../album')]),
+        )
+        summary = self.cache.summary()
+        self.assertEqual((summary['hits'], summary['misses'], summary['hitRatio']), (1, 1, 0.5))
+        self.assertEqual((summary['entries'], summary['sizeBytes']), (1, 5))
+
+    def testDeduplicated(self) -> None:
+        """Test that albums sharing a label share a single file, until it is evicted."""
+        self.cache.put('album', b'label')
+        self.cache.put('reissue', b'label')
+        self.assertEqual(self.cache.get('reissue'), b'label')
+        summary = self.cache.summary()
+        self.assertEqual((summary['entries'], summary['references'], summary['sizeBytes']), (1, 2, 5))
+        self.assertEqual(summary['deduplicated'], 1)
+
+        # (evicting the label removes both references)
+        self.cache.put('other', bytes(300))
+        self.assertIsNone(self.cache.get('album'))
+        self.assertIsNone(self.cache.get('reissue'))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def testEvictsLeastRecentlyUsed(self) -> None:
+        """Test that the least recently used labels are evicted, once over budget."""
+        for key in ('a', 'b', 'c'):
+            self.cache.put(key, key.encode() * 100)
+        self.assertIsNone(self.cache.get('a'))
+
+        self.cache.get('b')
+        self.cache.put('d', b'd' * 100)
+        self.assertIsNone(self.cache.get('c'))
+        self.assertIsNotNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('d'))
+
+        summary = self.cache.summary()
+        self.assertEqual((summary['entries'], summary['sizeBytes'], summary['evictions']), (2, 200, 2))
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+
+        # (a label larger than the budget is still kept, as the most recent)
+        self.cache.put('e', bytes(300))
+        self.assertEqual(self.cache.get('e'), bytes(300))
+        self.assertEqual(self.cache.summary()['entries'], 1)
+
+    def testRecencyOnlyRecordedWhenNeeded(self) -> None:
+        """Test that hits do not touch the disk, but their order is recorded when evicting (for the next rebuild)."""
+        for key in ('a', 'b'):
+            self.cache.put(key, key.encode() * 80)
+        with patch('app.modules.labelCache.os.utime') as mockUtime:
+            self.cache.get('a')
+            self.cache.get('b')
+            self.cache.get('a')
+            mockUtime.assert_not_called()
+
+        self.cache.put('c', b'c' * 80)
+        self.cache.put('d', b'd' * 80)  # (evicts b, the least recently used)
+        cache = LabelCache(self.directory, maxBytes=250)
+        self.assertEqual(list(cache.entries), [LabelCache.labelName(key.encode() * 80) for key in ('a', 'c', 'd')])
+
+    def testRebuild(self) -> None:
+        """Test that the index is rebuilt on startup, in order of use, and interrupted writes are removed."""
+        now = time.time()
+        for (i, key) in enumerate(('a', 'b', 'c')):
+            self.cache.put(key, key.encode() * 80)
+            path = os.path.join(self.directory, LabelCache.labelName(key.encode() * 80))
+            os.utime(path, (now + i, now + i))
+        os.utime(os.path.join(self.directory, LabelCache.labelName(b'a' * 80)), (now + 10, now + 10))  # (most recent)
+        with open(os.path.join(self.directory, 'interrupted.tmp'), 'wb') as file:
+            file.write(b'partial')
+        with open(os.path.join(self.directory, LabelCache.referenceName('evicted')), 'w', encoding='utf-8') as file:
+            file.write(LabelCache.labelName(b'evicted'))
+
+        cache = LabelCache(self.directory, maxBytes=250)
+        self.assertEqual(cache.summary()['sizeBytes'], 240)
+        self.assertEqual(cache.summary()['references'], 3)
+        self.assertNotIn('interrupted.tmp', os.listdir(self.directory))
+        self.assertNotIn(LabelCache.referenceName('evicted'), os.listdir(self.directory))
+
+        cache.put('d', b'd' * 80)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+
+    def testLegacyLabelsBounded(self) -> None:
+        """Test that labels in the previous format count towards the budget, so are evicted if never migrated."""
+        now = time.time()
+        for (i, albumID) in enumerate(('album1', 'album2', 'album3', 'album4')):
+            path = os.path.join(self.directory, f'{albumID}{LEGACY_FORMAT}')
+            with open(path, 'wb') as file:
+                file.write(bytes(100))
+            os.utime(path, (now + i, now + i))
+
+        cache = LabelCache(self.directory, maxBytes=250)
+        self.assertEqual((cache.summary()['sizeBytes'], cache.summary()['evictions']), (200, 2))
+        self.assertEqual(sorted(os.listdir(self.directory)), ['album3.png', 'album4.png'])
+
+        # (once migrated, the previous file is no longer counted)
+        cache.remove('album3.png')
+        cache.put('album3', b'label')
+        self.assertEqual(cache.summary()['sizeBytes'], 105)
+        self.assertNotIn('album3.png', os.listdir(self.directory))
+
+    def testSharedDirectory(self) -> None:
+        """Test that labels stored (or evicted) by another server worker are found (or missed)."""
+        other = LabelCache(self.directory, maxBytes=250)
+        other.put('a', b'label')
+        self.assertEqual(self.cache.get('a'), b'label')
+        self.assertEqual(self.cache.summary()['sizeBytes'], 5)
+
+        os.remove(os.path.join(self.directory, LabelCache.labelName(b'label')))
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.summary()['sizeBytes'], 0)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def testEncodeLabel(self) -> None:
+        """Test that labels are encoded in the cached (lossy, compact) format."""
+        image: np.ndarray = np.full((100, 100, 3), (200, 120, 40), dtype=np.uint8)
+        data = encodeLabel(image)
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(decoded.shape, image.shape)
+        self.assertLess(np.abs(decoded.astype(int) - image).max(), 8)
+        self.assertLess(len(data), len(cv2.imencode('.png', image)[1]))
+        self.assertEqual(LABEL_FORMAT, '.webp')
+
+
+if (__name__ == '__main__'):
+    unittest.main()
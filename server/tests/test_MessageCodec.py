@@ -0,0 +1,77 @@
+"""Test suite for the websocket message codecs."""
+import unittest
+from typing import Any, Dict
+
+from app.enums.StateKeys import Commands, StateKeys
+from app.modules.messageCodec import (
+    COMMAND_OFFSET,
+    OPCODES,
+    JSONCodec,
+    MessagePackCodec,
+    negotiateCodec,
+)
+from app.modules.messageSchema import PlayStateMessage, SettingsMessage
+
+
+class TestMessageCodec(unittest.TestCase):
+    """Test suite for the websocket message codecs."""
+
+    def testOpcodesDerivedFromEnums(self) -> None:
+        """Test that every state key and command has a unique small opcode."""
+        self.assertEqual(OPCODES[StateKeys.PLAY_STATE.value], 0)
+        self.assertEqual(OPCODES[Commands.PLAY_NEXT.value], COMMAND_OFFSET)
+        self.assertEqual(len(set(OPCODES.values())), len(StateKeys) + len(Commands))
+        self.assertTrue(all(opcode < 128 for opcode in OPCODES.values()))  # single-byte msgpack ints
+
+    def testMessagePackRoundTrip(self) -> None:
+        """Test that messages survive a MessagePack round trip, including extra fields."""
+        codec: MessagePackCodec = MessagePackCodec()
+        message: Dict[str, Any] = {'command': 'settings', 'value': {'volume': 40}, 'provider': 'Spotify'}
+        frame: bytes = codec.encode(message)
+        self.assertIsInstance(frame, bytes)
+        self.assertEqual(codec.decode(frame), message)
+
+    def testMessagePackUnknownCommand(self) -> None:
+        """Test that commands without an opcode are sent by name."""
+        codec: MessagePackCodec = MessagePackCodec()
+        message: Dict[str, Any] = {'command': 'unknownCommand', 'value': None}
+        self.assertEqual(codec.decode(codec.encode(message)), message)
+
+    def testMessagePackSmallerThanJSON(self) -> None:
+        """Test that binary frames are more compact than JSON ones."""
+        message: Dict[str, Any] = {'command': 'playState', 'value': True}
+        self.assertLess(len(MessagePackCodec().encode(message)), len(JSONCodec().encode(message)))
+
+    def testJSONRejectsNonObjects(self) -> None:
+        """Test that JSON frames must contain an object."""
+        with self.assertRaises(ValueError):
+            JSONCodec().decode('[1, 2]')
+
+    def testDecodeTypedMessages(self) -> None:
+        """Test that frames decode straight into typed messages, in either format."""
+        for codec in [JSONCodec(), MessagePackCodec()]:
+            message = codec.decodeMessage(codec.encode({'command': 'settings', 'value': {'volume': 40}}))
+            self.assertIsInstance(message, SettingsMessage)
+            self.assertEqual(message.value, {'volume': 40})
+
+            message = codec.decodeMessage(codec.encode({'command': 'playState', 'value': True}))
+            self.assertIsInstance(message, PlayStateMessage)
+
+            with self.assertRaises(ValueError):
+                codec.decodeMessage(codec.encode({'command': 'playState', 'value': 'yes please'}))
+            with self.assertRaises(ValueError):
+                codec.decodeMessage(codec.encode({'command': 'unknownCommand'}))
+
+    def testNegotiateCodec(self) -> None:
+        """Test that the first supported subprotocol is selected, defaulting to JSON."""
+        codec, subprotocol = negotiateCodec(['unsupported', 'vtt.msgpack', 'vtt.json'])
+        self.assertIsInstance(codec, MessagePackCodec)
+        self.assertEqual(subprotocol, 'vtt.msgpack')
+
+        codec, subprotocol = negotiateCodec([])
+        self.assertIsInstance(codec, JSONCodec)
+        self.assertIsNone(subprotocol)
+
+
+if (__name__ == '__main__'):
+    unittest.main()
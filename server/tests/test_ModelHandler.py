@@ -173,6 +173,33 @@ class TestModelHandler(unittest.TestCase):
         finally:
             os.remove(imagePath)
 
+    def testGetProviderID(self) -> None:
+        """Test that precomputed provider IDs are only used for unchanged manifest entries."""
+        self.handler.classes = {
+            "OKComputer_Radiohead_1997": {"name": "OK Computer", "artist": "Radiohead", "year": 1997},
+            "Changed_Artist_2000": {"name": "Changed", "artist": "Artist", "year": 2001},
+            "Unknown_Artist_2000": {"name": "Unknown", "artist": "Artist", "year": 2000},
+        }
+        self.handler.providerIDs = {"Spotify": {
+            "OKComputer_Radiohead_1997": {
+                "key": '{"artist":"Radiohead","name":"OK Computer","year":1997}', "medium": "album", "id": "album123",
+            },
+            "Changed_Artist_2000": {
+                "key": '{"artist":"Artist","name":"Changed","year":2000}', "medium": "album", "id": "album456",
+            },
+            "Unknown_Artist_2000": {
+                "key": '{"artist":"Artist","name":"Unknown","year":2000}', "medium": None, "id": None,
+            },
+        }}
+
+        self.assertEqual(
+            self.handler.getProviderID("Spotify", "OKComputer_Radiohead_1997"), {"medium": "album", "id": "album123"}
+        )
+        self.assertIsNone(self.handler.getProviderID("Spotify", "Changed_Artist_2000"))
+        self.assertIsNone(self.handler.getProviderID("Spotify", "Unknown_Artist_2000"))
+        self.assertIsNone(self.handler.getProviderID("Spotify", "Missing_Artist_2000"))
+        self.assertIsNone(self.handler.getProviderID("OtherProvider", "OKComputer_Radiohead_1997"))
+
 
 if (__name__ == '__main__'):
     unittest.main()
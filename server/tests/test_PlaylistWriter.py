@@ -0,0 +1,102 @@
+"""Test suite for the PlaylistWriter class."""
+import asyncio
+import unittest
+
+from app.APIs.MusicAPI.playlistWriter import PlaylistWriter
+
+
+class FakePlaylists:
+    """In-memory stand-in for the provider's playlists."""
+
+    def __init__(self) -> None:
+        """Initialise an empty playlist."""
+        self.tracks: list[str] = []
+        self.version = 0
+        self.versionRequests = 0
+        self.trackRequests = 0
+        self.addRequests: list[list[str]] = []
+        self.failAdds = False
+
+    async def getVersion(self, _playlistID: str) -> str:
+        """Return the playlist version."""
+        self.versionRequests += 1
+        return str(self.version)
+
+    async def getTracks(self, _playlistID: str) -> list[str]:
+        """Return the playlist contents."""
+        self.trackRequests += 1
+        return list(self.tracks)
+
+    async def addTracks(self, _playlistID: str, trackURIs: list[str]) -> str:
+        """Append tracks (slowly, so that other adds queue up behind)."""
+        await asyncio.sleep(0.01)
+        if (self.failAdds):
+            raise RuntimeError('Add failed.')
+        self.addRequests.append(trackURIs)
+        self.tracks.extend(trackURIs)
+        self.version += 1
+        return str(self.version)
+
+
+class TestPlaylistWriter(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the PlaylistWriter class."""
+
+    def setUp(self) -> None:
+        """Set up a writer for a fake playlist."""
+        self.playlists: FakePlaylists = FakePlaylists()
+        self.writer: PlaylistWriter = PlaylistWriter(
+            self.playlists.getVersion, self.playlists.getTracks, self.playlists.addTracks
+        )
+
+    async def testDeduplicates(self) -> None:
+        """Test that tracks already in the playlist are not added again."""
+        self.assertEqual(await self.writer.add('playlist', ['a', 'b']), 2)
+        self.assertEqual(await self.writer.add('playlist', ['a', 'b', 'c']), 1)
+        self.assertEqual(self.playlists.tracks, ['a', 'b', 'c'])
+        # (the snapshot is only fetched once, as the writer tracks the versions it creates)
+        self.assertEqual(self.playlists.trackRequests, 1)
+
+    async def testRefetchesModifiedPlaylist(self) -> None:
+        """Test that the snapshot is refetched when the playlist is modified elsewhere."""
+        await self.writer.add('playlist', ['a'])
+        self.playlists.tracks = []
+        self.playlists.version += 1
+
+        self.assertEqual(await self.writer.add('playlist', ['a']), 1)
+        self.assertEqual(self.playlists.trackRequests, 2)
+
+    async def testCoalesces(self) -> None:
+        """Test that adds made whilst a write is in flight are merged into a single write."""
+        first = asyncio.create_task(self.writer.add('playlist', ['a']))
+        await asyncio.sleep(0.005)  # (the first write is now in flight)
+        results = await asyncio.gather(
+            self.writer.add('playlist', ['b', 'c']),
+            self.writer.add('playlist', ['c', 'd']),
+            self.writer.add('playlist', ['a']),
+        )
+        self.assertEqual(await first, 1)
+        self.assertEqual(self.playlists.addRequests, [['a'], ['b', 'c', 'd']])
+        self.assertEqual(results, [2, 2, 0])
+        self.assertEqual(self.writer.summary()['duplicates'], 2)
+
+    async def testBatchSize(self) -> None:
+        """Test that large adds are split into requests of at most 100 tracks."""
+        await self.writer.add('playlist', [f'track{i}' for i in range(250)])
+        self.assertEqual([len(request) for request in self.playlists.addRequests], [100, 100, 50])
+
+    async def testFailure(self) -> None:
+        """Test that a failed write is reported to every waiting caller, and does not block later writes."""
+        self.playlists.failAdds = True
+        results = await asyncio.gather(
+            self.writer.add('playlist', ['a']),
+            self.writer.add('playlist', ['b']),
+            return_exceptions=True,
+        )
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+        self.playlists.failAdds = False
+        self.assertEqual(await self.writer.add('playlist', ['a', 'b']), 2)
+
+
+if (__name__ == '__main__'):
+    unittest.main()
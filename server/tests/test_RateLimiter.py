@@ -0,0 +1,81 @@
+"""Test suite for the RateLimiter and TokenBucket classes."""
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+from app.modules.rateLimiter import RateLimiter, TokenBucket
+from app.modules.sessionManager import SessionContext
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test suite for the TokenBucket class."""
+
+    @patch('app.modules.rateLimiter.time.monotonic')
+    def testBurstAndRefill(self, mockTime: Any) -> None:
+        """Test that a bucket allows a burst, then refills over time."""
+        mockTime.return_value = 0.0
+        bucket: TokenBucket = TokenBucket(capacity=2, rate=1)
+        self.assertTrue(bucket.tryConsume())
+        self.assertTrue(bucket.tryConsume())
+        self.assertFalse(bucket.tryConsume())
+        self.assertAlmostEqual(bucket.retryAfter(), 1.0)
+
+        mockTime.return_value = 1.0
+        self.assertTrue(bucket.tryConsume())
+        self.assertFalse(bucket.isFull())
+
+        mockTime.return_value = 10.0
+        self.assertTrue(bucket.isFull())
+        self.assertEqual(bucket.tokens, 2)  # capped at capacity
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test suite for the RateLimiter class."""
+
+    def setUp(self) -> None:
+        """Set up a rate limiter with small budgets."""
+        self.limiter: RateLimiter = RateLimiter(
+            hostBudgets={'playback': (5, 0)},
+            sideBudgets={'playback': (1, 0)},
+        )
+        self.host: SessionContext = SessionContext(sessionID='host', userID='user', isHost=True)
+        self.side: SessionContext = SessionContext(sessionID='side', userID='user', isHost=False)
+        self.otherSide: SessionContext = SessionContext(sessionID='other', userID='user', isHost=False)
+
+    def testSeparateBudgets(self) -> None:
+        """Test that host and side sessions have separate budgets, and each session its own bucket."""
+        self.assertIsNone(self.limiter.check(self.side, 'playAlbum'))
+        self.assertIsNotNone(self.limiter.check(self.side, 'playTrack'))  # same command class
+        self.assertIsNone(self.limiter.check(self.otherSide, 'playAlbum'))
+        for _ in range(5):
+            self.assertIsNone(self.limiter.check(self.host, 'playAlbum'))
+
+    def testUnlimitedCommands(self) -> None:
+        """Test that commands without a budget are not limited."""
+        for _ in range(100):
+            self.assertIsNone(self.limiter.check(self.side, 'playNext'))
+            self.assertIsNone(self.limiter.check(self.side, 'unknownCommand'))
+
+    def testThrottleCounters(self) -> None:
+        """Test that throttled messages are counted per command class."""
+        for _ in range(4):
+            self.limiter.check(self.side, 'playAlbum')
+        summary: dict[str, Any] = self.limiter.summary()
+        self.assertEqual(summary['throttled'], {'playback': 3})
+        self.assertEqual(summary['throttledTotal'], 3)
+
+    @patch('app.modules.rateLimiter.time.monotonic')
+    def testPrune(self, mockTime: Any) -> None:
+        """Test that only idle buckets are forgotten."""
+        mockTime.return_value = 0.0
+        limiter: RateLimiter = RateLimiter(sideBudgets={'playback': (1, 1)})
+        limiter.check(self.side, 'playAlbum')
+        limiter.prune()
+        self.assertIn('side', limiter.buckets)
+
+        mockTime.return_value = 5.0
+        limiter.prune()
+        self.assertEqual(limiter.buckets, {})
+
+if (__name__ == '__main__'):
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Test suite for the RefreshScheduler class."""
+import asyncio
+import time
+import unittest
+from typing import Awaitable, Callable
+
+from app.modules.refreshScheduler import RefreshScheduler
+
+
+class TestRefreshScheduler(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the RefreshScheduler class."""
+
+    async def asyncSetUp(self) -> None:
+        """Start a scheduler, recording each refresh."""
+        self.scheduler: RefreshScheduler = RefreshScheduler(retryDelay=0.01)
+        self.scheduler.start()
+        self.refreshes: list[str] = []
+
+    async def asyncTearDown(self) -> None:
+        """Stop the scheduler."""
+        await self.scheduler.stop()
+
+    def refresher(
+        self, key: str, interval: float | None = None, fail: bool = False
+    ) -> Callable[[], Awaitable[float | None]]:
+        """Return a refresh callback, which reschedules itself after the interval (if any)."""
+        async def refresh() -> float | None:
+            self.refreshes.append(key)
+            if (fail):
+                raise RuntimeError('Refresh failed.')
+            return time.time() + interval if interval is not None else None
+        return refresh
+
+    async def testOrder(self) -> None:
+        """Test that refreshes run in order of when they are due, with a single task for every key."""
+        now = time.time()
+        self.scheduler.schedule('late', now + 0.04, self.refresher('late'))
+        self.scheduler.schedule('early', now + 0.02, self.refresher('early'))
+        self.scheduler.schedule('overdue', now - 10, self.refresher('overdue'))
+
+        await asyncio.sleep(0.08)
+        self.assertEqual(self.refreshes, ['overdue', 'early', 'late'])
+        self.assertEqual(self.scheduler.summary()['scheduled'], 0)
+
+    async def testReschedule(self) -> None:
+        """Test that each refresh is rescheduled for when it is next due."""
+        self.scheduler.schedule('key', time.time(), self.refresher('key', interval=0.02))
+        await asyncio.sleep(0.07)
+        self.assertGreaterEqual(len(self.refreshes), 3)
+        self.assertEqual(self.scheduler.summary()['scheduled'], 1)
+
+    async def testCancel(self) -> None:
+        """Test that cancelled refreshes do not run."""
+        self.scheduler.schedule('key', time.time() + 0.02, self.refresher('key'))
+        self.scheduler.cancel('key')
+        await asyncio.sleep(0.04)
+        self.assertEqual(self.refreshes, [])
+
+    async def testRetry(self) -> None:
+        """Test that failed refreshes are retried, rather than abandoned."""
+        self.scheduler.schedule('key', time.time(), self.refresher('key', fail=True))
+        await asyncio.sleep(0.05)
+        self.assertGreaterEqual(len(self.refreshes), 2)
+        self.assertEqual(self.scheduler.summary()['scheduled'], 1)
+
+    async def testRefreshNow(self) -> None:
+        """Test that concurrent on-demand refreshes of a key share a single refresh."""
+        self.scheduler.schedule('key', time.time() + 3600, self.refresher('key', interval=3600))
+
+        results = await asyncio.gather(*(self.scheduler.refreshNow('key') for _ in range(5)))
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(self.refreshes, ['key'])
+        self.assertFalse(await self.scheduler.refreshNow('unknown'))
+
+    async def testManyKeys(self) -> None:
+        """Test that a single scheduler serves thousands of keys."""
+        now = time.time()
+        for i in range(1000):
+            self.scheduler.schedule(i, now + (i % 50) / 1000, self.refresher('key'))
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(self.refreshes), 1000)
+
+
+if (__name__ == '__main__'):
+    unittest.main()
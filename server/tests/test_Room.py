@@ -0,0 +1,75 @@
+"""Test suite for the Room class."""
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.enums.StateKeys import StateKeys
+from app.modules.room import Room
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.StateBus.scopedStateBus import ScopedStateBus
+
+
+def createMusicAPI(*_args: object) -> MagicMock:
+    """Create a fake music API."""
+    musicAPI: MagicMock = MagicMock()
+    musicAPI.getProviderName.return_value = 'test'
+    return musicAPI
+
+
+class TestRoom(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the Room class."""
+
+    def setUp(self) -> None:
+        """Set up two rooms, sharing a state bus."""
+        self.stateBus: LocalStateBus = LocalStateBus()
+        self.handleCommand: AsyncMock = AsyncMock()
+        self.kitchen: Room = Room('kitchen', self.stateBus, self.handleCommand, createMusicAPI)
+        self.lounge: Room = Room('lounge', self.stateBus, self.handleCommand, createMusicAPI)
+
+    async def testStateIsolated(self) -> None:
+        """Test that state changes are only broadcast within their own room."""
+        self.kitchen.websocketHandler.fanOut = AsyncMock()
+        self.lounge.websocketHandler.fanOut = AsyncMock()
+
+        await self.kitchen.stateManager.updateState(StateKeys.PLAY_STATE, True)
+        self.assertTrue(self.kitchen.stateManager.getState()['playState'])
+        self.assertFalse(self.lounge.stateManager.getState()['playState'])
+        self.kitchen.websocketHandler.fanOut.assert_awaited_once()
+        self.lounge.websocketHandler.fanOut.assert_not_awaited()
+
+    def testSnapshotsBound(self) -> None:
+        """Test that the websocket handler and event stream serve the snapshot of their own room's state."""
+        self.assertEqual(self.kitchen.websocketHandler.getSnapshot, self.kitchen.stateManager.getSnapshot)
+        self.assertEqual(self.kitchen.eventStream.getSnapshot, self.kitchen.stateManager.getSnapshot)
+        self.assertIs(self.kitchen.websocketHandler.eventStream, self.kitchen.eventStream)
+
+    async def testSessionsIsolated(self) -> None:
+        """Test that sessions, and the host, belong to a single room."""
+        self.kitchen.sessionManager.createSession('hostSession', True)
+        self.kitchen.sessionManager.updateSession('hostSession', {'userID': 'user123'})
+        self.kitchen.sessionManager.setHostPlaylistID('playlist123')
+
+        context = self.kitchen.sessionManager.getSessionContext('hostSession')
+        self.assertIsNotNone(context)
+        self.assertEqual(context.roomID, 'kitchen')
+        self.assertIsNone(self.lounge.sessionManager.getSessionContext('hostSession'))
+        self.assertIsNone(self.lounge.sessionManager.getHostUserID())
+        self.assertIsNone(self.lounge.sessionManager.getHostPlaylistID())
+
+    async def testLocksIndependent(self) -> None:
+        """Test that a busy room does not block the others."""
+        async with self.kitchen.lock:
+            self.assertFalse(self.lounge.lock.locked())
+            await self.lounge.stateManager.updateState(StateKeys.PLAY_STATE, True)
+
+    def testScopedStateBus(self) -> None:
+        """Test that scoped views of a bus cannot see each other's values."""
+        kitchen: ScopedStateBus = ScopedStateBus(self.stateBus, 'kitchen')
+        lounge: ScopedStateBus = ScopedStateBus(self.stateBus, 'lounge')
+        kitchen.set('host', 'userID', 'user123')
+        self.assertEqual(kitchen.get('host', 'userID'), 'user123')
+        self.assertIsNone(lounge.get('host', 'userID'))
+        self.assertEqual(lounge.items('host'), {})
+
+
+if (__name__ == '__main__'):
+    unittest.main()
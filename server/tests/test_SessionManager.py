@@ -1,6 +1,7 @@
 """Test suite for the SessionManager class."""
 import unittest
-from typing import Dict, Union
+from typing import Dict, List, Union
+from unittest.mock import patch
 
 from fastapi import HTTPException
 from app.modules.sessionManager import SessionManager 
@@ -28,6 +29,14 @@ class TestSessionManager(unittest.TestCase):
         session: Dict[str, Union[str, bool]] = self.manager.getSession(sessionID)
         self.assertEqual(session, {})
 
+    def testDeleteListeners(self) -> None:
+        """Test that deleteSession notifies each listener of the deleted session."""
+        deleted: List[str] = []
+        self.manager.addDeleteListener(deleted.append)
+        self.manager.createSession("session2", False)
+        self.manager.deleteSession("session2")
+        self.assertEqual(deleted, ["session2"])
+
     def testUpdateSessionAndHostUserID(self) -> None:
         """Test that updateSession updates values and sets hostUserID if session is host."""
         sessionID: str = "session3"
@@ -68,6 +77,81 @@ class TestSessionManager(unittest.TestCase):
         hostToken: Union[str, None] = self.manager.getHostToken()
         self.assertEqual(hostToken, "hostTokenValue")
 
+    def testGetHostTokenIndexed(self) -> None:
+        """Test that the host is found via the host index, and removed from it with its session."""
+        self.manager.createSession("hostSession", True)
+        self.manager.updateSession("hostSession", {"accessToken": "hostTokenValue"})
+        self.assertEqual(self.manager.getHostSessionIDs(), ["hostSession"])
+
+        self.manager.deleteSession("hostSession")
+        self.assertEqual(self.manager.getHostSessionIDs(), [])
+        self.assertIsNone(self.manager.getHostToken())
+
+    @patch("app.modules.sessionManager.time.time")
+    def testIdleExpiry(self, mockTime) -> None:
+        """Test that sessions expire after a period of inactivity, unless touched."""
+        mockTime.return_value = 0
+        manager: SessionManager = SessionManager(idleTTL=100, absoluteTTL=1000)
+        manager.createSession("idle", False)
+        manager.createSession("active", False)
+
+        mockTime.return_value = 90
+        manager.touchSession("active")
+        mockTime.return_value = 150
+        self.assertEqual(manager.getSession("idle"), {})
+        self.assertTrue(manager.getSession("active"))
+        self.assertEqual(manager.evicted["idle"], 1)
+
+    @patch("app.modules.sessionManager.time.time")
+    def testAbsoluteExpiry(self, mockTime) -> None:
+        """Test that sessions expire after a fixed lifetime, however active."""
+        mockTime.return_value = 0
+        manager: SessionManager = SessionManager(idleTTL=100, absoluteTTL=250)
+        manager.createSession("session", False)
+        for now in [80, 160, 240]:
+            mockTime.return_value = now
+            manager.touchSession("session")
+        mockTime.return_value = 260
+        self.assertIsNone(manager.getSessionContext("session"))
+        self.assertEqual(manager.evicted["absolute"], 1)
+
+    @patch("app.modules.sessionManager.time.time")
+    def testSweepOnCreate(self, mockTime) -> None:
+        """Test that expired sessions are swept as new sessions are created."""
+        mockTime.return_value = 0
+        manager: SessionManager = SessionManager(idleTTL=100)
+        for i in range(5):
+            manager.createSession(f"old{i}", False)
+        mockTime.return_value = 500
+        manager.createSession("new", False)
+        self.assertEqual(list(manager.sessions.keys()), ["new"])
+        self.assertEqual(manager.evicted["idle"], 5)
+
+    @patch("app.modules.sessionManager.time.time")
+    def testCapacityEvictsLeastRecent(self, mockTime) -> None:
+        """Test that beyond the cap, the least recently active session is evicted."""
+        mockTime.return_value = 0
+        manager: SessionManager = SessionManager(maxSessions=3)
+        for (now, sessionID) in enumerate(["a", "b", "c"]):
+            mockTime.return_value = now
+            manager.createSession(sessionID, False)
+        mockTime.return_value = 100
+        manager.touchSession("a")
+        manager.createSession("d", False)
+        self.assertEqual(sorted(manager.sessions.keys()), ["a", "c", "d"])
+        self.assertEqual(manager.evicted["capacity"], 1)
+
+    def testGetSessionContext(self) -> None:
+        """Test that a session resolves into a context, once per connection."""
+        self.manager.createSession("hostSession", True)
+        self.manager.updateSession("hostSession", {"userID": "user123"})
+        context = self.manager.getSessionContext("hostSession")
+        self.assertIsNotNone(context)
+        self.assertEqual(context.sessionID, "hostSession")
+        self.assertEqual(context.userID, "user123")
+        self.assertTrue(context.isHost)
+        self.assertIsNone(self.manager.getSessionContext("nonexistent"))
+
     def testGetTokenSuccess(self) -> None:
         """Test that getToken returns the correct access token when it exists."""
         sessionID: str = "session5"
@@ -2,13 +2,17 @@
 import os
 import unittest
 from urllib.parse import urlparse, parse_qs
-from typing import Any, Dict
+from typing import Any, Dict, List
 
+import httpx
 from fastapi import HTTPException
 from fastapi.responses import RedirectResponse
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from app.modules.sessionManager import SessionManager
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.ttlCache import TTLCache
+from app.APIs.httpClient import HTTPClient
 from app.APIs.MusicAPI.SpotifyAPI import SpotifyAPI
 
 
@@ -24,6 +28,7 @@ class TestSpotifyAPI(unittest.IsolatedAsyncioTestCase):
         # Create a fake session manager.
         self.sessionManager: MagicMock = MagicMock(spec=SessionManager)
         self.sessionManager.sessions = {}
+        self.sessionManager.roomID = 'default'
         self.sessionManager.getSession.return_value = None
         self.sessionManager.getToken.return_value = 'hostToken'
         self.sessionManager.getHostToken.return_value = 'hostToken'
@@ -32,16 +37,46 @@ class TestSpotifyAPI(unittest.IsolatedAsyncioTestCase):
         self.sendToClient: AsyncMock = AsyncMock()
         self.clearCache: MagicMock = MagicMock()
 
+        # Stub Spotify server: responds with the queued responses, recording each request.
+        self.responses: List[httpx.Response] = []
+        self.requests: List[httpx.Request] = []
+
+        def handle(request: httpx.Request) -> httpx.Response:
+            self.requests.append(request)
+            if (request.headers.get('Authorization') in self.rejectedTokens):
+                return httpx.Response(401)
+            if (self.searchResults is not None):
+                return self.search(request)
+            return self.responses.pop(0)
+
+        # Stub Spotify search: (query, type) -> item ID
+        self.searchResults: Dict[tuple[str, str], str] | None = None
+        # Stub Spotify auth: tokens which are rejected (401)
+        self.rejectedTokens: set[str] = set()
+
+        self.httpClient: HTTPClient = HTTPClient(transport=httpx.MockTransport(handle))
+
         # Create the SpotifyAPI instance.
         self.spotifyAPI: SpotifyAPI = SpotifyAPI(
             self.sessionManager,
             hostName='localhost',
             sendToClient=self.sendToClient,
-            clearCache=self.clearCache
+            clearCache=self.clearCache,
+            httpClient=self.httpClient,
         )
         # Override REDIRECT_URI for testing purposes.
         self.spotifyAPI.REDIRECT_URI = 'http://localhost/callback'
 
+    async def asyncTearDown(self) -> None:
+        """Close the HTTP client."""
+        await self.httpClient.close()
+
+    def search(self, request: httpx.Request) -> httpx.Response:
+        """Respond to a search request, from the stub search results."""
+        medium: str = request.url.params['type']
+        itemID = (self.searchResults or {}).get((request.url.params['q'], medium))
+        return httpx.Response(200, json={f'{medium}s': {'items': [{'id': itemID}] if itemID else []}})
+
     @patch('app.APIs.MusicAPI.SpotifyAPI.generateRandomString', return_value='fixedSession')
     async def testLogin(self, _mockGenStr: Any) -> None:
         """Test login creates a session and returns a proper redirect."""
@@ -70,25 +105,21 @@ class TestSpotifyAPI(unittest.IsolatedAsyncioTestCase):
             await self.spotifyAPI.callback(FakeRequest(), 'fixedSession')
         self.assertEqual(context.exception.status_code, 400)
 
-    @patch('app.APIs.MusicAPI.SpotifyAPI.requests.post')
-    async def testCallbackSuccess(self, mockPost: Any) -> None:
+    async def testCallbackSuccess(self) -> None:
         """Test callback processes a valid Spotify token response."""
         class FakeRequest:
             """Fake request class for testing."""
             query_params: Dict[str, str] = {'code': 'authCode'}
 
-        fakeResponse: MagicMock = MagicMock()
-        fakeResponse.json.return_value = {
+        self.responses.append(httpx.Response(200, json={
             'access_token': 'newAccessToken',
             'refresh_token': 'newRefreshToken',
             'expires_in': 3600
-        }
-        fakeResponse.raise_for_status.return_value = None
-        mockPost.return_value = fakeResponse
+        }))
 
         self.sessionManager.getSession.return_value = {'isHost': True}
-        self.spotifyAPI.getUserID = MagicMock(return_value='testUser')
-        self.spotifyAPI.setupPlaylist = MagicMock()
+        self.spotifyAPI.getUserID = AsyncMock(return_value='testUser')
+        self.spotifyAPI.setupPlaylist = AsyncMock()
 
         response: RedirectResponse = await self.spotifyAPI.callback(FakeRequest(), 'fixedSession')
         # self.sessionManager.updateSession.assert_called_with('fixedSession', {
@@ -99,43 +130,211 @@ class TestSpotifyAPI(unittest.IsolatedAsyncioTestCase):
             'userID': 'testUser',
         })
         self.sendToClient.assert_awaited_with({'command': 'REFRESH_HOST'})
-        self.spotifyAPI.setupPlaylist.assert_called_with('fixedSession', 'Virtual Turntable')
+        self.spotifyAPI.setupPlaylist.assert_awaited_with('fixedSession', 'Virtual Turntable')
         self.assertIsInstance(response, RedirectResponse)
+        self.assertEqual(self.requests[0].url, 'https://accounts.spotify.com/api/token')
+        self.assertIn(b'code=authCode', self.requests[0].content)
         self.assertIn('sessionID', response.headers.get('set-cookie', ''))
 
-    @patch('app.APIs.MusicAPI.SpotifyAPI.requests.get')
-    def testSearchForAlbum(self, mockGet: Any) -> None:
+    @patch('app.APIs.MusicAPI.SpotifyAPI.time.time', return_value=1000)
+    async def testResumeSessions(self, _mockTime: Any) -> None:
+        """Test that token refreshes are rescheduled for restored sessions."""
+        self.sessionManager.sessions = {
+            'hostSession': {'isHost': True, 'refresh_token': 'refresh', 'expiresAt': 1600},
+            'overdueSession': {'isHost': False, 'refresh_token': 'refresh', 'expiresAt': 0},
+            'pendingSession': {'isHost': False},
+        }
+        self.sessionManager.getSession.side_effect = lambda sessionID: self.sessionManager.sessions[sessionID]
+
+        self.spotifyAPI.resumeSessions()
+        self.assertEqual(self.spotifyAPI.tokenScheduler.entries.keys(), {
+            ('default', 'hostSession'), ('default', 'overdueSession'),
+        })
+        self.assertEqual(self.spotifyAPI.tokenScheduler.entries[('default', 'hostSession')][0], 1540)
+
+    async def testRefreshToken(self) -> None:
+        """Test refreshToken stores the new token, and returns when it is next due."""
+        self.sessionManager.getSession.return_value = {'isHost': True, 'refresh_token': 'refresh'}
+        self.responses.append(httpx.Response(200, json={'access_token': 'newAccessToken', 'expires_in': 3600}))
+
+        with patch('app.APIs.MusicAPI.SpotifyAPI.time.time', return_value=1000):
+            self.assertEqual(await self.spotifyAPI.refreshToken('hostSession'), 4540)
+        self.sessionManager.updateSession.assert_called_with('hostSession', {
+            'accessToken': 'newAccessToken',
+            'refresh_token': 'refresh',
+            'expiresAt': 4600,
+        })
+        self.sendToClient.assert_awaited_with({'command': 'TOKEN'})
+
+    async def testRefreshTokenRevoked(self) -> None:
+        """Test refreshToken stops refreshing once the refresh token is rejected, or the session has ended."""
+        self.sessionManager.getSession.return_value = {'isHost': True, 'refresh_token': 'refresh'}
+        self.responses.append(httpx.Response(400, json={'error': 'invalid_grant'}))
+        self.assertIsNone(await self.spotifyAPI.refreshToken('hostSession'))
+
+        self.sessionManager.getSession.return_value = {}
+        self.assertIsNone(await self.spotifyAPI.refreshToken('hostSession'))
+        self.assertEqual(len(self.requests), 1)
+
+    async def testRefreshOnUnauthorised(self) -> None:
+        """Test that a rejected token is refreshed (once, however many requests are rejected), and retried."""
+        self.sessionManager.getHostSessionID.return_value = 'hostSession'
+        self.spotifyAPI.scheduleRefresh('hostSession', 1e12)
+
+        async def refreshToken(_sessionID: str) -> float:
+            self.sessionManager.getHostToken.return_value = 'newHostToken'
+            return 1e12
+        self.spotifyAPI.refreshToken = AsyncMock(side_effect=refreshToken)  # type: ignore[method-assign]
+        self.rejectedTokens = {'Bearer hostToken'}
+        self.searchResults = {('Test Album', 'album'): 'album123'}
+
+        result = await self.spotifyAPI.searchForAlbum({'name': 'Test Album', 'artist': 'Test Artist', 'year': '2021'})
+        self.assertEqual(result, {'medium': 'album', 'id': 'album123'})
+        self.spotifyAPI.refreshToken.assert_awaited_once_with('hostSession')
+        self.assertEqual(self.spotifyAPI.tokenScheduler.summary()['onDemand'], 2)  # (the first, rejected, query)
+
+    def testDeleteSessionCancelsRefresh(self) -> None:
+        """Test that deleting a session stops its token being refreshed."""
+        (listener,) = self.sessionManager.addDeleteListener.call_args.args
+        self.spotifyAPI.scheduleRefresh('hostSession', 1e12)
+
+        listener('hostSession')
+        self.assertEqual(self.spotifyAPI.tokenScheduler.entries, {})
+
+    async def testSearchForAlbum(self) -> None:
         """Test searchForAlbum returns the expected album ID."""
-        fakeJson: Dict[str, Any] = {'albums': {'items': [{'id': 'album123'}]}}
-        fakeResponse: MagicMock = MagicMock()
-        fakeResponse.json.return_value = fakeJson
-        fakeResponse.raise_for_status.return_value = None
-        mockGet.return_value = fakeResponse
+        self.searchResults = {('Test Album artist:Test Artist year:2021', 'album'): 'album123'}
 
         albumInfo: Dict[str, str] = {'name': 'Test Album', 'artist': 'Test Artist', 'year': '2021'}
-        albumId: str = self.spotifyAPI.searchForAlbum(albumInfo)['id']
+        albumId: str = (await self.spotifyAPI.searchForAlbum(albumInfo))['id']
         self.assertEqual(albumId, 'album123')
+        self.assertEqual(self.requests[0].headers['Authorization'], 'Bearer hostToken')
+
+    async def testSearchForAlbumPriority(self) -> None:
+        """Test searchForAlbum prefers the most specific match, only broadening the query after a miss."""
+        self.searchResults = {
+            ('Test Album', 'album'): 'broadAlbum',
+            ('Test Album artist:Test Artist', 'track'): 'track123',
+        }
+
+        albumInfo: Dict[str, str] = {'name': 'Test Album', 'artist': 'Test Artist', 'year': '2021'}
+        self.assertEqual(await self.spotifyAPI.searchForAlbum(albumInfo), {'medium': 'track', 'id': 'track123'})
+        self.assertEqual(len(self.requests), 4)  # (the broadest query is never sent)
+        self.assertIsNone(await self.spotifyAPI.searchForAlbum({'name': 'Unknown', 'artist': 'None', 'year': '0'}))
+        self.assertEqual(len(self.requests), 10)
+
+    def failSearches(self, *failed: tuple[str, str]) -> None:
+        """Make the stub search fail (503) for the given (query suffix, type) pairs."""
+        search = self.search
+
+        def failingSearch(request: httpx.Request) -> httpx.Response:
+            for (suffix, medium) in failed:
+                if (request.url.params['q'].endswith(suffix) and request.url.params['type'] == medium):
+                    return httpx.Response(503)
+            return search(request)
+        self.search = failingSearch  # type: ignore[method-assign]
+
+    async def testSearchForAlbumFailedAlbumSearch(self) -> None:
+        """Test that a track found whilst the album search failed is returned, but not cached (nor broadened)."""
+        self.spotifyAPI.albumCache = TTLCache(LocalStateBus(), 'albumIDs', ttl=60)
+        self.searchResults = {
+            ('Test Album artist:Test Artist year:2021', 'track'): 'track123',
+            ('Test Album artist:Test Artist', 'album'): 'album123',
+        }
+        self.failSearches(('year:2021', 'album'))
+
+        albumInfo: Dict[str, str] = {'name': 'Test Album', 'artist': 'Test Artist', 'year': '2021'}
+        self.assertEqual(await self.spotifyAPI.searchForAlbum(albumInfo), {'medium': 'track', 'id': 'track123'})
+        self.assertEqual(
+            {request.url.params['q'] for request in self.requests}, {'Test Album artist:Test Artist year:2021'}
+        )
+        self.assertEqual(self.spotifyAPI.albumCache.stateBus.items('albumIDs'), {})
+
+        # (strictly, e.g. when resolving the manifest, the failed search is raised instead)
+        with self.assertRaises(httpx.HTTPStatusError):
+            await self.spotifyAPI.searchForAlbum(albumInfo, strict=True)
+
+    async def testSearchForAlbumFailedSearchesMissed(self) -> None:
+        """Test that a failed search is raised, rather than reported as not found, if the other searches miss."""
+        self.spotifyAPI.albumCache = TTLCache(LocalStateBus(), 'albumIDs', ttl=60)
+        self.searchResults = {('Test Album', 'album'): 'broadAlbum'}
+        self.failSearches(('artist:Test Artist', 'track'))
+
+        albumInfo: Dict[str, str] = {'name': 'Test Album', 'artist': 'Test Artist', 'year': '2021'}
+        with self.assertRaises(httpx.HTTPStatusError):
+            await self.spotifyAPI.searchForAlbum(albumInfo)
+        # (the broadest query, which would match, is not sent)
+        self.assertNotIn('Test Album', {request.url.params['q'] for request in self.requests})
+        self.assertEqual(self.spotifyAPI.albumCache.stateBus.items('albumIDs'), {})
+
+        self.search = lambda _request: httpx.Response(503)  # type: ignore[method-assign]
+        with self.assertRaises(httpx.HTTPStatusError):
+            await self.spotifyAPI.searchForAlbum(albumInfo)
+
+    async def testSearchForAlbumCached(self) -> None:
+        """Test that a resolved album is cached, so repeat scans make no search requests."""
+        self.spotifyAPI.albumCache = TTLCache(LocalStateBus(), 'albumIDs', ttl=60)
+        self.searchResults = {('Test Album artist:Test Artist year:2021', 'album'): 'album123'}
+
+        albumInfo: Dict[str, str] = {'name': 'Test Album', 'artist': 'Test Artist', 'year': '2021'}
+        first = await self.spotifyAPI.searchForAlbum(albumInfo)
+        requestCount: int = len(self.requests)
+        second = await self.spotifyAPI.searchForAlbum(dict(reversed(albumInfo.items())))
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.requests), requestCount)
+        self.assertEqual(self.spotifyAPI.albumCache.summary()['hits'], 1)
+
+    async def testGetPlaylistByNamePaginated(self) -> None:
+        """Test getPlaylistByName follows pagination, reusing the pooled client."""
+        self.responses.extend([
+            httpx.Response(200, json={
+                'items': [{'id': 'other', 'name': 'Other'}],
+                'next': 'https://api.spotify.com/v1/me/playlists?offset=1',
+            }),
+            httpx.Response(200, json={'items': [{'id': 'playlist123', 'name': 'Virtual Turntable'}], 'next': None}),
+        ])
+
+        self.assertEqual(await self.spotifyAPI.getPlaylistByName('hostSession', 'virtual turntable'), 'playlist123')
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.httpClient.summary()['hosts']['api.spotify.com']['requests'], 2)
+
+    async def testAddToPlaylist(self) -> None:
+        """Test addToPlaylist fetches every page of the album, and only posts tracks not already in the playlist."""
+        self.responses.extend([
+            httpx.Response(200, json={
+                'items': [{'uri': 'spotify:track:1'}],
+                'next': 'https://api.spotify.com/v1/albums/album123/tracks?offset=1&limit=50',
+            }),
+            httpx.Response(200, json={'items': [{'uri': 'spotify:track:2'}], 'next': None}),
+            httpx.Response(200, json={'snapshot_id': 'v1'}),
+            httpx.Response(200, json={'items': [{'track': {'uri': 'spotify:track:1'}}], 'next': None}),
+            httpx.Response(201, json={'snapshot_id': 'v2'}),
+            # (second add: the album tracks and playlist contents are cached)
+            httpx.Response(200, json={'snapshot_id': 'v2'}),
+        ])
+
+        await self.spotifyAPI.addToPlaylist('album123', 'playlist123')
+        self.assertEqual(self.requests[4].method, 'POST')
+        self.assertEqual(self.requests[4].read(), b'{"uris":["spotify:track:2"]}')
+
+        await self.spotifyAPI.addToPlaylist('album123', 'playlist123')
+        self.assertEqual(len(self.requests), 6)
+        self.assertEqual(self.spotifyAPI.summary()['playlistWriter']['duplicates'], 3)
 
-    @patch('app.APIs.MusicAPI.SpotifyAPI.requests.put')
-    def testPlayPlaylistSuccess(self, mockPut: Any) -> None:
+    async def testPlayPlaylistSuccess(self) -> None:
         """Test playPlaylist succeeds when Spotify returns 204."""
-        fakeResponse: MagicMock = MagicMock()
-        fakeResponse.status_code = 204
-        mockPut.return_value = fakeResponse
+        self.responses.append(httpx.Response(204))
 
-        self.spotifyAPI.playPlaylist('playlist123')
-        mockPut.assert_called_once()
+        await self.spotifyAPI.playPlaylist('playlist123')
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.requests[0].method, 'PUT')
 
-    @patch('app.APIs.MusicAPI.SpotifyAPI.requests.put')
-    def testPlayPlaylistFailure(self, mockPut: Any) -> None:
+    async def testPlayPlaylistFailure(self) -> None:
         """Test playPlaylist raises HTTPException when Spotify returns an error."""
-        fakeResponse: MagicMock = MagicMock()
-        fakeResponse.status_code = 400
-        fakeResponse.json.return_value = {'error': 'Bad Request'}
-        mockPut.return_value = fakeResponse
+        self.responses.append(httpx.Response(400, json={'error': 'Bad Request'}))
 
         with self.assertRaises(HTTPException) as context:
-            self.spotifyAPI.playPlaylist('playlist123')
+            await self.spotifyAPI.playPlaylist('playlist123')
         self.assertEqual(context.exception.status_code, 400)
 
 
@@ -0,0 +1,212 @@
+"""Test suite for the state bus backends."""
+import os
+import sqlite3
+import tempfile
+import unittest
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.enums.StateKeys import StateKeys
+from app.modules.sessionManager import SessionManager
+from app.modules.stateManager import StateManager
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.StateBus.persistentStateBus import PersistentStateBus
+from app.modules.StateBus.sqliteStateBus import SQLiteStateBus
+from app.modules.websocketHandler import WebsocketHandler
+
+
+class TestLocalStateBus(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the LocalStateBus class."""
+
+    async def testStore(self) -> None:
+        """Test storing, listing and deleting values."""
+        bus: LocalStateBus = LocalStateBus()
+        bus.set('sessions', 'a', {'isHost': True})
+        self.assertEqual(bus.get('sessions', 'a'), {'isHost': True})
+        self.assertIsNone(bus.get('sessions', 'b'))
+        self.assertEqual(bus.items('sessions'), {'a': {'isHost': True}})
+
+        bus.delete('sessions', 'a')
+        self.assertEqual(bus.items('sessions'), {})
+        self.assertTrue(bus.claim('hardware'))
+
+
+class TestPersistentStateBus(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the PersistentStateBus class."""
+
+    def setUp(self) -> None:
+        """Open a bus on an empty database."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path: str = os.path.join(self.directory.name, 'state.sqlite3')
+        self.bus: PersistentStateBus = PersistentStateBus(self.path, flushInterval=60)
+
+    async def asyncTearDown(self) -> None:
+        """Close the bus."""
+        await self.bus.stop()
+        self.directory.cleanup()
+
+    async def testWriteBehind(self) -> None:
+        """Test that changes are served from memory, and written in a single batch."""
+        for volume in range(10):
+            self.bus.set('state', 'settings', {'volume': volume})
+        self.bus.set('sessions', 'a', {'isHost': True})
+        self.bus.set('sessions', 'b', {'isHost': False})
+        self.bus.delete('sessions', 'b')
+        self.assertEqual(self.bus.get('state', 'settings'), {'volume': 9})
+        self.assertEqual(self.bus.summary()['pending'], 3)
+        self.assertEqual(self.bus.summary()['flushes'], 0)
+
+        await self.bus.flush()
+        self.assertEqual(self.bus.summary()['flushes'], 1)
+        self.assertEqual(self.bus.summary()['written'], 3)
+        self.assertEqual(self.bus.summary()['pending'], 0)
+
+    async def testFailedFlushRetried(self) -> None:
+        """Test that a failed write is retried, without overwriting newer changes, and unencodable values skipped."""
+        self.bus.set('state', 'settings', {'volume': 10})
+        self.bus.set('state', 'playState', True)
+        with patch.object(self.bus, 'write', side_effect=sqlite3.OperationalError('disk I/O error')):
+            await self.bus.flush()
+        self.assertEqual(self.bus.summary()['pending'], 2)
+        self.bus.set('state', 'settings', {'volume': 20})
+        self.bus.set('state', 'invalid', object())
+
+        await self.bus.flush()
+        self.assertEqual(self.bus.summary()['pending'], 0)
+        self.assertEqual(self.bus.summary()['failures'], 2)
+        await self.bus.stop()
+        self.bus = PersistentStateBus(self.path, flushInterval=60)
+        self.assertEqual(self.bus.items('state'), {'settings': {'volume': 20}, 'playState': True})
+
+    async def testWarmRestart(self) -> None:
+        """Test that sessions and state are restored after a restart."""
+        sessionManager: SessionManager = SessionManager(self.bus)
+        sessionManager.createSession('hostSession', True)
+        sessionManager.updateSession('hostSession', {'userID': 'user123', 'accessToken': 'hostToken'})
+        sessionManager.setHostPlaylistID('playlist123')
+        stateManager: StateManager = StateManager(MagicMock(broadcast=AsyncMock()), None, 'test', self.bus)
+        await stateManager.updateState(StateKeys.SETTINGS, {'volume': 55})
+        await self.bus.stop()
+
+        # restart
+        self.bus = PersistentStateBus(self.path, flushInterval=60)
+        sessionManager = SessionManager(self.bus)
+        self.assertEqual(sessionManager.getHostToken(), 'hostToken')
+        self.assertEqual(sessionManager.getHostUserID(), 'user123')
+        self.assertEqual(sessionManager.getHostPlaylistID(), 'playlist123')
+        stateManager = StateManager(MagicMock(), None, 'test', self.bus)
+        self.assertEqual(stateManager.getState()['settings'], {'volume': 55})
+
+
+class TestSQLiteStateBus(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the SQLiteStateBus class, with two buses standing in for two server workers."""
+
+    def setUp(self) -> None:
+        """Open two buses on the same database."""
+        self.directory = tempfile.TemporaryDirectory()
+        path: str = os.path.join(self.directory.name, 'stateBus.sqlite3')
+        self.busA: SQLiteStateBus = SQLiteStateBus(path)
+        self.busB: SQLiteStateBus = SQLiteStateBus(path)
+
+    async def asyncTearDown(self) -> None:
+        """Close the buses."""
+        await self.busA.stop()
+        await self.busB.stop()
+        self.directory.cleanup()
+
+    async def testStoreShared(self) -> None:
+        """Test that values stored by one worker are visible to the others."""
+        self.busA.set('state', 'settings', {'volume': 55})
+        await self.busA.flush()
+        self.assertEqual(self.busB.get('state', 'settings'), {'volume': 55})
+        self.busB.delete('state', 'settings')
+        await self.busB.flush()
+        self.assertEqual(self.busA.items('state'), {})
+
+    async def testWritesQueued(self) -> None:
+        """Test that writes are committed off the event loop, and read back whilst queued (or retried)."""
+        self.busA.set('state', 'settings', {'volume': 55})
+        self.busA.set('state', 'volume', 10)
+        self.busA.delete('state', 'volume')
+        self.assertEqual(self.busA.get('state', 'settings'), {'volume': 55})
+        self.assertEqual(self.busA.items('state'), {'settings': {'volume': 55}})
+        self.assertIsNone(self.busB.get('state', 'settings'))
+
+        # (a failed batch, e.g. whilst another worker holds the lock, is retried without losing newer values)
+        with patch.object(self.busA, 'commit', side_effect=sqlite3.OperationalError('database is locked')):
+            await self.busA.flush()
+        self.busA.set('state', 'settings', {'volume': 60})
+        await self.busA.flush()
+        self.assertEqual(self.busA.summary()['queuedWrites'], 0)
+        self.assertEqual(self.busA.pending, {})
+        self.assertEqual(self.busB.items('state'), {'settings': {'volume': 60}})
+
+    async def testPublishToOtherWorkers(self) -> None:
+        """Test that messages are delivered, in order, to other workers only."""
+        receivedA: AsyncMock = AsyncMock()
+        receivedB: list[dict[str, Any]] = []
+
+        async def receiveB(message: dict[str, Any]) -> None:
+            receivedB.append(message)
+
+        self.busA.subscribe('broadcast', receivedA)
+        self.busB.subscribe('broadcast', receiveB)
+
+        self.busA.publish('broadcast', {'command': 'playState', 'value': True})
+        self.busA.publish('broadcast', {'command': 'playState', 'value': False})
+        await self.busA.flush()
+        self.assertEqual(await self.busA.receive(), 0)
+        self.assertEqual(await self.busB.receive(), 2)
+        self.assertEqual([message['value'] for message in receivedB], [True, False])
+        receivedA.assert_not_awaited()
+
+        # idle polls are skipped
+        self.assertEqual(await self.busB.receive(), 0)
+
+    async def testClaim(self) -> None:
+        """Test that a resource can only be owned by one (live) worker."""
+        self.assertTrue(self.busA.claim('hardware'))
+        self.assertTrue(self.busA.claim('hardware'))
+        self.assertFalse(self.busB.claim('hardware'))
+
+        await self.busA.stop()
+        self.assertTrue(self.busB.claim('hardware'))
+        self.busA = SQLiteStateBus(os.path.join(self.directory.name, 'stateBus.sqlite3'))
+
+    async def testStateSharedBetweenWorkers(self) -> None:
+        """Test that state changes (and broadcasts) made by one worker reach the clients of another."""
+        handlerA: WebsocketHandler = WebsocketHandler(MagicMock(), AsyncMock(), stateBus=self.busA)
+        handlerB: WebsocketHandler = WebsocketHandler(MagicMock(), AsyncMock(), stateBus=self.busB)
+        handlerB.fanOut = AsyncMock()
+        stateA: StateManager = StateManager(handlerA, None, 'test', self.busA)
+        stateB: StateManager = StateManager(handlerB, MagicMock(), 'test', self.busB)
+        await self.busA.flush()
+        await self.busB.flush()
+
+        await stateA.updateState(StateKeys.PLAY_STATE, True)
+        await self.busA.flush()
+        await self.busB.receive()
+
+        self.assertTrue(stateB.getState()['playState'])
+        stateB.hardwareController.setMotorState.assert_called_with(1)
+        handlerB.fanOut.assert_awaited_once()
+        self.assertEqual(handlerB.fanOut.await_args.args[1]['command'], StateKeys.PLAY_STATE.value)
+
+        # new workers resume the shared state
+        stateC: StateManager = StateManager(MagicMock(), None, 'test', self.busB)
+        self.assertTrue(stateC.getState()['playState'])
+
+    async def testSessionsSharedBetweenWorkers(self) -> None:
+        """Test that a session created by one worker can be resolved by another."""
+        SessionManager(self.busA).createSession('hostSession', True)
+        SessionManager(self.busA).updateSession('hostSession', {'userID': 'user123'})
+        await self.busA.flush()
+
+        context = SessionManager(self.busB).getSessionContext('hostSession')
+        self.assertIsNotNone(context)
+        self.assertTrue(context.isHost)
+        self.assertEqual(SessionManager(self.busB).getHostUserID(), 'user123')
+
+
+if (__name__ == '__main__'):
+    unittest.main()
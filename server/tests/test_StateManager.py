@@ -1,4 +1,5 @@
 """Test suite for the StateManager class."""
+import json
 import unittest
 from typing import Any, Dict
 from unittest.mock import AsyncMock, MagicMock
@@ -56,6 +57,34 @@ class TestStateManager(unittest.IsolatedAsyncioTestCase):
         # resetState doesn't trigger a broadcast
         self.websocketHandler.broadcast.assert_not_called()
 
+    async def testSnapshotCachedPerVersion(self) -> None:
+        """Test that the snapshot is built once per state version."""
+        snapshot: str = self.stateManager.getSnapshot()
+        self.assertIs(self.stateManager.getSnapshot(), snapshot)
+
+        decoded: Dict[str, Any] = json.loads(snapshot)
+        self.assertEqual(decoded['command'], 'snapshot')
+        self.assertEqual(decoded['version'], self.stateManager.version)
+        self.assertFalse(decoded['value']['playState'])
+
+    async def testSnapshotInvalidatedOnUpdate(self) -> None:
+        """Test that mutations bump the version and rebuild the snapshot."""
+        initialVersion: int = self.stateManager.version
+        self.stateManager.getSnapshot()
+
+        await self.stateManager.updateState(StateKeys.PLAY_STATE, True)
+        self.assertEqual(self.stateManager.version, initialVersion + 1)
+        self.assertTrue(json.loads(self.stateManager.getSnapshot())['value']['playState'])
+
+        # non-updates do not invalidate the snapshot
+        snapshot: str = self.stateManager.getSnapshot()
+        await self.stateManager.updateState(StateKeys.PLAY_STATE, True)
+        self.assertIs(self.stateManager.getSnapshot(), snapshot)
+
+        self.stateManager.resetState()
+        self.assertEqual(self.stateManager.version, initialVersion + 2)
+        self.assertFalse(json.loads(self.stateManager.getSnapshot())['value']['playState'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,63 @@
+"""Test suite for the TTLCache class."""
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app.modules.StateBus.localStateBus import LocalStateBus
+from app.modules.ttlCache import TTLCache, cacheKey
+
+
+class TestTTLCache(unittest.TestCase):
+    """Test suite for the TTLCache class."""
+
+    def setUp(self) -> None:
+        """Set up a cache on an in-memory state bus."""
+        self.stateBus: LocalStateBus = LocalStateBus()
+        self.cache: TTLCache = TTLCache(self.stateBus, 'albumIDs', ttl=60)
+
+    @patch('app.modules.ttlCache.time.time')
+    def testExpiry(self, mockTime: MagicMock) -> None:
+        """Test that entries expire after the TTL, and are removed from the bus."""
+        mockTime.return_value = 1000
+        self.cache.set('key', {'id': 'album123'})
+        mockTime.return_value = 1059
+        self.assertEqual(self.cache.get('key'), {'id': 'album123'})
+
+        mockTime.return_value = 1061
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.stateBus.items('albumIDs'), {})
+        self.assertEqual(self.cache.summary(), {'hits': 1, 'misses': 1, 'evictions': 0, 'hitRatio': 0.5})
+
+    @patch('app.modules.ttlCache.time.time')
+    def testSweep(self, mockTime: MagicMock) -> None:
+        """Test that unread expired entries are swept, and the entries expiring soonest removed whilst over the cap."""
+        mockTime.return_value = 1000
+        self.cache.set('expired', 1)
+        mockTime.return_value = 1050
+        for i in range(4):
+            self.cache.set(f'key{i}', i)
+
+        mockTime.return_value = 1070
+        cache: TTLCache = TTLCache(self.stateBus, 'albumIDs', ttl=60, maxEntries=2)
+        self.assertEqual(set(self.stateBus.items('albumIDs')), {'key2', 'key3'})
+        self.assertEqual(cache.summary()['evictions'], 3)
+
+    @patch('app.modules.ttlCache.SWEEP_INTERVAL', 4)
+    def testSweptPeriodically(self) -> None:
+        """Test that the cache is swept as values are cached, so it stays (approximately) within its cap."""
+        cache: TTLCache = TTLCache(self.stateBus, 'releases', ttl=60, maxEntries=3)
+        for i in range(8):
+            cache.set(f'key{i}', i)
+        self.assertEqual(len(self.stateBus.items('releases')), 3)
+        self.assertIsNotNone(cache.get('key7'))
+
+    def testCacheKey(self) -> None:
+        """Test that cache keys do not depend on the order of a manifest entry's fields."""
+        self.assertEqual(
+            cacheKey({'name': 'Album', 'artist': 'Artist'}),
+            cacheKey({'artist': 'Artist', 'name': 'Album'}),
+        )
+        self.assertNotEqual(cacheKey({'name': 'Album'}), cacheKey({'name': 'Album', 'year': '2021'}))
+
+
+if (__name__ == '__main__'):
+    unittest.main()
@@ -0,0 +1,207 @@
+"""Test suite for the WebsocketHandler class."""
+import asyncio
+import unittest
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+
+from app.modules.messageCodec import MessagePackCodec
+from app.modules.messageSchema import PlayMessage, TransportMessage
+from app.modules.rateLimiter import RateLimiter
+from app.modules.sessionManager import SessionContext
+from app.modules.websocketHandler import WebsocketHandler
+
+
+def createFakeWebsocket(messages: list[str | bytes], subprotocols: list[str] | None = None) -> MagicMock:
+    """Create a fake websocket, which yields the given messages before disconnecting."""
+    websocket: MagicMock = MagicMock()
+    websocket.scope = {'subprotocols': subprotocols or []}
+    websocket.client_state = WebSocketState.CONNECTED
+    websocket.accept = AsyncMock()
+    websocket.close = AsyncMock()
+    websocket.send_text = AsyncMock()
+    websocket.send_bytes = AsyncMock()
+    websocket.receive_text = AsyncMock(side_effect=[*messages, WebSocketDisconnect()])
+    websocket.receive_bytes = AsyncMock(side_effect=[*messages, WebSocketDisconnect()])
+    return websocket
+
+
+class TestWebsocketHandler(unittest.IsolatedAsyncioTestCase):
+    """Test suite for the WebsocketHandler class."""
+
+    def setUp(self) -> None:
+        """Set up test dependencies before each test."""
+        self.getSnapshot: MagicMock = MagicMock(return_value='{"command": "snapshot"}')
+        self.handleCommand: AsyncMock = AsyncMock()
+        self.handler: WebsocketHandler = WebsocketHandler(self.getSnapshot, self.handleCommand)
+        self.sideSession: SessionContext = SessionContext(sessionID='side', userID='user', isHost=False)
+
+    async def testSnapshotSentOnConnect(self) -> None:
+        """Test that a single snapshot frame is sent to a newly-connected client."""
+        websocket: MagicMock = createFakeWebsocket([])
+        await self.handler.handleConnection(websocket, self.sideSession)
+
+        websocket.accept.assert_awaited_once_with(subprotocol=None)
+        websocket.send_text.assert_awaited_once_with('{"command": "snapshot"}')
+        self.getSnapshot.assert_called_once()
+
+    async def testCommandsForwarded(self) -> None:
+        """Test that received commands are forwarded to the command handler."""
+        websocket: MagicMock = createFakeWebsocket(['{"command": "playNext"}'])
+        await self.handler.handleConnection(websocket, self.sideSession)
+
+        self.handleCommand.assert_awaited_once_with(self.sideSession, TransportMessage(command='playNext'))
+        self.assertEqual(self.handler.activeSideSockets, [])
+
+    async def testInvalidMessagesIgnored(self) -> None:
+        """Test that malformed or mistyped messages are dropped, without closing the connection."""
+        websocket: MagicMock = createFakeWebsocket([
+            'not json',
+            '{"command": "unknownCommand"}',
+            '{"command": "playAlbum", "value": 123}',
+            '{"command": "playAlbum", "value": "album123"}',
+        ])
+        await self.handler.handleConnection(websocket, self.sideSession)
+
+        self.handleCommand.assert_awaited_once_with(
+            self.sideSession, PlayMessage(command='playAlbum', value='album123')
+        )
+
+    async def testThrottledCommandsDropped(self) -> None:
+        """Test that commands over budget are dropped, and the client notified."""
+        self.handler.rateLimiter = RateLimiter(sideBudgets={'playback': (1, 0)})
+        websocket: MagicMock = createFakeWebsocket(['{"command": "playAlbum", "value": "album123"}'] * 3)
+        await self.handler.handleConnection(websocket, self.sideSession)
+
+        self.handleCommand.assert_awaited_once()
+        # snapshot, then a single throttle notice for the burst
+        self.assertEqual(websocket.send_text.await_count, 2)
+        notice: str = websocket.send_text.await_args_list[1].args[0]
+        self.assertIn('"command":"throttled"', notice)
+        self.assertEqual(self.handler.rateLimiter.throttled, {'playback': 2})
+
+    async def testBroadcast(self) -> None:
+        """Test that broadcasts reach the host and all side clients."""
+        host: MagicMock = createFakeWebsocket([])
+        side: MagicMock = createFakeWebsocket([])
+        self.handler.activeMainSocket = host
+        self.handler.activeSideSockets.append(side)
+
+        data: dict[str, Any] = {'command': 'playState', 'value': True}
+        await self.handler.broadcast(data)
+        host.send_text.assert_awaited_once_with('{"command":"playState","value":true}')
+        side.send_text.assert_awaited_once_with('{"command":"playState","value":true}')
+
+    async def testBinarySubprotocolNegotiated(self) -> None:
+        """Test that clients requesting MessagePack framing are served binary frames."""
+        codec: MessagePackCodec = MessagePackCodec()
+        self.getSnapshot.return_value = b'snapshot'
+        websocket: MagicMock = createFakeWebsocket(
+            [codec.encode({'command': 'playAlbum', 'value': 'album123'})],
+            subprotocols=['vtt.msgpack', 'vtt.json'],
+        )
+        await self.handler.handleConnection(websocket, self.sideSession)
+
+        websocket.accept.assert_awaited_once_with(subprotocol='vtt.msgpack')
+        websocket.send_bytes.assert_awaited_once_with(b'snapshot')
+        self.handleCommand.assert_awaited_once_with(
+            self.sideSession, PlayMessage(command='playAlbum', value='album123')
+        )
+        self.assertEqual(self.handler.codecs, {})
+
+    async def testBroadcastEncodedOncePerFormat(self) -> None:
+        """Test that mixed-format clients each receive the broadcast in their own format."""
+        jsonSide: MagicMock = createFakeWebsocket([])
+        binarySide: MagicMock = createFakeWebsocket([])
+        self.handler.activeSideSockets.extend([jsonSide, binarySide])
+        self.handler.codecs[binarySide] = MessagePackCodec()
+
+        await self.handler.broadcast({'command': 'playState', 'value': True})
+        jsonSide.send_text.assert_awaited_once_with('{"command":"playState","value":true}')
+        binarySide.send_bytes.assert_awaited_once_with(MessagePackCodec().encode({'command': 'playState', 'value': True}))
+
+    async def testPingReapsUnresponsiveClients(self) -> None:
+        """Test that a heartbeat reaps clients which have gone silent, and pings the rest."""
+        self.handler.HEARTBEAT_TIMEOUT = 30
+        alive: MagicMock = createFakeWebsocket([])
+        dead: MagicMock = createFakeWebsocket([])
+        for websocket in [alive, dead]:
+            self.handler.activeSideSockets.append(websocket)
+            self.handler.trackConnection(websocket, 'side')
+        self.handler.lastSeen[dead] -= 60
+
+        result: dict[str, int] = await self.handler.ping()
+        self.assertEqual(result, {'clients': 1, 'reaped': 1})
+        self.assertEqual(self.handler.activeSideSockets, [alive])
+        dead.close.assert_awaited_once_with(code=1001)
+        self.assertIn('"command":"ping"', alive.send_text.await_args.args[0])
+        dead.send_text.assert_not_awaited()
+
+        summary: dict[str, Any] = self.handler.summary()
+        self.assertEqual(summary['reaped'], 1)
+        self.assertEqual(summary['lifetimes']['side']['count'], 1)
+
+    async def testFailedSendReapsClient(self) -> None:
+        """Test that a client which cannot be sent to is dropped from the fan-out list."""
+        broken: MagicMock = createFakeWebsocket([])
+        broken.send_text.side_effect = ConnectionResetError()
+        healthy: MagicMock = createFakeWebsocket([])
+        for websocket in [broken, healthy]:
+            self.handler.activeSideSockets.append(websocket)
+            self.handler.trackConnection(websocket, 'side')
+
+        await self.handler.broadcast({'command': 'playState', 'value': True})
+        healthy.send_text.assert_awaited_once()
+        self.assertEqual(self.handler.activeSideSockets, [healthy])
+        self.assertEqual(self.handler.reaped, 1)
+
+    async def testPongUpdatesLiveness(self) -> None:
+        """Test that pongs are consumed by the handler, and not dispatched as commands."""
+        websocket: MagicMock = createFakeWebsocket(['{"command": "pong", "value": 0}'])
+        await self.handler.handleConnection(websocket, self.sideSession)
+
+        self.handleCommand.assert_not_awaited()
+        self.assertEqual(self.handler.pingTimings.summary()['roundTrip']['count'], 1)
+
+    async def testSessionRevalidated(self) -> None:
+        """Test that each command re-resolves the session, disconnecting connections whose session has ended."""
+        sessions: dict[str, SessionContext] = {'side': self.sideSession}
+        self.handler.resolveSession = sessions.get
+        websocket: MagicMock = createFakeWebsocket(['{"command": "playNext"}', '{"command": "playPrevious"}'])
+
+        async def handleCommand(session: SessionContext, message: Any) -> None:
+            sessions.pop('side')  # (e.g. deleted when a new host logs in)
+        self.handleCommand.side_effect = handleCommand
+        await self.handler.handleConnection(websocket, self.sideSession)
+
+        self.handleCommand.assert_awaited_once()
+        websocket.close.assert_awaited_with(code=4001)
+
+    async def testHostDemotedDisconnected(self) -> None:
+        """Test that a host connection is disconnected once its session is no longer the host's."""
+        hostSession: SessionContext = SessionContext(sessionID='host', userID='user', isHost=True)
+        self.handler.resolveSession = lambda _: SessionContext(sessionID='host', userID='user', isHost=False)
+        websocket: MagicMock = createFakeWebsocket(['{"command": "playNext"}'])
+        await self.handler.handleConnection(websocket, hostSession)
+
+        self.handleCommand.assert_not_awaited()
+        self.assertIsNone(self.handler.activeMainSocket)
+
+    async def testCloseSession(self) -> None:
+        """Test that deleting a session reaps its connections."""
+        (deleted, other) = (createFakeWebsocket([]), createFakeWebsocket([]))
+        for (websocket, sessionID) in [(deleted, 'deleted'), (other, 'other')]:
+            self.handler.activeSideSockets.append(websocket)
+            self.handler.sessionIDs[websocket] = sessionID
+            self.handler.trackConnection(websocket, 'side')
+
+        self.handler.closeSession('deleted')
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.handler.activeSideSockets, [other])
+        deleted.close.assert_awaited_once_with(code=1001)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,12 +5,16 @@ from typing import Any, List
 
 from unittest.mock import patch, MagicMock
 
-from app.utils import getLocalIPs, isHostIP, generateRandomString
+from app.utils import getLocalIPs, isHostIP, generateRandomString, localIPCache
 
 
 class TestUtils(unittest.TestCase):
     """Test suite for utility functions."""
 
+    def setUp(self) -> None:
+        """Clear the cached local IP addresses."""
+        localIPCache.ips = None
+
     def test_generateRandomString_lengthAndChars(self) -> None:
         """Test that generateRandomString returns a string of the correct length and allowed characters."""
         length: int = 12
@@ -33,6 +37,24 @@ class TestUtils(unittest.TestCase):
             self.assertFalse(isHostIP("8.8.8.8"))
             self.assertFalse(isHostIP(None))
 
+    def test_isHostIP_cached(self) -> None:
+        """Test isHostIP only retrieves the local IP addresses once."""
+        with patch("app.utils.getLocalIPs", return_value=["192.168.1.10"]) as mockGetIPs:
+            for _ in range(3):
+                self.assertTrue(isHostIP("192.168.1.10"))
+                self.assertFalse(isHostIP("8.8.8.8"))
+            mockGetIPs.assert_called_once()
+
+    def test_localIPCache_refresh(self) -> None:
+        """Test that refreshing the cache picks up (and reports) changed addresses."""
+        with patch("app.utils.getLocalIPs", return_value=["192.168.1.10"]):
+            self.assertTrue(localIPCache.refresh())
+            self.assertFalse(localIPCache.refresh())
+        with patch("app.utils.getLocalIPs", return_value=["192.168.1.20"]):
+            self.assertTrue(localIPCache.refresh())
+            self.assertFalse(isHostIP("192.168.1.10"))
+            self.assertTrue(isHostIP("192.168.1.20"))
+
     @patch("socket.gethostname", return_value="testhost")
     @patch("socket.gethostbyname_ex", return_value=("testhost", [], ["10.0.0.1"]))
     @patch("socket.getaddrinfo", return_value=[(None, None, None, None, ("fe80::1", 0, 0, 0))])